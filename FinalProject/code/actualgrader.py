@@ -1,277 +1,537 @@
 import os
+import sys
 import json
-from openai import OpenAI
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Dict, List, Tuple
 from collections import defaultdict
 from secrets import OPENAPI_API_KEY as key
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'shared'))
+from llm_client import LLMClient
+from rate_limit import TokenRateLimiter
+from batching import count_tokens, pack_batches
+from grade_parser import GRADES_RESPONSE_FORMAT, parse_grades
+from pregrader import PreGrader, ai_usage_deduction
+from grading_document import GradingDocument
+from checkpoint import CheckpointJournal, prompt_hash
+from corpus_store import CorpusStore
+
+# Identical bytes on every grading call, so it forms the cacheable prompt prefix.
+# Nothing student- or citation-specific may go in here.
+GRADER_SYSTEM_PROMPT = """You are a strict but fair academic grader. Follow the rubric precisely and verify citations against the actual source material.
+
+GRADING RUBRIC:
+- 0 points: No text entered for answer (answer couldn't be found)
+- 2 points: Factually incorrect
+- 3 points: Overall idea is correct, but citation is wrong or misused
+- 4 points: Answer is only 1-2 sentences
+- 5 points: Answer is 3+ sentences
+This is for each part of the question. Then the question as a whole can have these deductions:
+- -1 point: Explained AI usage but didn't provide exact prompt explanation
+- -2 points: Only stated they used AI without explaining how, OR didn't state whether they used AI
+
+IMPORTANT: Start with the base points (0-25), then apply AI usage penalties at the end for the overall question (becomes 23-24 instead of 25).
+
+The user message gives the citation source content followed by the responses to grade. Grade each response. For EACH response, verify:
+That the citation is from the linked work and that it mostly lines up with the content cited in that chapter/work.
+If a citation is for mythical man month (MMM) make sure it's not just a chapter title. It needs to have a subheading, page number or direct quote.
+If a response doesn't have a citation or doesn't follow what I've outlined, flag it with an incorrect citation (3 points as outlined below)
+If the overall question responses don't have a specific explanation of how they used AI -1 points from the overall question score
+If a response is only 1-2 sentences then it should only get 4 points.
+
+Return your grades as JSON with exactly one entry per response, using the number from its RESPONSE #id:
+{"grades": [{"id": 1, "points": [points], "justification": "[a very concise and short (5-7 word) justification including: base score and one of these reasons: 5: full points; 4: if only 1-2 sentences; 3: citation isn't specific; 2: inappropriate answer or irrelevant citation; and 0: answer missing]"}, {"id": 2, ...}, ...]}
+
+Be strict but fair. Verify citations match the actual source material content. Don't use any dashes (including m dashes)"""
+
+
+# With a PreGrader, the question-level AI usage deduction is decided locally wherever the
+# statement is clear-cut, and those responses are sent without their AI Usage Statement.
+# The model only applies the AI rules to the ones it still sees a statement for, so a
+# deduction is never taken twice.
+PREGRADED_SYSTEM_PROMPT = GRADER_SYSTEM_PROMPT.replace(
+    "Then the question as a whole can have these deductions:",
+    "Then the question as a whole can have these deductions, but ONLY for responses that include an "
+    "AI Usage Statement (AI usage for the others has already been graded, so never deduct for it):"
+).replace(
+    "If the overall question responses don't have",
+    "If a response includes an AI Usage Statement and the overall question responses don't have"
+)
+# The exam questions, keyed like the "Question N" fields in the student JSON
+QUESTION_PROMPTS = {
+    "Question 1": """Your team is developing a healthcare mobile app for a hospital network that handles patient data, appointment scheduling, and telemedicine features. The project began with well-defined requirements, but midway through, a new regulatory change (e.g., updated HIPAA compliance rules) requires integrating advanced encryption and audit logging. Simultaneously, the client insists on adding AI-driven symptom checkers using third-party APIs, while the team's senior developer leaves unexpectedly, forcing juniors to take on complex tasks. The deadline remains fixed, and budget constraints prevent hiring replacements quickly, leading to improvised code reviews via asynchronous tools.
+
+Identify five risks and/or mitigations for potential risks/problems (numbered #1 through #5), each with explanations and citations. Then, state AI usage.""",
+    "Question 2": """A global fintech company is overhauling its legacy banking software to a microservices architecture in the cloud. The 15-person team is distributed across five time zones, including regions with varying internet reliability, and relies on a mix of Slack, Jira, and video calls for coordination. No formal project manager is assigned; instead, a "flat" structure encourages self-organization, but cultural differences lead to miscommunications about priorities. Early on, the team discovers incompatible data formats from the old system, requiring custom migration scripts, while stakeholders push for blockchain integration without clear ROI analysis.
+
+Identify five risks and/or mitigations for potential risks/problems (each numbered #1 through #5), with explanations and citations. Then, state AI usage.""",
+    "Question 3": """You're managing a project for an e-commerce platform upgrade that includes real-time inventory tracking, personalized recommendations via machine learning, and integration with multiple payment gateways. Initial estimates were optimistic at 8 months, but after 4 months, user testing reveals overlooked accessibility issues for diverse user groups (e.g., international locales and disabilities). To accelerate, the team adds three new contractors mid-project, who bring expertise but unfamiliar tools, while the original team resists changes to their established workflows. External market pressures, like a competitor's launch, tempt cutting QA cycles.
+
+Identify five risks and/or mitigations for potential risks/problems (each numbered #1 through #5), with explanations and citations. Then, state AI usage.""",
+    "Question 4": """On a defense-contracted software project for simulation tools, the team of 8 experts excels in algorithms but struggles with interpersonal conflicts, including debates over modular vs. monolithic designs amplified by remote work setups. The workspace is a hybrid model with some in a noisy co-working space and others at home, leading to inconsistent participation in stand-ups. Security requirements demand frequent code audits, but tool incompatibilities cause delays, and a key stakeholder from the client side provides contradictory feedback loops without documented rationale.
+
+Identify five risks and/or mitigations for potential risks/problems (numbered #1 through #5), with explanations and citations. Then, state AI usage.""",
+    "Question 5": """A venture-backed startup is creating an AI-powered educational platform with adaptive learning paths, gamification, and natural language processing for content generation. Requirements started vague ("engaging for K-12 students"), evolving into demands for multi-language support and data privacy features amid shifting investor priorities. The lead engineer advocates for unproven open-source frameworks to innovate, deferring prototyping, while the small team (including interns) works in silos without integrated testing environments. Budget overruns from cloud costs prompt skipping formal retrospectives.
+
+Identify five risks and/or mitigations for potential risks/problems (each numbered #1 through #5), with explanations and citations. Then, state AI usage."""
+    # Add more as needed
+}
+
 
 class CitationGrader:
-    def __init__(self, books_directory, api_key=None):
+    def __init__(self, books_directory, api_key=None, base_url=None, passage_index=None, pregrader=None,
+                 corpus=None):
         """
         Initialize the grader.
         
         Args:
             books_directory: Path to the Books folder containing all sources
             api_key: OpenAI API key (if None, uses OPENAI_API_KEY env var)
+            base_url: Alternate OpenAI-compatible endpoint, e.g. a local stub server for testing
+            passage_index: Optional PassageIndex; when set, only the passages most similar
+                to each batch's responses are sent instead of the first 4000 chars
+            pregrader: Optional PreGrader; when set, responses the mechanical rubric rules
+                decide (empty, 1-2 sentences) and the AI usage deductions are graded locally
+            corpus: CorpusStore of the Books folder (opened here if not given)
         """
         self.books_directory = books_directory
-        self.client = OpenAI(api_key=api_key)
-        self.citation_cache = {}  # Cache loaded citation files
+        self.corpus = corpus if corpus is not None else CorpusStore(books_directory)
+        self.passage_index = passage_index
+        self.pregrader = pregrader
+        self.client = LLMClient(api_key=api_key, base_url=base_url)
+        # Output is sized to the batch: one {"id", "points", "justification"} object per response
+        # in the JSON reply (a 5-7 word justification plus keys and punctuation)
+        self.output_tokens_per_response = 80
+        self.max_output_tokens = 4000
+        # JSON-schema output keyed by response id; turn off for endpoints without structured outputs
+        self.structured_output = True
+        self.usage = {'calls': 0, 'prompt_tokens': 0, 'cached_prompt_tokens': 0, 'completion_tokens': 0}
+        self.usage_lock = threading.Lock()
         
     def load_citation_file(self, citation_path):
-        """Load and cache citation file content."""
+        """Citation file content, sliced out of the memory-mapped corpus."""
         if not citation_path or citation_path == "NOT_FOUND":
             return None
-            
-        # Check cache first
-        if citation_path in self.citation_cache:
-            return self.citation_cache[citation_path]
         
-        # Load file
-        full_path = os.path.join(self.books_directory, citation_path)
-        try:
-            with open(full_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-                self.citation_cache[citation_path] = content
-                return content
-        except FileNotFoundError:
-            print(f"Warning: Citation file not found: {full_path}")
-            return None
+        content = self.corpus.text(citation_path)
+        if content is None:
+            print(f"Warning: Citation file not found: {os.path.join(self.books_directory, citation_path)}")
+        return content
     
     def group_responses_by_citation(self, data, question_prompts):
         """
         Group responses by citation file for efficient batch processing.
+
+        Args:
+            data: The JSON data or a GradingDocument
+            question_prompts: Dict mapping question keys to prompt text
         
         Returns:
             Dict[citation_file] -> List[(student_name, question_num, risk_num, response_text, ai_usage)]
         """
         grouped = defaultdict(list)
         
-        for student_data in data.get('Students', []):
-            student_name = student_data.get('Student', 'Unknown')
-            
-            for key, value in student_data.items():
-                if key.startswith('Question ') and isinstance(value, dict):
-                    question_num = key.split(' ')[1]
-                    question_prompt = question_prompts.get(key, "")
-                    
-                    for field_name, field_value in value.items():
-                        if field_name.startswith('Risk/mitigation ') and not field_name.endswith((' citation', ' grade')):
-                            # Extract risk number
-                            risk_num = field_name.split(' ')[1]
-                            
-                            # Get corresponding citation
-                            citation_key = f"{field_name} citation"
-                            citation_file = value.get(citation_key)
-                            
-                            # Get AI usage
-                            ai_usage = value.get('AI usage', '')
-                            
-                            # Group by citation file
-                            grouped[citation_file].append({
-                                'student': student_name,
-                                'question_num': question_num,
-                                'question_prompt': question_prompt,
-                                'risk_num': risk_num,
-                                'response': field_value,
-                                'ai_usage': ai_usage,
-                                'field_name': field_name
-                            })
+        for record in GradingDocument.wrap(data):
+            question_prompt = question_prompts.get(record.question_key, "")
+            # The pre-grader decides clear-cut AI usage deductions itself (see PREGRADED_SYSTEM_PROMPT)
+            ai_usage_graded = self.pregrader is not None and ai_usage_deduction(record.ai_usage) is not None
+            # Group by citation file
+            grouped[record.citation].append({
+                'student': record.student,
+                'question_num': record.question_num,
+                'question_prompt': question_prompt,
+                'risk_num': record.risk_num,
+                'response': record.text,
+                'ai_usage': record.ai_usage,
+                'field_name': record.field_name,
+                'key': record.key,
+                # Changes whenever anything that feeds this response's grading prompt changes
+                'hash': prompt_hash(record.citation, question_prompt, record.text, record.ai_usage,
+                                    *(['ai usage graded'] if ai_usage_graded else [])),
+                'ai_usage_graded': ai_usage_graded,
+            })
         
         return grouped
     
-    def grade_batch(self, citation_file, responses, citation_content):
-        """
-        Grade a batch of responses that all cite the same file.
-        
-        Args:
-            citation_file: The citation file path
-            responses: List of response dicts
-            citation_content: The content of the citation file
-            
-        Returns:
-            List[str]: Grades in same order as responses
+    def build_batch_messages(self, citation_file, responses, citation_content):
         """
-        # Build the prompt with all responses
-        rubric = """GRADING RUBRIC:
-		- 0 points: No text entered for answer (answer couldn't be found)
-		- 2 points: Factually incorrect
-		- 3 points: Overall idea is correct, but citation is wrong or misused
-		- 4 points: Answer is only 1-2 sentences
-		- 5 points: Answer is 3+ sentences
-        This is for each part of the question. Then the question as a whole can have these deductions:
-		- -1 point: Explained AI usage but didn't provide exact prompt explanation
-		- -2 points: Only stated they used AI without explaining how, OR didn't state whether they used AI
-
-		IMPORTANT: Start with the base points (0-25), then apply AI usage penalties at the end for the overall question (becomes 23-24 instead of 25)."""
+        Build the chat messages for one batch of responses that cite the same file.
 
+        Everything that is the same for every batch (role, rubric, instructions, output
+        format) is in the system message, followed by the citation source, which is the
+        same for every batch in a citation group. The student responses come last, so
+        consecutive calls share a byte-identical prefix the provider can cache.
+
+        With a passage index, the citation source is cut down to the passages closest to
+        this batch's responses rather than the start of the file. Those differ per batch,
+        so only the system message stays cached.
+        """
         # Create citation context
-        citation_context = ""
-        if citation_content:
-            citation_context = f"""
-		CITATION SOURCE CONTENT:
-		File: {citation_file}
-		---
-		{citation_content[:4000]}  # Limit to ~4000 chars to manage token usage
-		---
-		"""
+        passages = []
+        if citation_content and self.passage_index is not None:
+            passages = self.passage_index.top_passages(citation_file, [r['response'] for r in responses])
+        
+        if passages:
+            passage_text = "\n...\n".join(passages)
+            citation_context = f"""CITATION SOURCE CONTENT (passages most relevant to these responses):
+File: {citation_file}
+---
+{passage_text}
+---"""
+        elif citation_content:
+            # Limit to ~4000 chars to manage token usage
+            citation_context = f"""CITATION SOURCE CONTENT:
+File: {citation_file}
+---
+{citation_content[:4000]}
+---"""
         else:
-            citation_context = f"\nCITATION SOURCE: {citation_file} (FILE NOT FOUND - students citing this have incorrect citations)\n"
+            citation_context = f"CITATION SOURCE: {citation_file} (FILE NOT FOUND - students citing this have incorrect citations)"
         
         # Build responses section
-        responses_text = ""
-        for idx, resp in enumerate(responses, 1):
-            responses_text += f"""
-				RESPONSE #{idx}:
-				Student: {resp['student']}
-				Question {resp['question_num']}: {resp['question_prompt']}
-				Risk/Mitigation {resp['risk_num']}: {resp['response']}
-				AI Usage Statement: {resp['ai_usage']}
-				---
-				"""
+        responses_text = "".join(self._format_response(idx, resp) for idx, resp in enumerate(responses, 1))
         
-        prompt = f"""{rubric}
+        return [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": f"{citation_context}\n\nRESPONSES TO GRADE:\n{responses_text}"}
+        ]
 
-{citation_context}
+    @property
+    def system_prompt(self):
+        """The rubric prompt; without the AI usage rules for responses the pre-grader already decided."""
+        return PREGRADED_SYSTEM_PROMPT if self.pregrader is not None else GRADER_SYSTEM_PROMPT
 
-Grade each of the following responses. For EACH response, verify:
-That the citation is from the linked work and that it mostly lines up with the content cited in that chapter/work.
-If a citation is for mythical man month (MMM) make sure it's not just a chapter title. It needs to have a subheading, page number or direct quote. 
-If a response doesn't have a citation or doesn't follow what I've outlined, flag it with an incorrect citation (3 points as outlined below)
-If the overall question responses don't have a specific explanation of how they used AI -1 points from the overall question score
-If a response is only 1-2 sentences then it should only get 4 points. 
+    def _format_response(self, idx, resp):
+        ai_usage = "" if resp.get('ai_usage_graded') else f"AI Usage Statement: {resp['ai_usage']}\n"
+        return f"""
+RESPONSE #{idx}:
+Student: {resp['student']}
+Question {resp['question_num']}: {resp['question_prompt']}
+Risk/Mitigation {resp['risk_num']}: {resp['response']}
+{ai_usage}---
+"""
 
-{responses_text}
+    def output_budget(self, num_responses):
+        """max_tokens for a batch: enough for every grade object, never more than the cap."""
+        return min(self.max_output_tokens, 50 + num_responses * self.output_tokens_per_response)
 
-Return your grades in this EXACT format for each response:
-RESPONSE #1: [points]|[a very concise and short (5-7 word) justification including: base score and one of these reasons: 5: full points; 4: if only 1-2 sentences; 3: citation isn't specific; 2: inappropriate answer or irrelevant citation; and 0: answer missing]
-RESPONSE #2: [points]|[justification]
-...
+    def _record_usage(self, usage):
+        """Add one completion's token usage (including provider-cached prompt tokens) to the totals."""
+        if usage is None:
+            return
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cached = getattr(details, 'cached_tokens', 0) or 0
+        with self.usage_lock:
+            self.usage['calls'] += 1
+            self.usage['prompt_tokens'] += usage.prompt_tokens or 0
+            self.usage['cached_prompt_tokens'] += cached
+            self.usage['completion_tokens'] += usage.completion_tokens or 0
 
-Be strict but fair. Verify citations match the actual source material content. Don't use any dashes (including m dashes)"""
+    def usage_report(self):
+        usage = self.usage
+        cached_share = usage['cached_prompt_tokens'] / usage['prompt_tokens'] if usage['prompt_tokens'] else 0
+        return (f"API calls: {usage['calls']}, prompt tokens: {usage['prompt_tokens']} "
+                f"({usage['cached_prompt_tokens']} cached, {cached_share:.0%}), "
+                f"completion tokens: {usage['completion_tokens']}")
+
+    def grade_batch(self, citation_file, responses, citation_content, messages=None):
+        """
+        Grade a batch of responses that all cite the same file.
+        
+        Args:
+            citation_file: The citation file path
+            responses: List of response dicts
+            citation_content: The content of the citation file
+            messages: Prebuilt messages from build_batch_messages (built here if None)
+            
+        Returns:
+            List[str]: Grades in same order as responses, None where the reply had no
+            usable grade for that response id
+        """
+        if messages is None:
+            messages = self.build_batch_messages(citation_file, responses, citation_content)
 
         try:
-            completion = self.client.chat.completions.create(
+            request = dict(
                 model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "You are a strict but fair academic grader. Follow the rubric precisely and verify citations against the actual source material."},
-                    {"role": "user", "content": prompt}
-                ],
+                messages=messages,
                 temperature=0.3,  # Slightly higher for nuanced grading
-                max_tokens=2000
+                max_tokens=self.output_budget(len(responses))
             )
+            if self.structured_output:
+                request['response_format'] = GRADES_RESPONSE_FORMAT
+            completion = self.client.chat.completions.create(call_site='grade_batch', **request)
+            self._record_usage(completion.usage)
             
-            response_text = completion.choices[0].message.content.strip()
-            
-            # Parse the grades
-            grades = []
-            lines = response_text.split('\n')
-            for line in lines:
-                if line.startswith('RESPONSE #'):
-                    # Extract grade in format "RESPONSE #X: points|justification"
-                    try:
-                        parts = line.split(':', 1)[1].strip()
-                        grades.append(parts)
-                    except:
-                        grades.append("ERROR|Could not parse grade")
+            response_text = completion.choices[0].message.content or ''
             
-            return grades
+            # Grades are matched to responses by id, never by position
+            by_id = parse_grades(response_text, len(responses))
+            return [by_id.get(idx) for idx in range(1, len(responses) + 1)]
             
         except Exception as e:
             print(f"Error grading batch: {e}")
             return [f"ERROR|Grading failed: {str(e)}"] * len(responses)
     
-    def grade_all_responses(self, input_json_path, question_prompts, output_json_path=None, batch_size=10):
+    def _batch_failed(self, batch, grades):
+        """A batch needs another try if the call itself errored."""
+        return any(g is not None and g.startswith('ERROR|') for g in grades)
+
+    def _grade_job(self, citation_file, batch, citation_content, limiter, delay=0):
+        """Wait out any retry backoff and the token budget, then grade one batch (runs on a worker thread)."""
+        time.sleep(delay)
+        messages = self.build_batch_messages(citation_file, batch, citation_content)
+        limiter.acquire(sum(count_tokens(m['content']) for m in messages) + self.output_budget(len(batch)))
+        return self.grade_batch(citation_file, batch, citation_content, messages)
+
+    def _apply_grades(self, doc, batch, grades):
+        """Write a batch's grades into the document by key. Returns how many were written."""
+        written = 0
+        for resp, grade in zip(batch, grades):
+            if doc.set_grade(resp['key'], grade):
+                written += 1
+        return written
+
+    def _apply_ai_usage_deductions(self, doc):
+        """
+        Store the question-level AI usage deduction as 'AI usage grade' wherever it's clear-cut.
+
+        Returns:
+            List of ((student index, question_key, 'AI usage'), grade) for the grade store
+        """
+        entries = []
+        seen = set()
+        for record in doc:
+            if id(record.question) in seen:
+                continue
+            seen.add(id(record.question))
+            deduction = ai_usage_deduction(record.ai_usage)
+            if deduction is not None:
+                points, justification = deduction
+                record.question['AI usage grade'] = f"{points}|{justification}"
+                entries.append(((record.student_idx, record.question_key, 'AI usage'),
+                                record.question['AI usage grade']))
+        return entries
+
+    def _pack_group(self, responses, citation_content, max_input_tokens, batch_size):
+        """Split one citation group into batches that fit the input token budget."""
+        fixed_tokens = count_tokens(self.system_prompt) + count_tokens((citation_content or '')[:4000]) + 100
+        budget = max(max_input_tokens - fixed_tokens, 1)
+        item_tokens = [count_tokens(self._format_response(len(responses), resp)) for resp in responses]
+        return pack_batches(responses, item_tokens, budget, batch_size)
+
+    def grade_all_responses(self, input_json_path, question_prompts, output_json_path=None, batch_size=25,
+                            max_workers=4, tokens_per_minute=None, max_retries=2,
+                            checkpoint_path=None, resume=True, max_input_tokens=8000, store=None, term=''):
         """
         Grade all responses in the JSON file.
+
+        Every batch from every citation group is dispatched at once to a thread pool,
+        so a class takes about as long as the slowest few batches instead of the sum.
+        Batches are packed by token count, so short answers share a call and long ones
+        don't overflow it. Grades come back keyed by response id; whatever parses is
+        kept and only the responses left without a grade are requested again.
         
         Args:
-            input_json_path: Path to JSON with responses and citations
+            input_json_path: Path to JSON with responses and citations (None = read them from the store)
             question_prompts: Dict mapping question keys to prompt text
-            output_json_path: Where to save output (None = overwrite input)
+            output_json_path: Where to save output (None = overwrite input, or no JSON when a store is given)
             batch_size: Max responses to grade per API call
+            max_input_tokens: Prompt token budget per call (system prompt + citation + responses)
+            max_workers: Max batches being graded at the same time
+            tokens_per_minute: Token budget shared by all workers (None = no limit)
+            max_retries: Extra attempts for a batch that fails or can't be parsed
+            checkpoint_path: JSONL journal that every finished batch is appended to
+            resume: Reuse grades already in the journal instead of paying for them again
+            store: Optional GradeStore; every batch's grades are upserted in one transaction
+            term: Term the students are stored under
         """
-        # Load data
-        with open(input_json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        # Load data and index it by (student, question, field)
+        if input_json_path is None:
+            doc = GradingDocument(store.export_json(term=term))
+        else:
+            doc = GradingDocument.load(input_json_path)
+        run_id = None
+        if store is not None:
+            run_id = store.start_run('grade', input_json_path, term)
+            store.import_json(doc, term)
         
         # Group responses by citation
         print("Grouping responses by citation file...")
-        grouped = self.group_responses_by_citation(data, question_prompts)
+        grouped = self.group_responses_by_citation(doc, question_prompts)
         
         print(f"\nFound {len(grouped)} unique citation files")
         print(f"Total responses to grade: {sum(len(resps) for resps in grouped.values())}\n")
         
-        # Process each citation group
-        total_graded = 0
+        # Anything already in the journal (same student/question/field and prompt) is done
+        journal = CheckpointJournal(checkpoint_path, resume=resume) if checkpoint_path else None
+        resumed = 0
+        local_grades = []  # resumed and pre-graded, for the store
+        if journal is not None:
+            for citation_file, responses in list(grouped.items()):
+                remaining = []
+                for resp in responses:
+                    grade = journal.get(resp['key'], resp['hash'])
+                    if grade is not None and doc.set_grade(resp['key'], grade):
+                        resumed += 1
+                        local_grades.append((resp['key'], grade))
+                    else:
+                        remaining.append(resp)
+                grouped[citation_file] = remaining
+            print(f"Resumed {resumed} grades from {checkpoint_path}")
+        
+        # Mechanical rubric rules are applied locally; only responses that need judgement reach the LLM
+        unfiltered = {}
+        pregraded = 0
+        if self.pregrader is not None:
+            for citation_file, responses in list(grouped.items()):
+                unfiltered[citation_file] = responses
+                remaining = []
+                for resp in responses:
+                    grade = self.pregrader.grade(resp['response'])
+                    if grade is not None and doc.set_grade(resp['key'], grade):
+                        pregraded += 1
+                        local_grades.append((resp['key'], grade))
+                    else:
+                        remaining.append(resp)
+                grouped[citation_file] = remaining
+            local_grades.extend(self._apply_ai_usage_deductions(doc))
+        if store is not None:
+            store.upsert_grades(local_grades, run_id, term)
+        
+        # Split every citation group into token-packed batches up front
+        jobs = []
+        avoided_calls = 0
         for citation_file, responses in grouped.items():
-            print(f"\nProcessing citation: {citation_file or 'NO_CITATION'}")
-            print(f"  Responses using this citation: {len(responses)}")
-            
-            # Load citation content once
+            # Load citation content once per group
             citation_content = self.load_citation_file(citation_file)
-            
-            # Process in batches
-            for i in range(0, len(responses), batch_size):
-                batch = responses[i:i+batch_size]
-                print(f"  Grading batch {i//batch_size + 1} ({len(batch)} responses)...", end=' ')
+            if citation_file in unfiltered:
+                # Batches this group would have needed without the pre-grader
+                avoided_calls += len(self._pack_group(unfiltered[citation_file], citation_content,
+                                                      max_input_tokens, batch_size))
+            if not responses:
+                continue
+            for batch in self._pack_group(responses, citation_content, max_input_tokens, batch_size):
+                jobs.append((citation_file, batch, citation_content))
+                if citation_file in unfiltered:
+                    avoided_calls -= 1
+        
+        total_responses = sum(len(batch) for _, batch, _ in jobs)
+        print(f"Dispatching {len(jobs)} batches ({total_responses} responses) with {max_workers} workers...")
+        limiter = TokenRateLimiter(tokens_per_minute)
+        start = time.perf_counter()
+        calls_before = self.usage['calls']
+        total_graded = 0
+        failed_batches = 0
+        retried_batches = 0
+        rerequested = 0
+        parse_failures = 0
+        total_jobs = len(jobs)
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = {
+                executor.submit(self._grade_job, citation_file, batch, content, limiter): (citation_file, batch, content, 0)
+                for citation_file, batch, content in jobs
+            }
+            completed = 0
+            while pending:
+                future = next(as_completed(pending))
+                citation_file, batch, content, attempt = pending.pop(future)
+                try:
+                    grades = future.result()
+                except Exception as e:
+                    # Building the prompt, retrieval or the rate limiter failed: same as a failed call
+                    grades = [f"ERROR|Grading failed: {e}"] * len(batch)
                 
-                grades = self.grade_batch(citation_file, batch, citation_content)
+                # A failed call is retried whole, with backoff
+                if self._batch_failed(batch, grades) and attempt < max_retries:
+                    retried_batches += 1
+                    retry = executor.submit(self._grade_job, citation_file, batch, content, limiter, 2 ** attempt)
+                    pending[retry] = (citation_file, batch, content, attempt + 1)
+                    continue
+                if self._batch_failed(batch, grades):
+                    failed_batches += 1
                 
-                # Apply grades back to original data
-                for resp, grade in zip(batch, grades):
-                    # Find the student and question in original data
-                    for student_data in data['Students']:
-                        if student_data['Student'] == resp['student']:
-                            question_key = f"Question {resp['question_num']}"
-                            if question_key in student_data:
-                                grade_key = f"{resp['field_name']} grade"
-                                student_data[question_key][grade_key] = grade
-                                total_graded += 1
-                                break
+                # Keep every grade that parsed; only the ids missing from the reply are asked for again.
+                # Salvaging something doesn't use up an attempt, since the next request is smaller.
+                missing = [resp for resp, grade in zip(batch, grades) if grade is None]
+                if missing:
+                    parse_failures += 1
+                    next_attempt = attempt + 1 if len(missing) == len(batch) else attempt
+                    if next_attempt <= max_retries:
+                        rerequested += len(missing)
+                        total_jobs += 1
+                        retry = executor.submit(self._grade_job, citation_file, missing, content, limiter)
+                        pending[retry] = (citation_file, missing, content, next_attempt)
+                        kept = [(resp, grade) for resp, grade in zip(batch, grades) if grade is not None]
+                        batch = [resp for resp, _ in kept]
+                        grades = [grade for _, grade in kept]
+                    else:
+                        failed_batches += 1
+                        grades = [grade or "ERROR|Could not parse grade" for grade in grades]
                 
-                print("✓")
+                # Apply grades back to original data as each batch finishes
+                total_graded += self._apply_grades(doc, batch, grades)
+                if journal is not None:
+                    # Errored grades stay out of the journal so a resumed run retries them
+                    journal.record([(resp['key'], resp['hash'], grade) for resp, grade in zip(batch, grades)
+                                    if not grade.startswith('ERROR|')])
+                if store is not None:
+                    store.upsert_grades([(resp['key'], grade) for resp, grade in zip(batch, grades)], run_id, term)
+                completed += 1
+                elapsed = time.perf_counter() - start
+                print(f"  Batch {completed}/{total_jobs} done ({citation_file or 'NO_CITATION'}, "
+                      f"{len(batch)} responses, {elapsed:.1f}s elapsed)")
+        
+        if journal is not None:
+            journal.close()
         
         # Save results
-        output_path = output_json_path or input_json_path
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        output_path = output_json_path or (input_json_path if store is None else None)
+        if output_path:
+            doc.save(output_path)
+        if store is not None:
+            store.finish_run(run_id)
         
+        elapsed = time.perf_counter() - start
         print(f"\n{'='*60}")
         print(f"Grading complete!")
-        print(f"Total responses graded: {total_graded}")
-        print(f"Output saved to: {output_path}")
+        print(f"Total responses graded: {total_graded} (+{resumed} resumed from checkpoint, +{pregraded} pre-graded locally)")
+        print(f"Batches: {total_jobs} ({retried_batches} retries, {rerequested} missing grades re-requested, "
+              f"{failed_batches} still failed)")
+        if self.pregrader is not None:
+            print(f"{self.pregrader.report()} (~{avoided_calls} API calls avoided)")
+        calls = self.usage['calls'] - calls_before
+        if calls:
+            print(f"API calls this class: {calls} ({total_responses / calls:.1f} responses/call), "
+                  f"parse failures: {parse_failures} ({parse_failures / calls:.1%})")
+        print(f"Elapsed: {elapsed:.1f}s")
+        print(self.usage_report())
+        print(self.client.report())
+        if output_path:
+            print(f"Output saved to: {output_path}")
+        if store is not None:
+            print(f"Grades stored in: {store.db_path} (run {run_id})")
         print(f"{'='*60}")
         
-        return data
+        return doc.data
 
 
 # Example usage
 if __name__ == "__main__":
-    # Define your question prompts
-    question_prompts = {
-        "Question 1": """Your team is developing a healthcare mobile app for a hospital network that handles patient data, appointment scheduling, and telemedicine features. The project began with well-defined requirements, but midway through, a new regulatory change (e.g., updated HIPAA compliance rules) requires integrating advanced encryption and audit logging. Simultaneously, the client insists on adding AI-driven symptom checkers using third-party APIs, while the team's senior developer leaves unexpectedly, forcing juniors to take on complex tasks. The deadline remains fixed, and budget constraints prevent hiring replacements quickly, leading to improvised code reviews via asynchronous tools.
-
-Identify five risks and/or mitigations for potential risks/problems (numbered #1 through #5), each with explanations and citations. Then, state AI usage.""",
-        "Question 2": """A global fintech company is overhauling its legacy banking software to a microservices architecture in the cloud. The 15-person team is distributed across five time zones, including regions with varying internet reliability, and relies on a mix of Slack, Jira, and video calls for coordination. No formal project manager is assigned; instead, a "flat" structure encourages self-organization, but cultural differences lead to miscommunications about priorities. Early on, the team discovers incompatible data formats from the old system, requiring custom migration scripts, while stakeholders push for blockchain integration without clear ROI analysis.
+    # numpy/pandas/sentence-transformers are only needed for the passage index
+    from passage_index import PassageIndex
 
-Identify five risks and/or mitigations for potential risks/problems (each numbered #1 through #5), with explanations and citations. Then, state AI usage.""",
-		"Question 3": """You're managing a project for an e-commerce platform upgrade that includes real-time inventory tracking, personalized recommendations via machine learning, and integration with multiple payment gateways. Initial estimates were optimistic at 8 months, but after 4 months, user testing reveals overlooked accessibility issues for diverse user groups (e.g., international locales and disabilities). To accelerate, the team adds three new contractors mid-project, who bring expertise but unfamiliar tools, while the original team resists changes to their established workflows. External market pressures, like a competitor's launch, tempt cutting QA cycles.
-
-Identify five risks and/or mitigations for potential risks/problems (each numbered #1 through #5), with explanations and citations. Then, state AI usage.""",
-		"Question 4": """On a defense-contracted software project for simulation tools, the team of 8 experts excels in algorithms but struggles with interpersonal conflicts, including debates over modular vs. monolithic designs amplified by remote work setups. The workspace is a hybrid model with some in a noisy co-working space and others at home, leading to inconsistent participation in stand-ups. Security requirements demand frequent code audits, but tool incompatibilities cause delays, and a key stakeholder from the client side provides contradictory feedback loops without documented rationale.
-
-Identify five risks and/or mitigations for potential risks/problems (numbered #1 through #5), with explanations and citations. Then, state AI usage.""",
-		"Question 5": """A venture-backed startup is creating an AI-powered educational platform with adaptive learning paths, gamification, and natural language processing for content generation. Requirements started vague ("engaging for K-12 students"), evolving into demands for multi-language support and data privacy features amid shifting investor priorities. The lead engineer advocates for unproven open-source frameworks to innovate, deferring prototyping, while the small team (including interns) works in silos without integrated testing environments. Budget overruns from cloud costs prompt skipping formal retrospectives.
-
-Identify five risks and/or mitigations for potential risks/problems (each numbered #1 through #5), with explanations and citations. Then, state AI usage."""
-        # Add more as needed
-    }
+    question_prompts = QUESTION_PROMPTS
     
-    # Initialize grader
+    # Initialize grader, checking citations against the most relevant passages
+    # (run process_and_embed.py first to create the embeddings/course_readings store)
     grader = CitationGrader(
         books_directory="Books",
-        api_key=key
+        api_key=key,
+        passage_index=PassageIndex("embeddings/course_readings.csv"),
+        pregrader=PreGrader()
     )
     
     # Grade all responses
@@ -279,9 +539,16 @@ Identify five risks and/or mitigations for potential risks/problems (each number
         input_json_path="responses_with_citations_short.json",
         question_prompts=question_prompts,
         output_json_path="responses_graded.json",
-        batch_size=10  # Adjust based on token limits
+        batch_size=25,  # Max per call; batches are also packed to max_input_tokens
+        max_workers=4,  # Batches graded at the same time
+        tokens_per_minute=200000,  # Stay under the account's gpt-4o-mini TPM limit
+        checkpoint_path="grading_checkpoint.jsonl"  # Rerun after a crash to pick up where it stopped
     )
     
+    # Or keep grades in the SQLite store instead of rewriting the whole JSON
+    # from grade_store import GradeStore
+    # grader.grade_all_responses(None, question_prompts, store=GradeStore("grades.db"), term="Fall 2025")
+    
     # Output will look like:
     # "Risk/mitigation 1": "...",
     # "Risk/mitigation 1 citation": "Mythical-man-month/Chapter-4.txt",
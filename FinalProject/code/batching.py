@@ -0,0 +1,42 @@
+from rate_limit import estimate_tokens
+
+try:
+    import tiktoken
+    # gpt-4o / gpt-4o-mini tokenizer
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except ImportError:
+    _ENCODING = None
+
+
+def count_tokens(text):
+    """Token count with tiktoken, or the 4-chars-per-token estimate if it isn't installed."""
+    if _ENCODING is None:
+        return estimate_tokens(text)
+    return len(_ENCODING.encode(text, disallowed_special=()))
+
+
+def pack_batches(items, item_tokens, token_budget, max_items):
+    """
+    Greedily pack items, in order, into batches of at most `token_budget` tokens
+    and `max_items` items. An item bigger than the whole budget gets a batch to itself.
+
+    Args:
+        items: The items to pack
+        item_tokens: Token cost of each item (same order as items)
+        token_budget: Max tokens per batch
+        max_items: Max items per batch
+
+    Returns:
+        List[List] of batches
+    """
+    batches = []
+    current, used = [], 0
+    for item, tokens in zip(items, item_tokens):
+        if current and (used + tokens > token_budget or len(current) >= max_items):
+            batches.append(current)
+            current, used = [], 0
+        current.append(item)
+        used += tokens
+    if current:
+        batches.append(current)
+    return batches
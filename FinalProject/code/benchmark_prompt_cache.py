@@ -0,0 +1,102 @@
+import os
+import sys
+import time
+import random
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'shared'))
+from stub_server import start_in_thread
+from percentiles import percentile
+from actualgrader import CitationGrader, GRADER_SYSTEM_PROMPT
+
+# Compares the old grading prompt layout (rubric, citation, responses, then the
+# instructions) with the prefix-stable one, against the local stub server's
+# simulated prompt cache. No API key or network needed.
+
+# gpt-4o-mini bills cached prompt tokens at half price
+CACHED_TOKEN_DISCOUNT = 0.5
+
+
+def legacy_messages(citation_file, responses, citation_content):
+    """The prompt layout grade_batch used before the prefix-stable restructure."""
+    rubric, instructions = GRADER_SYSTEM_PROMPT.split("\n\nThe user message gives", 1)
+    citation_context = f"CITATION SOURCE CONTENT:\nFile: {citation_file}\n---\n{citation_content[:4000]}\n---"
+    responses_text = ""
+    for idx, resp in enumerate(responses, 1):
+        responses_text += (f"\nRESPONSE #{idx}:\nStudent: {resp['student']}\n"
+                           f"Question {resp['question_num']}: {resp['question_prompt']}\n"
+                           f"Risk/Mitigation {resp['risk_num']}: {resp['response']}\n"
+                           f"AI Usage Statement: {resp['ai_usage']}\n---\n")
+    return [
+        {"role": "system", "content": "You are a strict but fair academic grader."},
+        {"role": "user", "content": f"{rubric}\n\n{citation_context}\n\n{responses_text}\n\n{instructions}"},
+    ]
+
+
+def make_batches(num_students=60, num_chapters=4, batch_size=10, seed=0):
+    """Synthetic class: every student cites one of a few chapters for each of 5 parts."""
+    rng = random.Random(seed)
+    words = "team schedule risk surgical mythical month conceptual integrity manpower communication".split()
+    chapters = {
+        f"Mythical-Man-Month/chapter-{n}.txt": " ".join(rng.choice(words) for _ in range(900))
+        for n in range(1, num_chapters + 1)
+    }
+    grouped = {path: [] for path in chapters}
+    for s in range(num_students):
+        for part in range(1, 6):
+            path = rng.choice(list(chapters))
+            grouped[path].append({
+                'student': f"Student {s}",
+                'question_num': '1',
+                'question_prompt': "Identify five risks and/or mitigations, with explanations and citations.",
+                'risk_num': str(part),
+                'response': " ".join(rng.choice(words) for _ in range(rng.randint(40, 120))),
+                'ai_usage': "I used ChatGPT to brainstorm risks.",
+            })
+    batches = []
+    for path, responses in grouped.items():
+        for i in range(0, len(responses), batch_size):
+            batches.append((path, responses[i:i + batch_size], chapters[path]))
+    return batches
+
+
+def run(client, batches, build_messages):
+    prompt_tokens = cached_tokens = 0
+    latencies = []
+    for citation_file, responses, content in batches:
+        start = time.perf_counter()
+        completion = client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=build_messages(citation_file, responses, content),
+            max_tokens=2000,
+        )
+        latencies.append((time.perf_counter() - start) * 1000)
+        prompt_tokens += completion.usage.prompt_tokens
+        cached_tokens += completion.usage.prompt_tokens_details.cached_tokens
+    billed = prompt_tokens - cached_tokens * CACHED_TOKEN_DISCOUNT
+    return {
+        'prompt_tokens': prompt_tokens,
+        'cached_tokens': cached_tokens,
+        'billed_prompt_tokens': billed,
+        'mean_latency_ms': statistics.mean(latencies),
+        'p95_latency_ms': percentile(sorted(latencies), 0.95),
+    }
+
+
+if __name__ == "__main__":
+    batches = make_batches()
+
+    results = {}
+    for name, builder_name in [("before (legacy layout)", "legacy"), ("after (prefix-stable)", "stable")]:
+        # A fresh stub per layout so neither run benefits from the other's cache
+        server, base_url = start_in_thread(port=0, latency_ms=150, jitter_ms=0, prefill_ms_per_1k=100)
+        grader = CitationGrader("Books", api_key="stub", base_url=base_url)
+        build = legacy_messages if builder_name == "legacy" else grader.build_batch_messages
+        results[name] = run(grader.client, batches, build)
+        server.shutdown()
+
+    print(f"{len(batches)} batches against the stub server (150 ms base + 100 ms per 1k uncached prompt tokens)\n")
+    print(f"{'':<24}{'prompt tok':>12}{'cached tok':>12}{'billed tok':>12}{'ms/batch':>10}{'p95 ms':>10}")
+    for name, r in results.items():
+        print(f"{name:<24}{r['prompt_tokens']:>12}{r['cached_tokens']:>12}{r['billed_prompt_tokens']:>12.0f}"
+              f"{r['mean_latency_ms']:>10.0f}{r['p95_latency_ms']:>10.0f}")
@@ -1,59 +1,57 @@
 import os
+import sys
 import json
-from openai import OpenAI
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Dict, Any, List
 from secrets import OPENAPI_API_KEY as key
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'shared'))
+from llm_client import LLMClient
+from citation_resolver import LocalCitationResolver
+from corpus_store import CorpusStore
+from grading_document import GradingDocument
+from checkpoint import CheckpointJournal, prompt_hash
 
 class CitationFileLocator:
-    def __init__(self, books_directory, api_key=None):
+    def __init__(self, books_directory, api_key=None, base_url=None, corpus=None, max_retries=2):
         """
         Initialize the citation locator.
         
         Args:
             books_directory: Path to the Books folder containing all sources
             api_key: OpenAI API key (if None, uses OPENAI_API_KEY env var)
+            base_url: Alternate OpenAI-compatible endpoint, e.g. a local stub server for testing
+            corpus: CorpusStore of the Books folder (opened here if not given)
+            max_retries: Extra attempts (with exponential backoff) for a failed API call
         """
         self.books_directory = books_directory
-        self.client = OpenAI(api_key=api_key)
+        self.corpus = corpus if corpus is not None else CorpusStore(books_directory)
+        self.client = LLMClient(api_key=api_key, base_url=base_url, max_retries=max_retries)
         self.file_index = self._build_file_index()
+        self.resolver = LocalCitationResolver(self.file_index)
     
     def _build_file_index(self):
-        """Build an index of all available files with their metadata."""
-        file_index = []
-        
-        for root, dirs, files in os.walk(self.books_directory):
-            for file in files:
-                if file.endswith('.txt'):
-                    full_path = os.path.join(root, file)
-                    rel_path = os.path.relpath(full_path, self.books_directory)
-                    
-                    parts = rel_path.split(os.sep)
-                    
-                    file_info = {
-                        'path': rel_path,
-                        'filename': file,
-                        'collection': parts[0] if len(parts) > 0 else '',
-                        'full_path': full_path
-                    }
-                    
-                    file_index.append(file_info)
-        
-        return file_index
+        """Index of all available files with their metadata, from the corpus store's persisted index."""
+        return self.corpus.files
     
-    def _create_file_list_prompt(self):
-        """Create a formatted list of available files for the prompt."""
+    def _create_file_list_prompt(self, candidates=None):
+        """Create a formatted list of available files for the prompt (all files unless candidates is given)."""
+        paths = candidates if candidates else [f['path'] for f in self.file_index]
         file_list = []
-        for idx, file_info in enumerate(self.file_index, 1):
-            file_list.append(f"{idx}. {file_info['path']}")
+        for idx, path in enumerate(paths, 1):
+            file_list.append(f"{idx}. {path}")
         
         return "\n".join(file_list)
     
-    def identify_citation_file(self, response_text):
+    def identify_citation_file(self, response_text, raise_errors=False):
         """
-        Use OpenAI API to identify which file contains the citation.
+        Identify which file contains the citation. Easy citations are resolved
+        locally; only ambiguous ones go to the OpenAI API, with a short candidate list.
         
         Args:
             response_text: The text containing the citation reference
+            raise_errors: Raise when the API call fails, instead of returning None, so
+                callers that journal results can tell a failure from NOT_FOUND
             
         Returns:
             str: The file path, or None if not found
@@ -61,8 +59,12 @@ class CitationFileLocator:
         # Skip if text is empty or too short
         if not response_text or len(response_text.strip()) < 10:
             return None
-            
-        file_list = self._create_file_list_prompt()
+
+        file_path, candidates, _ = self.resolver.resolve(response_text)
+        if file_path:
+            return file_path
+
+        file_list = self._create_file_list_prompt(candidates)
         
         prompt = f"""You are a citation file locator. Given a response text that contains citations, identify which file from the available files list contains the cited source.
 
@@ -81,8 +83,10 @@ Instructions:
 
 Return only the file path, nothing else."""
 
+        # Transient errors are already retried by the client
         try:
             completion = self.client.chat.completions.create(
+                call_site='identify_citation_file',
                 model="gpt-4o-mini",
                 messages=[
                     {"role": "system", "content": "You are a precise citation matcher. Return only the exact file path from the provided list."},
@@ -91,21 +95,22 @@ Return only the file path, nothing else."""
                 temperature=0,
                 max_tokens=350
             )
-            
-            file_path = completion.choices[0].message.content.strip()
-            
-            if file_path == "NOT_FOUND":
-                return None
-            
-            valid_paths = [f['path'] for f in self.file_index]
-            if file_path in valid_paths:
-                return file_path
-            else:
-                return self._fuzzy_match(file_path)
-                
         except Exception as e:
+            if raise_errors:
+                raise
             print(f"Error calling OpenAI API: {e}")
             return None
+        
+        file_path = completion.choices[0].message.content.strip()
+        
+        if file_path == "NOT_FOUND":
+            return None
+        
+        valid_paths = [f['path'] for f in self.file_index]
+        if file_path in valid_paths:
+            return file_path
+        else:
+            return self._fuzzy_match(file_path)
     
     def _fuzzy_match(self, returned_path):
         """Try to match a returned path to an actual file if exact match fails."""
@@ -119,95 +124,208 @@ Return only the file path, nothing else."""
         
         return None
     
-    def process_json_file(self, input_json_path, output_json_path=None):
+    def process_json_file(self, input_json_path, output_json_path=None, checkpoint_path=None, resume=True):
         """
         Process a JSON file and add citation fields for each risk/mitigation.
         
         Args:
             input_json_path: Path to input JSON file
             output_json_path: Path to save output (if None, overwrites input)
+            checkpoint_path: JSONL journal each located citation is appended to
+            resume: Reuse citations already in the journal
             
         Returns:
             Dict: The processed data
         """
         # Read the JSON file
-        with open(input_json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        doc = GradingDocument.load(input_json_path)
+        journal = CheckpointJournal(checkpoint_path, resume=resume) if checkpoint_path else None
         
         # Process each student
         total_citations = 0
         found_citations = 0
+        failed_citations = 0
         
-        for student_data in data.get('Students', []):
-            student_name = student_data.get('Student', 'Unknown')
-            print(f"\nProcessing student: {student_name}")
+        for student_idx, records in enumerate(doc.by_student):
+            print(f"\nProcessing student: {doc.student_name(student_idx)}")
             
-            # Process each question
-            for key, value in student_data.items():
-                if key.startswith('Question ') and isinstance(value, dict):
-                    print(f"  {key}")
-                    
-                    # Process each risk/mitigation
-                    for field_name, field_value in list(value.items()):
-                        if field_name.startswith('Risk/mitigation ') and not field_name.endswith(' citation'):
-                            total_citations += 1
-                            print(f"    Processing {field_name}...", end=' ')
-                            
-                            # Get citation file
-                            citation_file = self.identify_citation_file(field_value)
-                            
-                            # Add citation field
-                            citation_key = f"{field_name} citation"
-                            value[citation_key] = citation_file if citation_file else "NOT_FOUND"
-                            
-                            if citation_file:
-                                found_citations += 1
-                                print(f"✓ {citation_file}")
-                            else:
-                                print("✗ NOT_FOUND")
+            # Process each risk/mitigation, printing a header when the question changes
+            question_key = None
+            for record in records:
+                if record.question_key != question_key:
+                    question_key = record.question_key
+                    print(f"  {question_key}")
+                
+                total_citations += 1
+                print(f"    Processing {record.field_name}...", end=' ')
+                
+                # Get citation file (from the journal if an earlier run already found it)
+                item_hash = prompt_hash(record.text)
+                journaled = journal.get(record.key, item_hash) if journal is not None else None
+                failed = False
+                if journaled is not None:
+                    citation_file = None if journaled == "NOT_FOUND" else journaled
+                else:
+                    try:
+                        citation_file = self.identify_citation_file(record.text, raise_errors=True)
+                    except Exception as e:
+                        citation_file, failed = None, True
+                        print(f"Error calling OpenAI API: {e}", end=' ')
+                
+                # Add citation field
+                record.citation = citation_file if citation_file else "NOT_FOUND"
+                # A failed call isn't journaled, so a resumed run tries it again
+                if journal is not None and journaled is None and not failed:
+                    journal.record([(record.key, item_hash, record.citation)])
+                
+                if citation_file:
+                    found_citations += 1
+                    print(f"✓ {citation_file}")
+                elif failed:
+                    failed_citations += 1
+                    print("✗ lookup failed")
+                else:
+                    print("✗ NOT_FOUND")
+        
+        if journal is not None:
+            journal.close()
         
         # Save the updated JSON
         output_path = output_json_path or input_json_path
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        doc.save(output_path)
         
         print(f"\n{'='*60}")
         print(f"Processing complete!")
         print(f"Total citations processed: {total_citations}")
         print(f"Citations found: {found_citations}")
         print(f"Citations not found: {total_citations - found_citations}")
+        if failed_citations:
+            print(f"Lookups failed (retried on resume): {failed_citations}")
         print(f"Output saved to: {output_path}")
+        print(self.resolver.report())
         print(f"{'='*60}")
         
-        return data
-    
+        return doc.data
+
+    def process_json_file_concurrent(self, input_json_path, output_json_path=None, max_workers=8,
+                                     checkpoint_path=None, resume=True, store=None, term=''):
+        """
+        Same as process_json_file, but with up to max_workers API calls in flight at once.
+
+        Failed calls are retried by the client (see max_retries); ones that still fail are left
+        out of the journal. Results are written back in the same order process_json_file would
+        write them, so the output is identical.
+
+        Args:
+            input_json_path: Path to input JSON file
+            output_json_path: Path to save output (if None, overwrites input)
+            max_workers: Max concurrent OpenAI calls
+            checkpoint_path: JSONL journal each located citation is appended to as it completes
+            resume: Skip fields whose citation is already in the journal
+            store: Optional GradeStore to save the responses and citations to (in one transaction)
+            term: Term the students are stored under
+
+        Returns:
+            Dict: The processed data
+        """
+        doc = GradingDocument.load(input_json_path)
+        tasks = list(doc)
+        hashes = [prompt_hash(record.text) for record in tasks]
+        results = [None] * len(tasks)
+
+        # Fields already located by an interrupted run come from the journal
+        journal = CheckpointJournal(checkpoint_path, resume=resume) if checkpoint_path else None
+        todo = []
+        for idx, record in enumerate(tasks):
+            journaled = journal.get(record.key, hashes[idx]) if journal is not None else None
+            if journaled is None:
+                todo.append(idx)
+            else:
+                results[idx] = None if journaled == "NOT_FOUND" else journaled
+
+        print(f"Locating {len(todo)} citations with {max_workers} workers"
+              f" ({len(tasks) - len(todo)} resumed from checkpoint)...")
+        start = time.perf_counter()
+
+        failed_citations = 0
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(self.identify_citation_file, tasks[idx].text, True): idx
+                for idx in todo
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                idx = futures[future]
+                try:
+                    results[idx] = future.result()
+                except Exception as e:
+                    # Not journaled, so a resumed run tries it again
+                    failed_citations += 1
+                    print(f"Error calling OpenAI API: {e}")
+                else:
+                    if journal is not None:
+                        journal.record([(tasks[idx].key, hashes[idx], results[idx] or "NOT_FOUND")])
+                if done % 25 == 0 or done == len(todo):
+                    elapsed = time.perf_counter() - start
+                    print(f"  {done}/{len(todo)} done ({done / elapsed:.1f} citations/s)")
+
+        if journal is not None:
+            journal.close()
+
+        # Write back in document order so the output matches process_json_file
+        found_citations = 0
+        for record, citation_file in zip(tasks, results):
+            record.citation = citation_file if citation_file else "NOT_FOUND"
+            if citation_file:
+                found_citations += 1
+
+        elapsed = time.perf_counter() - start
+        if store is not None:
+            run_id = store.start_run('locate', input_json_path, term)
+            store.import_json(doc, term, run_id)
+            store.finish_run(run_id)
+        # With a store the JSON is only written when asked for
+        output_path = output_json_path or (input_json_path if store is None else None)
+        if output_path:
+            doc.save(output_path)
+
+        print(f"\n{'='*60}")
+        print(f"Processing complete!")
+        print(f"Total citations processed: {len(tasks)}")
+        print(f"Citations found: {found_citations}")
+        print(f"Citations not found: {len(tasks) - found_citations}")
+        if failed_citations:
+            print(f"Lookups failed (retried on resume): {failed_citations}")
+        print(f"Elapsed: {elapsed:.1f}s ({len(todo) / elapsed if elapsed else 0:.1f} citations/s)")
+        if output_path:
+            print(f"Output saved to: {output_path}")
+        if store is not None:
+            print(f"Citations stored in: {store.db_path}")
+        print(self.resolver.report())
+        print(f"{'='*60}")
+
+        return doc.data
+
     def process_single_student(self, data: Dict, student_name: str) -> Dict:
         """
         Process citations for a single student (useful for testing).
         
         Args:
-            data: The full JSON data structure
-            student_name: Name of student to process
+            data: The full JSON data structure (or a GradingDocument, to reuse its index)
+            student_name: Name of student to process (every student with that name)
             
         Returns:
             Dict: Updated data
         """
-        for student_data in data.get('Students', []):
-            if student_data.get('Student') == student_name:
-                print(f"\nProcessing student: {student_name}")
-                
-                for key, value in student_data.items():
-                    if key.startswith('Question ') and isinstance(value, dict):
-                        for field_name, field_value in list(value.items()):
-                            if field_name.startswith('Risk/mitigation '):
-                                citation_file = self.identify_citation_file(field_value)
-                                citation_key = f"{field_name} citation"
-                                value[citation_key] = citation_file if citation_file else "NOT_FOUND"
-                                print(f"  {field_name}: {citation_file or 'NOT_FOUND'}")
-                
-                break
+        doc = GradingDocument.wrap(data)
+        
+        for student_idx in doc.find(student_name):
+            print(f"\nProcessing student: {student_name}")
+            for record in doc.for_student(student_idx):
+                citation_file = self.identify_citation_file(record.text)
+                record.citation = citation_file if citation_file else "NOT_FOUND"
+                print(f"  {record.field_name}: {citation_file or 'NOT_FOUND'}")
         
-        return data
+        return doc.data
 
 
 # Example usage
@@ -223,7 +341,17 @@ if __name__ == "__main__":
     #     input_json_path="responses.json",
     #     output_json_path="responses_with_citations.json"  # Or None to overwrite
     # )
-    
+
+    # Faster for a whole class: several API calls in flight at once
+    # locator.process_json_file_concurrent(
+    #     input_json_path="responses.json",
+    #     output_json_path="responses_with_citations.json",
+    #     max_workers=8
+    # )
+
+    # To try it without spending money, run `python ../../shared/stub_server.py`
+    # and pass base_url="http://127.0.0.1:8765/v1" to CitationFileLocator
+
     # Alternative: Test with a single student first
     with open("responses.json", 'r') as f:
         data = json.load(f)
@@ -0,0 +1,78 @@
+import hashlib
+import json
+import os
+
+
+def prompt_hash(*parts):
+    """Stable hash of everything that goes into an item's prompt."""
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(str(part or '').encode('utf-8'))
+        h.update(b'\x00')
+    return h.hexdigest()[:16]
+
+
+class CheckpointJournal:
+    def __init__(self, journal_path, resume=True):
+        """
+        Append-only JSONL journal of finished items, keyed by
+        (student, question, field, prompt hash).
+
+        Args:
+            journal_path: Where the journal lives (created if missing)
+            resume: Keep entries from an earlier run; False starts a fresh journal
+        """
+        self.journal_path = journal_path
+        self.entries = {}
+        if resume and os.path.exists(journal_path):
+            self._load()
+        self.file = open(journal_path, 'a' if resume else 'w', encoding='utf-8')
+
+    def _load(self):
+        complete = 0  # bytes up to the end of the last newline-terminated line
+        with open(self.journal_path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # Torn last line from a crash mid-write; those items are redone
+                    break
+                complete += len(line)
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                key = (entry['student'], entry['question'], entry['field'], entry['hash'])
+                self.entries[key] = entry['value']
+        if complete < os.path.getsize(self.journal_path):
+            # Cut the torn line off, or the next append would run on from it and be lost too
+            with open(self.journal_path, 'r+b') as f:
+                f.truncate(complete)
+
+    def get(self, key, item_hash):
+        """Value recorded for this (student, question, field) and prompt hash, or None."""
+        return self.entries.get((*key, item_hash))
+
+    def record(self, entries):
+        """
+        Append a batch of (key, prompt hash, value) as one write and fsync it.
+        A crash mid-write can leave part of a batch: its whole lines are kept on
+        load, and the torn one after them is dropped and its item redone.
+        """
+        lines = []
+        for key, item_hash, value in entries:
+            student, question, field = key
+            self.entries[(student, question, field, item_hash)] = value
+            lines.append(json.dumps({
+                'student': student, 'question': question, 'field': field,
+                'hash': item_hash, 'value': value,
+            }, ensure_ascii=False))
+        if not lines:
+            return
+        self.file.write("\n".join(lines) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def __len__(self):
+        return len(self.entries)
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,195 @@
+import os
+import re
+import threading
+from difflib import SequenceMatcher
+
+# Authors students cite by name -> words from the book's folder name
+KNOWN_AUTHORS = {
+    'brooks': 'mythical man month',
+    'demarco': 'peopleware',
+    'lister': 'peopleware',
+}
+
+STOP_WORDS = {'the', 'a', 'an', 'of', 'and', 'on', 'in', 'to', 'for', 'txt', 'chapter', 'ch'}
+
+CHAPTER_NUMBER = re.compile(r"\b(?:chapter|chap|ch)\.?\s*#?\s*(\d+)\b")
+FILENAME_CHAPTER = re.compile(r"(?:chapter|ch)[-_ ]?(\d+)[-_ ]?(.*)")
+
+
+def normalize(text):
+    """Lowercase, turn separators into spaces and drop punctuation."""
+    text = text.lower().replace('&', ' and ')
+    text = re.sub(r"[-_/\\]", " ", text)
+    text = re.sub(r"[^a-z0-9#. ]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def content_words(text):
+    return [w for w in re.findall(r"[a-z0-9]+", normalize(text)) if w not in STOP_WORDS]
+
+
+class LocalCitationResolver:
+    def __init__(self, file_index, shortlist_size=15, fuzzy_cutoff=0.85):
+        """
+        Resolve citations like "Brooks, The Mythical Man-Month, Ch. 6" without an API call.
+
+        Args:
+            file_index: The CitationFileLocator file index (dicts with 'path', 'filename', 'collection')
+            shortlist_size: Max candidate files handed to the LLM when no book matched
+                (a matched book's chapters are all sent)
+            fuzzy_cutoff: Minimum similarity for a fuzzy book/chapter title match
+        """
+        self.file_index = file_index
+        self.shortlist_size = shortlist_size
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.books = self._build_alias_index()
+        self.stats = {'exact': 0, 'fuzzy': 0, 'llm_shortlist': 0, 'llm_full_list': 0}
+        self._stats_lock = threading.Lock()
+
+    def _build_alias_index(self):
+        """
+        Precompute per book: title variants, author names and chapter number/title -> file path.
+        """
+        books = {}
+        for file_info in self.file_index:
+            collection = file_info['collection']
+            book = books.get(collection)
+            if book is None:
+                title = normalize(collection)
+                words = content_words(collection)
+                aliases = {title, " ".join(words)}
+                if title.startswith('the '):
+                    aliases.add(title[4:])
+                if len(words) > 1:
+                    aliases.add("".join(w[0] for w in words))  # e.g. "mmm"
+                for author, book_words in KNOWN_AUTHORS.items():
+                    if book_words in title:
+                        aliases.add(author)
+                book = books[collection] = {
+                    'aliases': {a for a in aliases if a},
+                    'chapters': {},        # chapter number -> [paths]
+                    'chapter_titles': [],  # (normalized title, path)
+                    'paths': [],
+                }
+
+            stem = os.path.splitext(file_info['filename'])[0].lower()
+            book['paths'].append(file_info['path'])
+            match = FILENAME_CHAPTER.match(stem)
+            if match:
+                book['chapters'].setdefault(int(match.group(1)), []).append(file_info['path'])
+                if match.group(2):
+                    book['chapter_titles'].append((normalize(match.group(2)), file_info['path']))
+            else:
+                book['chapter_titles'].append((normalize(stem), file_info['path']))
+        return books
+
+    def _count(self, tier):
+        with self._stats_lock:
+            self.stats[tier] += 1
+
+    def _citation_text(self, response_text):
+        """The part after 'Citation:' if the student labelled it, otherwise everything."""
+        parts = re.split(r"citation\s*:", response_text, maxsplit=1, flags=re.IGNORECASE)
+        return normalize(parts[1] if len(parts) > 1 else response_text)
+
+    def _find_books(self, citation):
+        """Books whose aliases appear in the citation, exact word matches first."""
+        padded = f" {citation} "
+        exact = [c for c, b in self.books.items()
+                 if any(f" {alias} " in padded or f" {alias}," in padded for alias in b['aliases'])]
+        if exact:
+            return exact, 'exact'
+
+        # Fuzzy: slide a window the size of each alias over the citation words
+        words = citation.split()
+        fuzzy = []
+        for collection, book in self.books.items():
+            for alias in book['aliases']:
+                size = len(alias.split())
+                if size < 2:
+                    continue
+                for i in range(len(words) - size + 1):
+                    window = " ".join(words[i:i + size])
+                    if SequenceMatcher(None, window, alias).ratio() >= self.fuzzy_cutoff:
+                        fuzzy.append(collection)
+                        break
+                if collection in fuzzy:
+                    break
+        return fuzzy, 'fuzzy'
+
+    def _find_chapter(self, book, citation):
+        """Return (path, tier) for the cited chapter of one book, or (None, None)."""
+        match = CHAPTER_NUMBER.search(citation)
+        if match:
+            paths = book['chapters'].get(int(match.group(1)), [])
+            if len(paths) == 1:
+                return paths[0], 'exact'
+
+        best_path, best_score = None, 0.0
+        for title, path in book['chapter_titles']:
+            if not title:
+                continue
+            if f" {title} " in f" {citation} ":
+                return path, 'fuzzy'
+            score = SequenceMatcher(None, title, citation).find_longest_match(0, len(title), 0, len(citation)).size / len(title)
+            if score > best_score:
+                best_path, best_score = path, score
+        if best_score >= self.fuzzy_cutoff:
+            return best_path, 'fuzzy'
+        return None, None
+
+    def _shortlist(self, citation, paths):
+        """
+        Rank paths by how many citation words appear in them. Empty when nothing overlaps,
+        or when every path overlaps equally and a cut could only be made by name.
+        """
+        words = set(content_words(citation))
+        scored = []
+        for path in paths:
+            overlap = len(words & set(content_words(path)))
+            if overlap:
+                scored.append((overlap, path))
+        if len(scored) > self.shortlist_size and len({overlap for overlap, _ in scored}) == 1:
+            return []
+        scored.sort(key=lambda x: (-x[0], x[1]))
+        return [path for _, path in scored[:self.shortlist_size]]
+
+    def resolve(self, response_text):
+        """
+        Try to resolve a citation locally.
+
+        Returns:
+            Tuple[path, candidates, tier]: path is set when resolved locally; otherwise
+            candidates is a short list for the LLM (None means send the full list)
+        """
+        citation = self._citation_text(response_text)
+        collections, book_tier = self._find_books(citation)
+
+        if len(collections) == 1:
+            book = self.books[collections[0]]
+            path, chapter_tier = self._find_chapter(book, citation)
+            if path:
+                tier = 'exact' if book_tier == 'exact' and chapter_tier == 'exact' else 'fuzzy'
+                self._count(tier)
+                return path, None, tier
+        if collections:
+            # A book's chapters all share its name, so word overlap can't rank them: send every one
+            self._count('llm_shortlist')
+            return None, [p for c in collections for p in self.books[c]['paths']], 'llm_shortlist'
+
+        candidates = self._shortlist(citation, [f['path'] for f in self.file_index])
+        if candidates:
+            self._count('llm_shortlist')
+            return None, candidates, 'llm_shortlist'
+
+        self._count('llm_full_list')
+        return None, None, 'llm_full_list'
+
+    def report(self):
+        total = sum(self.stats.values())
+        if not total:
+            return "Citation resolver: no citations resolved yet"
+        lines = [f"Citation resolution by tier ({total} citations):"]
+        for tier, count in self.stats.items():
+            lines.append(f"  {tier}: {count} ({count / total:.0%})")
+        return "\n".join(lines)
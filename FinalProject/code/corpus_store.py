@@ -0,0 +1,223 @@
+import hashlib
+import json
+import mmap
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+CORPUS_VERSION = 1
+
+
+def _read_file(full_path):
+    """(text with newlines normalized as UTF-8 bytes, sha256 of the raw bytes)."""
+    with open(full_path, 'rb') as f:
+        raw = f.read()
+    text = raw.decode('utf-8', errors='replace').replace('\r\n', '\n').replace('\r', '\n')
+    return text.encode('utf-8'), hashlib.sha256(raw).hexdigest()
+
+
+class CorpusStore:
+    def __init__(self, books_directory, corpus_path=None, max_workers=8):
+        """
+        Every .txt file under the Books folder packed into one file and memory-mapped read-only.
+
+        The chapters are concatenated as UTF-8 into <corpus_path>, and <corpus_path>.json
+        holds each one's offset, length and metadata plus a fingerprint of the directory
+        (every file's relative path, size and mtime). Opening a store only stats the tree;
+        when the fingerprint changed, the files whose size or mtime changed are re-read on
+        a thread pool and the rest are copied over from the old corpus.
+
+        Args:
+            books_directory: Path to the Books folder containing all sources
+            corpus_path: Where to keep the packed corpus (default: next to the Books folder)
+            max_workers: Files read at the same time when (re)building
+        """
+        self.books_directory = books_directory
+        self.corpus_path = corpus_path or f"{os.path.normpath(books_directory)}.corpus"
+        self.index_path = f"{self.corpus_path}.json"
+        self.max_workers = max_workers
+        self._mm = None
+        self.rebuilt = False
+        self.files = []
+        self.by_path = {}
+        self.refresh()
+
+    def _scan(self):
+        """[(relative path, full path, size, mtime_ns)] for every .txt file, sorted by path."""
+        found = []
+        for root, dirs, files in os.walk(self.books_directory):
+            dirs.sort()
+            for file in sorted(files):
+                if file.endswith('.txt'):
+                    full_path = os.path.join(root, file)
+                    stat = os.stat(full_path)
+                    rel_path = os.path.relpath(full_path, self.books_directory)
+                    found.append((rel_path, full_path, stat.st_size, stat.st_mtime_ns))
+        return found
+
+    @staticmethod
+    def _fingerprint(scanned):
+        h = hashlib.sha256()
+        for rel_path, _, size, mtime_ns in scanned:
+            h.update(f"{rel_path.replace(os.sep, '/')}\0{size}\0{mtime_ns}\n".encode('utf-8'))
+        return h.hexdigest()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if index.get('version') != CORPUS_VERSION or not os.path.exists(self.corpus_path):
+            return None
+        # A corpus torn by a crash mid-write doesn't match its index
+        if os.path.getsize(self.corpus_path) != sum(e['length'] for e in index['files']):
+            return None
+        return index
+
+    def _write_atomic(self, path, write):
+        """
+        Write the replacement for path into a temp file of its own next to it, so two processes
+        rebuilding at once never share one. Returns the temp path, for os.replace.
+        """
+        directory, name = os.path.split(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(prefix=f"{name}.", suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            return tmp_path
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def refresh(self):
+        """
+        Check the Books folder against the stored fingerprint and rebuild the corpus if it changed.
+
+        Returns:
+            bool: Whether the corpus was rebuilt
+        """
+        if not os.path.isdir(self.books_directory):
+            # Nothing to pack, and no corpus file is left behind for it
+            print(f"Warning: Books folder not found: {self.books_directory}")
+            self._open({'files': []})
+            self.rebuilt = False
+            return False
+        scanned = self._scan()
+        fingerprint = self._fingerprint(scanned)
+        index = self._load_index()
+        self.rebuilt = index is None or index['fingerprint'] != fingerprint
+        if self.rebuilt:
+            index = self._build(scanned, fingerprint, index)
+        self._open(index)
+        return self.rebuilt
+
+    def _build(self, scanned, fingerprint, old_index):
+        old = {}
+        if old_index is not None:
+            old = {e['path']: e for e in old_index['files']}
+        old_mm = self._mm
+        if old_mm is None and old:
+            old_mm = self._map(self.corpus_path)
+
+        def unchanged(rel_path, size, mtime_ns):
+            e = old.get(rel_path)
+            return old_mm is not None and e is not None and (e['size'], e['mtime_ns']) == (size, mtime_ns)
+
+        to_read = [full_path for rel_path, full_path, size, mtime_ns in scanned
+                   if not unchanged(rel_path, size, mtime_ns)]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            read = dict(zip(to_read, executor.map(_read_file, to_read)))
+
+        entries = []
+
+        def write_corpus(out):
+            offset = 0
+            for rel_path, full_path, size, mtime_ns in scanned:
+                if full_path in read:
+                    data, sha256 = read[full_path]
+                else:
+                    e = old[rel_path]
+                    data, sha256 = old_mm[e['offset']:e['offset'] + e['length']], e['sha256']
+                out.write(data)
+                parts = rel_path.split(os.sep)
+                entries.append({
+                    'path': rel_path,
+                    'filename': parts[-1],
+                    'collection': parts[0] if len(parts) > 0 else '',
+                    'offset': offset,
+                    'length': len(data),
+                    'size': size,
+                    'mtime_ns': mtime_ns,
+                    'sha256': sha256,
+                })
+                offset += len(data)
+
+        tmp_path = self._write_atomic(self.corpus_path, write_corpus)
+        index = {'version': CORPUS_VERSION, 'fingerprint': fingerprint, 'files': entries}
+        index_tmp_path = self._write_atomic(self.index_path, lambda f: f.write(json.dumps(index).encode('utf-8')))
+
+        # The old mapping has to be gone before its file can be replaced (Windows)
+        self.close()
+        if old_mm is not None:
+            old_mm.close()
+        os.replace(tmp_path, self.corpus_path)
+        os.replace(index_tmp_path, self.index_path)
+        print(f"Packed {len(entries)} files into {self.corpus_path} "
+              f"({len(to_read)} read, {len(entries) - len(to_read)} reused)")
+        return index
+
+    @staticmethod
+    def _map(path):
+        if os.path.getsize(path) == 0:
+            return None  # mmap can't map an empty file
+        with open(path, 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _open(self, index):
+        self.close()
+        self._mm = self._map(self.corpus_path) if index['files'] else None
+        self.files = []
+        self.by_path = {}
+        for e in index['files']:
+            entry = dict(e, full_path=os.path.join(self.books_directory, e['path']))
+            self.files.append(entry)
+            self.by_path[e['path'].replace(os.sep, '/')] = entry
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+    def __len__(self):
+        return len(self.files)
+
+    def entry(self, path):
+        """Metadata for a path relative to Books ('/' or '\\' separators), or None."""
+        if not path:
+            return None
+        return self.by_path.get(path.replace('\\', '/'))
+
+    def __contains__(self, path):
+        return self.entry(path) is not None
+
+    def view(self, path):
+        """
+        Zero-copy memoryview of a file's UTF-8 bytes, or None if it isn't in the corpus.
+        Release views before refresh() or close(); an mmap with live views can't be closed.
+        """
+        e = self.entry(path)
+        if e is None:
+            return None
+        if self._mm is None:
+            return memoryview(b'')
+        return memoryview(self._mm)[e['offset']:e['offset'] + e['length']]
+
+    def text(self, path):
+        """A file's text (as reading it in text mode would give), or None if it isn't in the corpus."""
+        e = self.entry(path)
+        if e is None:
+            return None
+        if self._mm is None:
+            return ''
+        return self._mm[e['offset']:e['offset'] + e['length']].decode('utf-8')
@@ -0,0 +1,97 @@
+import json
+import re
+
+# Structured-output schema for a batch of grades, keyed by the RESPONSE #id in the prompt
+GRADES_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "batch_grades",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "grades": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "id": {"type": "integer"},
+                            "points": {"type": "integer"},
+                            "justification": {"type": "string"},
+                        },
+                        "required": ["id", "points", "justification"],
+                        "additionalProperties": False,
+                    },
+                },
+            },
+            "required": ["grades"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+OBJECT_PATTERN = re.compile(r"\{[^{}]*\}")
+LEGACY_LINE_PATTERN = re.compile(r"^\s*RESPONSE #(\d+):\s*(-?\d+)\s*\|\s*(.*\S)", re.MULTILINE)
+
+
+def _entry_grade(entry):
+    """(id, 'points|justification') from one JSON entry, or None if it isn't usable."""
+    if not isinstance(entry, dict):
+        return None
+    try:
+        response_id = int(entry['id'])
+        points = int(entry['points'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    justification = str(entry.get('justification', '')).replace('|', '/').strip()
+    return response_id, f"{points}|{justification}"
+
+
+def _json_entries(text):
+    """Every grade-like object in the text: the whole document if it parses, else each {...} that does."""
+    cleaned = re.sub(r"^```(?:json)?\s*|\s*```$", "", text.strip())
+    try:
+        data = json.loads(cleaned)
+        if isinstance(data, dict):
+            data = data.get('grades', [])
+        return data if isinstance(data, list) else []
+    except json.JSONDecodeError:
+        pass
+
+    # Truncated or malformed output: salvage the complete entries
+    entries = []
+    for match in OBJECT_PATTERN.finditer(cleaned):
+        try:
+            entries.append(json.loads(match.group(0)))
+        except json.JSONDecodeError:
+            continue
+    return entries
+
+
+def parse_grades(text, num_responses):
+    """
+    Parse a grading reply into grades keyed by response id.
+
+    Accepts the structured JSON reply, salvages the complete entries of a truncated
+    or malformed one, and falls back to 'RESPONSE #n: points|justification' lines.
+    Ids outside 1..num_responses and repeats of an id are ignored.
+
+    Args:
+        text: The model's reply
+        num_responses: How many responses were in the batch
+
+    Returns:
+        Dict[int, str]: response id (1-based) -> 'points|justification'
+    """
+    grades = {}
+    for entry in _json_entries(text):
+        parsed = _entry_grade(entry)
+        if parsed and 1 <= parsed[0] <= num_responses:
+            grades.setdefault(*parsed)
+
+    if not grades:
+        for match in LEGACY_LINE_PATTERN.finditer(text):
+            response_id = int(match.group(1))
+            if 1 <= response_id <= num_responses:
+                grades.setdefault(response_id, f"{match.group(2)}|{match.group(3)}")
+    return grades
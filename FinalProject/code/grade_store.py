@@ -0,0 +1,293 @@
+import json
+import sqlite3
+from datetime import datetime, timezone
+
+from grading_document import GradingDocument, is_response_field
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    source TEXT,
+    term TEXT NOT NULL DEFAULT '',
+    started_at TEXT NOT NULL,
+    finished_at TEXT
+);
+CREATE TABLE IF NOT EXISTS students (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    term TEXT NOT NULL DEFAULT '',
+    position INTEGER NOT NULL,
+    UNIQUE (term, position)
+);
+CREATE TABLE IF NOT EXISTS responses (
+    id INTEGER PRIMARY KEY,
+    student_id INTEGER NOT NULL REFERENCES students(id),
+    question_key TEXT NOT NULL,
+    field_name TEXT NOT NULL,
+    question_num INTEGER,
+    part_num INTEGER,
+    text TEXT NOT NULL DEFAULT '',
+    UNIQUE (student_id, question_key, field_name)
+);
+CREATE TABLE IF NOT EXISTS citations (
+    response_id INTEGER PRIMARY KEY REFERENCES responses(id),
+    citation_file TEXT NOT NULL,
+    run_id INTEGER REFERENCES runs(id)
+);
+CREATE TABLE IF NOT EXISTS grades (
+    response_id INTEGER PRIMARY KEY REFERENCES responses(id),
+    raw TEXT NOT NULL,
+    points REAL,
+    justification TEXT,
+    run_id INTEGER REFERENCES runs(id),
+    graded_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_responses_student ON responses(student_id);
+CREATE INDEX IF NOT EXISTS idx_responses_question ON responses(question_num, part_num);
+CREATE INDEX IF NOT EXISTS idx_citations_file ON citations(citation_file);
+CREATE INDEX IF NOT EXISTS idx_grades_run ON grades(run_id);
+"""
+
+# Bumped when SCHEMA changes in a way CREATE TABLE IF NOT EXISTS can't apply to an existing file
+SCHEMA_VERSION = 1
+
+# Resolves a (student index, question, field) key to its response id inside an INSERT ... SELECT.
+# Students are stored by their position in the document's "Students", since names aren't unique.
+RESPONSE_ID_SQL = """
+SELECT r.id FROM responses r JOIN students s ON s.id = r.student_id
+WHERE s.term = ? AND s.position = ? AND r.question_key = ? AND r.field_name = ?
+"""
+
+# 'AI usage' is stored as a field next to the responses, so its grade round-trips too
+AI_USAGE_FIELD = 'AI usage'
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+def _number(token):
+    """'Question 3' / 'Risk/mitigation 2' -> 3 / 2 (None for 'AI usage')."""
+    parts = token.split(' ')
+    return int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else None
+
+
+def parse_grade(grade):
+    """'points|justification' -> (points or None, justification)."""
+    points, _, justification = (grade or '').partition('|')
+    try:
+        return float(points.strip()), justification.strip()
+    except ValueError:
+        return None, justification.strip()
+
+
+class GradeStore:
+    def __init__(self, db_path="grades.db"):
+        """
+        SQLite store of students, responses, citations and grades across runs and terms.
+
+        Args:
+            db_path: SQLite file (created if missing)
+        """
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        tables = self.conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table'").fetchone()[0]
+        if tables and version != SCHEMA_VERSION:
+            self.conn.close()
+            raise ValueError(f"{db_path} has grade store schema {version}, expected {SCHEMA_VERSION}; "
+                             "move it aside and re-import the graded JSON")
+        self.conn.executescript(SCHEMA)
+        self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def close(self):
+        self.conn.close()
+
+    # Runs
+
+    def start_run(self, kind, source=None, term=''):
+        """Record the start of a locate/grade/import run. Returns its id."""
+        with self.conn:
+            cursor = self.conn.execute("INSERT INTO runs (kind, source, term, started_at) VALUES (?, ?, ?, ?)",
+                                       (kind, source, term, _now()))
+        return cursor.lastrowid
+
+    def finish_run(self, run_id):
+        with self.conn:
+            self.conn.execute("UPDATE runs SET finished_at = ? WHERE id = ?", (_now(), run_id))
+
+    # Writes: each call is one transaction
+
+    def import_json(self, data, term='', run_id=None):
+        """
+        Upsert a grading document (path, raw JSON data or GradingDocument) in one transaction.
+
+        Returns:
+            int: Number of responses imported
+        """
+        if isinstance(data, str):
+            doc = GradingDocument.load(data)
+        else:
+            doc = GradingDocument.wrap(data)
+
+        count = 0
+        with self.conn:
+            self.conn.executemany("""
+                INSERT INTO students (name, term, position) VALUES (?, ?, ?)
+                ON CONFLICT (term, position) DO UPDATE SET name = excluded.name
+            """, [(doc.student_name(idx), term, idx) for idx in range(len(doc.students))])
+            student_ids = dict(self.conn.execute("SELECT position, id FROM students WHERE term = ?", (term,)))
+
+            response_rows, citations, grades = [], [], []
+            for student_idx, student_data in enumerate(doc.students):
+                for question_key, question in student_data.items():
+                    if not (question_key.startswith('Question ') and isinstance(question, dict)):
+                        continue
+                    fields = [f for f in question if is_response_field(f)]
+                    if AI_USAGE_FIELD in question:
+                        fields.append(AI_USAGE_FIELD)
+                    for field_name in fields:
+                        key = (term, student_idx, question_key, field_name)
+                        response_rows.append((student_ids[student_idx], question_key, field_name,
+                                              _number(question_key), _number(field_name),
+                                              question.get(field_name) or ''))
+                        if f"{field_name} citation" in question:
+                            citations.append((question[f"{field_name} citation"], run_id, *key))
+                        if f"{field_name} grade" in question:
+                            grades.append((question[f"{field_name} grade"], run_id, *key))
+                        count += 1
+
+            self.conn.executemany("""
+                INSERT INTO responses (student_id, question_key, field_name, question_num, part_num, text)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (student_id, question_key, field_name) DO UPDATE SET text = excluded.text
+            """, response_rows)
+            self._upsert_citations(citations)
+            self._upsert_grades(grades)
+        return count
+
+    def _upsert_citations(self, rows):
+        self.conn.executemany(f"""
+            INSERT INTO citations (response_id, citation_file, run_id)
+            SELECT id, ?, ? FROM ({RESPONSE_ID_SQL}) WHERE true
+            ON CONFLICT (response_id) DO UPDATE SET citation_file = excluded.citation_file, run_id = excluded.run_id
+        """, rows)
+
+    def _upsert_grades(self, rows):
+        graded_at = _now()
+        expanded = [(grade, *parse_grade(grade), run_id, graded_at, *key) for grade, run_id, *key in rows]
+        self.conn.executemany(f"""
+            INSERT INTO grades (response_id, raw, points, justification, run_id, graded_at)
+            SELECT id, ?, ?, ?, ?, ? FROM ({RESPONSE_ID_SQL}) WHERE true
+            ON CONFLICT (response_id) DO UPDATE SET raw = excluded.raw, points = excluded.points,
+                justification = excluded.justification, run_id = excluded.run_id, graded_at = excluded.graded_at
+        """, expanded)
+
+    def upsert_citations(self, entries, run_id=None, term=''):
+        """Store [((student index, question_key, field_name), citation_file)] in one transaction."""
+        with self.conn:
+            self._upsert_citations([(citation, run_id, term, *key) for key, citation in entries])
+
+    def upsert_grades(self, entries, run_id=None, term=''):
+        """Store [((student index, question_key, field_name), 'points|justification')] in one transaction."""
+        with self.conn:
+            self._upsert_grades([(grade, run_id, term, *key) for key, grade in entries])
+
+    # Reads
+
+    def export_json(self, json_path=None, term=''):
+        """
+        Rebuild the {"Students": [...]} document the scripts pass around.
+
+        Args:
+            json_path: Also write it here (optional)
+            term: Which term's students
+
+        Returns:
+            Dict: The document data
+        """
+        rows = self.conn.execute("""
+            SELECT s.position, s.name, r.question_key, r.field_name, r.text, c.citation_file, g.raw
+            FROM students s
+            JOIN responses r ON r.student_id = s.id
+            LEFT JOIN citations c ON c.response_id = r.id
+            LEFT JOIN grades g ON g.response_id = r.id
+            WHERE s.term = ?
+            ORDER BY s.position, r.question_num, r.part_num IS NULL, r.part_num
+        """, (term,))
+
+        # Keyed by position, so the rebuilt document's student indices match the stored ones
+        students = {}
+        for position, name, question_key, field_name, text, citation_file, grade in rows:
+            student = students.setdefault(position, {"Student": name})
+            question = student.setdefault(question_key, {})
+            question[field_name] = text
+            if citation_file is not None:
+                question[f"{field_name} citation"] = citation_file
+            if grade is not None:
+                question[f"{field_name} grade"] = grade
+
+        data = {"Students": list(students.values())}
+        if json_path:
+            GradingDocument(data).save(json_path)
+        return data
+
+    def students(self, term=''):
+        """[(student index, name)] in document order."""
+        return self.conn.execute("SELECT position, name FROM students WHERE term = ? ORDER BY position",
+                                 (term,)).fetchall()
+
+    def student_grades(self, student_idx, term=''):
+        """
+        One student's responses and grades in question/part order (an index lookup).
+
+        Returns:
+            List of (question_key, part_num, grade) with part_num None for the AI usage grade
+            and grade None for a response that isn't graded
+        """
+        return self.conn.execute("""
+            SELECT r.question_key, r.part_num, g.raw
+            FROM students s
+            JOIN responses r ON r.student_id = s.id
+            LEFT JOIN grades g ON g.response_id = r.id
+            WHERE s.term = ? AND s.position = ?
+            ORDER BY r.question_num, r.part_num IS NULL, r.part_num
+        """, (term, student_idx)).fetchall()
+
+    def summary(self, term=''):
+        """(responses graded, average, highest, lowest) over the numeric part grades."""
+        return self.conn.execute("""
+            SELECT COUNT(g.points), AVG(g.points), MAX(g.points), MIN(g.points)
+            FROM students s
+            JOIN responses r ON r.student_id = s.id
+            JOIN grades g ON g.response_id = r.id
+            WHERE s.term = ? AND r.part_num IS NOT NULL
+        """, (term,)).fetchone()
+
+    def student_averages(self, term=''):
+        """[(student, average points)] highest first; ties keep import order."""
+        return self.conn.execute("""
+            SELECT s.name, AVG(g.points) AS average
+            FROM students s
+            JOIN responses r ON r.student_id = s.id
+            JOIN grades g ON g.response_id = r.id
+            WHERE s.term = ? AND r.part_num IS NOT NULL AND g.points IS NOT NULL
+            GROUP BY s.id
+            ORDER BY average DESC, s.position
+        """, (term,)).fetchall()
+
+    def citation_averages(self, term=''):
+        """[(citation file, responses, average points)] for every cited file."""
+        return self.conn.execute("""
+            SELECT c.citation_file, COUNT(g.points), AVG(g.points)
+            FROM students s
+            JOIN responses r ON r.student_id = s.id
+            JOIN citations c ON c.response_id = r.id
+            LEFT JOIN grades g ON g.response_id = r.id
+            WHERE s.term = ?
+            GROUP BY c.citation_file
+            ORDER BY COUNT(g.points) DESC
+        """, (term,)).fetchall()
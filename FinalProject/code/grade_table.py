@@ -0,0 +1,180 @@
+import json
+import os
+import re
+import pandas as pd
+
+from grading_document import is_response_field
+
+STUDENTS_ARRAY_PATTERN = re.compile(r'"Students"\s*:\s*\[')
+
+
+def iter_students(json_path, chunk_size=1 << 20):
+    """
+    Stream student objects out of a graded JSON file without loading it whole.
+
+    Works on a single {"Students": [...]} document as well as archives with several
+    sections (e.g. {"Fall 2024": {"Students": [...]}, "Spring 2025": {"Students": [...]}}
+    or several documents back to back). Only one student is decoded at a time.
+
+    Args:
+        json_path: The graded JSON file or archive
+        chunk_size: Characters read per chunk
+
+    Yields:
+        Each student dict, in file order
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    in_array = False
+    eof = False
+    with open(json_path, 'r', encoding='utf-8') as f:
+        while True:
+            if not in_array:
+                match = STUDENTS_ARRAY_PATTERN.search(buffer)
+                if match:
+                    buffer = buffer[match.end():]
+                    in_array = True
+                    continue
+                if eof:
+                    return
+                # Keep a tail in case '"Students": [' straddles two chunks
+                buffer = buffer[-32:]
+            else:
+                buffer = buffer.lstrip(' \t\r\n,')
+                if buffer.startswith(']'):
+                    buffer = buffer[1:]
+                    in_array = False
+                    continue
+                if buffer:
+                    try:
+                        student, end = decoder.raw_decode(buffer)
+                    except json.JSONDecodeError:
+                        if eof:
+                            raise
+                    else:
+                        buffer = buffer[end:]
+                        yield student
+                        continue
+                elif eof:
+                    raise ValueError(f"{json_path} ended inside a Students array")
+
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer += chunk
+
+
+def _student_rows(students):
+    for student_idx, student in enumerate(students):
+        student_name = student.get('Student', 'Unknown')
+        for question_key, question in student.items():
+            if not (question_key.startswith('Question ') and isinstance(question, dict)):
+                continue
+            ai_grade = question.get('AI usage grade')
+            for field_name in question:
+                if is_response_field(field_name):
+                    yield (student_idx, student_name, question_key, field_name, question.get(f"{field_name} grade"),
+                           question.get(f"{field_name} citation"), ai_grade)
+
+
+class GradeTable:
+    COLUMNS = ['student_idx', 'student', 'question_key', 'field_name', 'grade', 'citation', 'ai_usage_grade']
+
+    def __init__(self, students):
+        """
+        Every response's grade, parsed once into columns and indexed by the student's
+        position in the iteration (names aren't unique; student holds the name).
+
+        Columns: student, question (int), part (int), graded (bool), points (float, NaN if
+        ungraded or unparsable), points_text (points as written, e.g. 'ERROR'), justification,
+        citation, ai_usage_points (question-level deduction, NaN if none), ai_usage_justification.
+
+        Args:
+            students: Iterable of student dicts (e.g. a document's data['Students']
+                or iter_students() for a large archive)
+        """
+        raw = pd.DataFrame.from_records(_student_rows(students), columns=self.COLUMNS)
+        raw[['student', 'question_key', 'field_name']] = raw[['student', 'question_key', 'field_name']].astype(str)
+
+        grade = raw['grade'].fillna('').astype(str)
+        split = grade.str.split('|', n=1, expand=True).reindex(columns=[0, 1]).fillna('').astype(str)
+        ai_grade = raw['ai_usage_grade'].fillna('').astype(str)
+        ai_split = ai_grade.str.split('|', n=1, expand=True).reindex(columns=[0, 1]).fillna('').astype(str)
+
+        self.frame = pd.DataFrame({
+            'student_idx': raw['student_idx'].astype('int64'),
+            'student': raw['student'],
+            'question': pd.to_numeric(raw['question_key'].str.split(' ').str[1], errors='coerce'),
+            'part': pd.to_numeric(raw['field_name'].str.split(' ').str[1], errors='coerce'),
+            'graded': raw['grade'].notna(),
+            'points': pd.to_numeric(split[0].str.strip(), errors='coerce').astype('float64'),
+            'points_text': split[0].str.strip(),
+            'justification': split[1].str.strip(),
+            'citation': raw['citation'].fillna('NOT_FOUND'),
+            # Only 'points|justification' deductions count, as the printer always required
+            'ai_usage_points': pd.to_numeric(ai_split[0].str.strip().where(ai_grade.str.contains('|', regex=False)),
+                                             errors='coerce').astype('float64'),
+            'ai_usage_justification': ai_split[1].str.strip(),
+        }).set_index('student_idx')
+
+    @classmethod
+    def from_document(cls, document):
+        return cls(document.data.get('Students', []))
+
+    @classmethod
+    def from_json(cls, json_path):
+        """Build the table by streaming the file, so archives never have to fit in memory as JSON."""
+        return cls(iter_students(json_path))
+
+    def __len__(self):
+        return len(self.frame)
+
+    @property
+    def graded(self):
+        """Rows with numeric points."""
+        return self.frame[self.frame['points'].notna()]
+
+    def for_student(self, student_idx):
+        """One student's rows (an index lookup, not a scan)."""
+        if student_idx not in self.frame.index:
+            return self.frame.iloc[0:0]
+        return self.frame.loc[[student_idx]]
+
+    def student_averages(self):
+        """Mean points per student (indexed by name, which can repeat), highest first; ties keep document order."""
+        averages = self.graded.groupby([self.graded.index, 'student'], sort=False)['points'].mean()
+        return averages.droplevel(0).sort_values(ascending=False, kind='stable')
+
+    def per_question(self):
+        return self.graded.groupby('question')['points'].agg(['count', 'mean', 'std', 'min', 'max'])
+
+    def per_citation(self):
+        return (self.graded.groupby('citation')['points'].agg(['count', 'mean', 'min'])
+                .sort_values('count', ascending=False))
+
+    def distribution(self):
+        """How many responses got each point value."""
+        return self.graded['points'].value_counts().sort_index()
+
+    def low_scores(self, max_points=3):
+        """Responses at or below max_points, for a second look."""
+        return self.graded[self.graded['points'] <= max_points]
+
+    def flagged_students(self, min_average=4.0):
+        """Students whose average is below min_average."""
+        averages = self.student_averages()
+        return averages[averages < min_average]
+
+    def export(self, path):
+        """Write the table as CSV, Parquet (needs pyarrow) or HTML, picked by the file extension."""
+        frame = self.frame.reset_index()
+        extension = os.path.splitext(path)[1].lower()
+        if extension == '.csv':
+            frame.to_csv(path, index=False)
+        elif extension == '.parquet':
+            frame.to_parquet(path, index=False)
+        elif extension in ('.html', '.htm'):
+            frame.to_html(path, index=False)
+        else:
+            raise ValueError(f"Don't know how to export {extension or 'files without an extension'}: "
+                             "use .csv, .parquet or .html")
+        return path
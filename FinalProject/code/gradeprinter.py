@@ -1,16 +1,78 @@
-import json
-import re
+import math
+
+from grading_document import GradingDocument
 
 class GradePrinter:
-    def __init__(self, json_file_path):
+    def __init__(self, json_file_path=None, document=None, store=None, term=''):
         """
         Initialize the grade printer.
         
         Args:
             json_file_path: Path to the JSON file with graded responses
+            document: An already loaded GradingDocument (e.g. straight from the grader)
+            store: A GradeStore to report from with indexed queries instead of a JSON file
+            term: Which term's students to report from the store
         """
-        with open(json_file_path, 'r', encoding='utf-8') as f:
-            self.data = json.load(f)
+        self.store = store
+        self.term = term
+        if store is not None:
+            self.document = None
+            self.data = None
+        else:
+            self.document = document if document is not None else GradingDocument.load(json_file_path)
+            self.data = self.document.data
+        self._table = None
+        self._exported = None  # the store's students, exported once
+    
+    @property
+    def table(self):
+        """The grades parsed once into a GradeTable (built on first use; needs pandas)."""
+        if self._table is None:
+            from grade_table import GradeTable
+            self._table = GradeTable(self._student_dicts())
+        return self._table
+    
+    def _student_dicts(self):
+        if self.store is not None:
+            if self._exported is None:
+                self._exported = self.store.export_json(term=self.term)['Students']
+            return self._exported
+        return self.document.students
+    
+    def _students(self):
+        """(student index, name) in document order; names can repeat."""
+        return [(idx, student.get('Student', 'Unknown')) for idx, student in enumerate(self._student_dicts())]
+    
+    def _student_lines(self, student_idx, student_name):
+        """Formatted grade lines for one student, questions and parts in numeric order."""
+        output_lines = []
+        output_lines.append("=" * 80)
+        output_lines.append(f"STUDENT: {student_name}")
+        output_lines.append("=" * 80)
+        output_lines.append("")
+        
+        rows = self.table.for_student(student_idx).sort_values(['question', 'part'], kind='stable')
+        # Every question gets a header, graded or not
+        for question, question_rows in rows.groupby('question', sort=True):
+            output_lines.append(f"Question {question:g}:")
+            output_lines.append("-" * 80)
+            
+            for _, row in question_rows[question_rows['graded']].iterrows():
+                output_lines.append(f"  Part {row['part']:g} grade: {row['points_text']}")
+                if row['justification']:
+                    output_lines.append(f"    {row['justification']}")
+                output_lines.append("")
+            
+            # Question-level AI usage deduction from the pre-grader, if any
+            ai_row = question_rows.iloc[0]
+            if not math.isnan(ai_row['ai_usage_points']):
+                output_lines.append(f"  AI usage deduction: {ai_row['ai_usage_points']:g}")
+                output_lines.append(f"    {ai_row['ai_usage_justification']}")
+                output_lines.append("")
+            
+            output_lines.append("")
+        
+        return output_lines
     
     def print_all_grades(self, output_file=None):
         """
@@ -21,53 +83,8 @@ class GradePrinter:
         """
         output_lines = []
         
-        for student_data in self.data.get('Students', []):
-            student_name = student_data.get('Student', 'Unknown')
-            
-            # Print student header
-            output_lines.append("=" * 80)
-            output_lines.append(f"STUDENT: {student_name}")
-            output_lines.append("=" * 80)
-            output_lines.append("")
-            
-            # Get all questions for this student
-            questions = [(k, v) for k, v in student_data.items() 
-                        if k.startswith('Question ') and isinstance(v, dict)]
-            
-            # Sort questions numerically
-            questions.sort(key=lambda x: int(x[0].split(' ')[1]))
-            
-            for question_key, question_data in questions:
-                output_lines.append(f"{question_key}:")
-                output_lines.append("-" * 80)
-                
-                # Get all risk/mitigation grades
-                grades = []
-                for field_name, field_value in question_data.items():
-                    if field_name.endswith(' grade'):
-                        # Extract the risk/mitigation number
-                        match = re.search(r'Risk/mitigation (\d+)', field_name)
-                        if match:
-                            risk_num = int(match.group(1))
-                            grades.append((risk_num, field_value))
-                
-                # Sort by risk/mitigation number
-                grades.sort(key=lambda x: x[0])
-                
-                # Print each grade
-                for risk_num, grade_value in grades:
-                    # Parse the grade (format: "points|justification")
-                    if '|' in grade_value:
-                        points, justification = grade_value.split('|', 1)
-                        output_lines.append(f"  Part {risk_num} grade: {points.strip()}")
-                        output_lines.append(f"    {justification.strip()}")
-                    else:
-                        # Fallback if format is different
-                        output_lines.append(f"  Part {risk_num} grade: {grade_value}")
-                    output_lines.append("")
-                
-                output_lines.append("")
-            
+        for student_idx, student_name in self._students():
+            output_lines.extend(self._student_lines(student_idx, student_name))
             output_lines.append("")
         
         # Output to file or console
@@ -82,51 +99,18 @@ class GradePrinter:
     
     def print_student_grades(self, student_name, output_file=None):
         """
-        Print grades for a specific student.
+        Print grades for a specific student (each student, if several share the name).
         
         Args:
             student_name: Name of the student
             output_file: Optional file path to save output
         """
         output_lines = []
-        
-        for student_data in self.data.get('Students', []):
-            if student_data.get('Student') == student_name:
-                output_lines.append("=" * 80)
-                output_lines.append(f"STUDENT: {student_name}")
-                output_lines.append("=" * 80)
-                output_lines.append("")
-                
-                questions = [(k, v) for k, v in student_data.items() 
-                            if k.startswith('Question ') and isinstance(v, dict)]
-                questions.sort(key=lambda x: int(x[0].split(' ')[1]))
-                
-                for question_key, question_data in questions:
-                    output_lines.append(f"{question_key}:")
-                    output_lines.append("-" * 80)
-                    
-                    grades = []
-                    for field_name, field_value in question_data.items():
-                        if field_name.endswith(' grade'):
-                            match = re.search(r'Risk/mitigation (\d+)', field_name)
-                            if match:
-                                risk_num = int(match.group(1))
-                                grades.append((risk_num, field_value))
-                    
-                    grades.sort(key=lambda x: x[0])
-                    
-                    for risk_num, grade_value in grades:
-                        if '|' in grade_value:
-                            points, justification = grade_value.split('|', 1)
-                            output_lines.append(f"  Part {risk_num} grade: {points.strip()}")
-                            output_lines.append(f"    {justification.strip()}")
-                        else:
-                            output_lines.append(f"  Part {risk_num} grade: {grade_value}")
-                        output_lines.append("")
-                    
+        for student_idx, name in self._students():
+            if name == student_name:
+                if output_lines:
                     output_lines.append("")
-                
-                break
+                output_lines.extend(self._student_lines(student_idx, student_name))
         
         output_text = '\n'.join(output_lines)
         
@@ -139,43 +123,74 @@ class GradePrinter:
     
     def print_summary_statistics(self):
         """Print summary statistics for all grades."""
-        all_scores = []
-        student_scores = {}
-        
-        for student_data in self.data.get('Students', []):
-            student_name = student_data.get('Student', 'Unknown')
-            student_total = 0
-            student_count = 0
-            
-            for key, value in student_data.items():
-                if key.startswith('Question ') and isinstance(value, dict):
-                    for field_name, field_value in value.items():
-                        if field_name.endswith(' grade') and '|' in field_value:
-                            try:
-                                points = float(field_value.split('|')[0].strip())
-                                all_scores.append(points)
-                                student_total += points
-                                student_count += 1
-                            except ValueError:
-                                pass
-            
-            if student_count > 0:
-                student_scores[student_name] = student_total / student_count
+        if self.store is not None:
+            # Aggregated in SQLite
+            count, average, highest, lowest = self.store.summary(self.term)
+            student_scores = self.store.student_averages(self.term)
+        else:
+            points = self.table.graded['points']
+            count = len(points)
+            average, highest, lowest = (points.mean(), points.max(), points.min()) if count else (None, None, None)
+            student_scores = self.table.student_averages().items()
         
         # Print summary
         print("=" * 80)
         print("GRADE SUMMARY")
         print("=" * 80)
-        print(f"Total responses graded: {len(all_scores)}")
-        if all_scores:
-            print(f"Average score: {sum(all_scores) / len(all_scores):.2f}")
-            print(f"Highest score: {max(all_scores)}")
-            print(f"Lowest score: {min(all_scores)}")
+        print(f"Total responses graded: {count}")
+        if count:
+            print(f"Average score: {average:.2f}")
+            print(f"Highest score: {highest}")
+            print(f"Lowest score: {lowest}")
             print()
             print("Student Averages:")
-            for student, avg in sorted(student_scores.items(), key=lambda x: x[1], reverse=True):
+            for student, avg in student_scores:
                 print(f"  {student}: {avg:.2f}")
         print("=" * 80)
+    
+    def print_detailed_statistics(self, low_score=3, min_average=4.0):
+        """
+        Print per-question and per-citation statistics, the score distribution,
+        and the responses and students that need a second look.
+        
+        Args:
+            low_score: Responses at or below this many points are listed
+            min_average: Students averaging below this are flagged
+        """
+        table = self.table
+        print("=" * 80)
+        print("DETAILED STATISTICS")
+        print("=" * 80)
+        print("By question:")
+        print(table.per_question().round(2).to_string())
+        print()
+        print("By citation file:")
+        print(table.per_citation().round(2).to_string())
+        print()
+        print("Score distribution:")
+        for value, count in table.distribution().items():
+            print(f"  {value:g}: {count}")
+        print()
+        low = table.low_scores(low_score)
+        print(f"Responses at or below {low_score} points: {len(low)}")
+        for _, row in low.iterrows():
+            print(f"  {row['student']}, Question {row['question']:g} part {row['part']:g}: "
+                  f"{row['points']:g} ({row['justification']})")
+        flagged = table.flagged_students(min_average)
+        print(f"Students averaging below {min_average}: {len(flagged)}")
+        for student, avg in flagged.items():
+            print(f"  {student}: {avg:.2f}")
+        print("=" * 80)
+    
+    def export(self, output_file):
+        """
+        Export one row per response as CSV, Parquet or HTML (picked by extension).
+        
+        Args:
+            output_file: e.g. grades.csv, grades.parquet or grades.html
+        """
+        self.table.export(output_file)
+        print(f"Grades exported to: {output_file}")
 
 
 # Example usage
@@ -194,4 +209,18 @@ if __name__ == "__main__":
     # printer.print_student_grades("Alvey, Ethan", output_file="alvey_grades.txt")
     
     # Option 4: Print summary statistics
-    # printer.print_summary_statistics()
\ No newline at end of file
+    # printer.print_summary_statistics()
+    # printer.print_detailed_statistics()
+    
+    # Option 5: Export a row per response for a spreadsheet or notebook
+    # printer.export("grades.csv")  # or .parquet / .html
+    
+    # Option 6: Report straight from the SQLite grade store (all terms live in one file)
+    # from grade_store import GradeStore
+    # store_printer = GradePrinter(store=GradeStore("grades.db"), term="Fall 2025")
+    # store_printer.print_summary_statistics()
+    
+    # Option 7: Statistics for an archive of several semesters without loading it whole
+    # from grade_table import GradeTable
+    # archive = GradeTable.from_json("graded_archive.json")
+    # print(archive.per_question())
\ No newline at end of file
@@ -0,0 +1,145 @@
+import json
+import os
+
+
+def is_response_field(field_name):
+    """'Risk/mitigation 3' is a student response; its ' citation'/' grade' siblings are not."""
+    return field_name.startswith('Risk/mitigation ') and not field_name.endswith((' citation', ' grade'))
+
+
+class ResponseRecord:
+    """
+    One student response (student, question, field). Reads and writes go straight
+    to the question dict inside the original JSON data, so saving the document
+    picks up every change.
+
+    Students are identified by their index in "Students"; two students can share a
+    name, so the name (student) is only for display.
+    """
+    __slots__ = ('student_idx', 'student', 'question_key', 'field_name', 'question')
+
+    def __init__(self, student_idx, student, question_key, field_name, question):
+        self.student_idx = student_idx
+        self.student = student
+        self.question_key = question_key
+        self.field_name = field_name
+        self.question = question
+
+    @property
+    def key(self):
+        return (self.student_idx, self.question_key, self.field_name)
+
+    @property
+    def question_num(self):
+        return self.question_key.split(' ')[1]
+
+    @property
+    def risk_num(self):
+        return self.field_name.split(' ')[1]
+
+    @property
+    def text(self):
+        return self.question.get(self.field_name, '')
+
+    @property
+    def ai_usage(self):
+        return self.question.get('AI usage', '')
+
+    @property
+    def citation(self):
+        return self.question.get(f"{self.field_name} citation")
+
+    @citation.setter
+    def citation(self, value):
+        self.question[f"{self.field_name} citation"] = value
+
+    @property
+    def grade(self):
+        return self.question.get(f"{self.field_name} grade")
+
+    @grade.setter
+    def grade(self, value):
+        self.question[f"{self.field_name} grade"] = value
+
+
+class GradingDocument:
+    def __init__(self, data):
+        """
+        Index a grading document ({"Students": [...]}) once so lookups are O(1).
+
+        Args:
+            data: The parsed JSON data (kept and updated in place)
+        """
+        self.data = data
+        self.records = {}     # (student index, question_key, field_name) -> ResponseRecord
+        self.students = data.get('Students', [])
+        self.by_student = []  # student index -> [ResponseRecord] in document order
+        self.indices = {}     # student name -> [student index] (names aren't unique)
+
+        for student_idx, student_data in enumerate(self.students):
+            student_name = self.student_name(student_idx)
+            self.indices.setdefault(student_name, []).append(student_idx)
+            student_records = []
+            self.by_student.append(student_records)
+
+            for question_key, question in student_data.items():
+                if not (question_key.startswith('Question ') and isinstance(question, dict)):
+                    continue
+                for field_name in list(question):
+                    if is_response_field(field_name):
+                        record = ResponseRecord(student_idx, student_name, question_key, field_name, question)
+                        self.records[record.key] = record
+                        student_records.append(record)
+
+    @classmethod
+    def load(cls, json_path):
+        with open(json_path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    @classmethod
+    def wrap(cls, data):
+        """Accept either raw JSON data or an existing GradingDocument."""
+        return data if isinstance(data, cls) else cls(data)
+
+    def save(self, json_path):
+        """Write to a temp file and rename, so a crash never leaves a half-written JSON."""
+        tmp_path = f"{json_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, json_path)
+
+    def __iter__(self):
+        return iter(self.records.values())
+
+    def __len__(self):
+        return len(self.records)
+
+    def student_name(self, student_idx):
+        return self.students[student_idx].get('Student', 'Unknown')
+
+    def get(self, student_idx, question_key, field_name):
+        return self.records.get((student_idx, question_key, field_name))
+
+    def for_student(self, student_idx):
+        return self.by_student[student_idx]
+
+    def find(self, student_name):
+        """Indices of every student with this name, in document order."""
+        return self.indices.get(student_name, [])
+
+    def set_grade(self, key, grade):
+        """Store a grade by record key. Returns False if the key isn't in the document."""
+        record = self.records.get(key)
+        if record is None:
+            return False
+        record.grade = grade
+        return True
+
+    def set_citation(self, key, citation):
+        record = self.records.get(key)
+        if record is None:
+            return False
+        record.citation = citation
+        return True
@@ -0,0 +1,106 @@
+import os
+import ast
+import sys
+import threading
+import numpy as np
+import pandas as pd
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'shared'))
+
+
+class PassageIndex:
+    def __init__(self, csv_path="embeddings/course_readings.csv", model_name='all-MiniLM-L6-v2', backend=None):
+        """
+        Vector index over the chunk embeddings made by process_and_embed.py.
+
+        process_and_embed.py keeps the embeddings as a float32 .npy matrix plus a
+        metadata CSV next to csv_path, and this memory-maps the .npy directly. An older
+        course_readings.csv with stringified embeddings is converted to that once.
+
+        Args:
+            csv_path: Names the store (course_readings.npy / course_readings_meta.csv beside it)
+            model_name: Must be the model the chunks were embedded with
+            backend: Query encoder backend, 'torch', 'onnx' or 'onnx-int8' (default: $EMBEDDING_BACKEND)
+        """
+        self.csv_path = csv_path
+        self.model_name = model_name
+        self.backend = backend
+        self._model = None
+        self._model_lock = threading.Lock()
+        self.meta, self.embeddings = self._load()
+
+        # (book folder name with spaces, filename) -> row numbers in reading order
+        self.rows_by_file = {}
+        for (book, filename), rows in self.meta.groupby(['book', 'filename']).groups.items():
+            ordered = self.meta.loc[rows].sort_values('chunk_id').index.to_numpy()
+            self.rows_by_file[(book, filename)] = ordered
+
+    def _index_paths(self):
+        base = os.path.splitext(self.csv_path)[0]
+        return f"{base}.npy", f"{base}_meta.csv"
+
+    def _load(self):
+        npy_path, meta_path = self._index_paths()
+        csv_mtime = os.path.getmtime(self.csv_path) if os.path.exists(self.csv_path) else 0
+        if os.path.exists(npy_path) and os.path.exists(meta_path) and os.path.getmtime(npy_path) >= csv_mtime:
+            meta = pd.read_csv(meta_path, keep_default_na=False)
+            return meta, np.load(npy_path, mmap_mode='r')
+
+        print(f"Building passage index from {self.csv_path}...")
+        df = pd.read_csv(self.csv_path, keep_default_na=False)
+        embeddings = np.array([ast.literal_eval(e) for e in df['embedding']], dtype=np.float32)
+        meta = df.drop(columns=['embedding']).reset_index(drop=True)
+        np.save(npy_path, embeddings)
+        meta.to_csv(meta_path, index=False)
+        return meta, embeddings
+
+    @property
+    def model(self):
+        if self._model is None:
+            from encoders import load_encoder
+            self._model = load_encoder(self.model_name, backend=self.backend)
+        return self._model
+
+    def encode(self, texts):
+        # One encode at a time; the grader calls this from several worker threads
+        with self._model_lock:
+            return self.model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+
+    def rows_for(self, citation_file):
+        """Rows for a citation path like 'Mythical-Man-Month/chapter-6.txt'."""
+        if not citation_file or citation_file == "NOT_FOUND":
+            return None
+        parts = citation_file.replace('\\', '/').split('/')
+        book = parts[0].replace('-', ' ')
+        return self.rows_by_file.get((book, parts[-1]))
+
+    def top_passages(self, citation_file, queries, top_k=4, max_chars=4000):
+        """
+        The chunks of the cited file most similar to any of the queries,
+        returned in reading order.
+
+        Args:
+            citation_file: Path of the cited file, relative to Books
+            queries: Texts to match (e.g. the student responses in a batch)
+            top_k: Max passages to return
+            max_chars: Stop adding passages past this many characters
+
+        Returns:
+            List[str] of passages (empty if the file isn't indexed)
+        """
+        rows = self.rows_for(citation_file)
+        if rows is None or len(rows) == 0 or not queries:
+            return []
+
+        query_embeddings = self.encode(list(queries))
+        # Best match against any query, so every student's point can pull in its passage
+        scores = (np.asarray(self.embeddings[rows]) @ query_embeddings.T).max(axis=1)
+        best = np.argsort(-scores)[:top_k]
+
+        chosen, total = [], 0
+        for i in best:
+            text = self.meta.at[rows[i], 'text']
+            if chosen and total + len(text) > max_chars:
+                break
+            chosen.append(i)
+            total += len(text)
+        return [self.meta.at[rows[i], 'text'] for i in sorted(chosen)]
@@ -0,0 +1,436 @@
+import argparse
+import os
+import queue
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from secrets import OPENAPI_API_KEY as key
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'shared'))
+from percentiles import percentile
+from splitanswers import read_student_rows, split_row_locally, split_chunk
+from cg2 import CitationFileLocator
+from corpus_store import CorpusStore
+from actualgrader import CitationGrader, QUESTION_PROMPTS
+from gradeprinter import GradePrinter
+from grading_document import GradingDocument
+from pregrader import PreGrader
+from rate_limit import TokenRateLimiter
+
+# End-of-stream marker passed down the queues
+_DONE = object()
+
+STAGES = ['split', 'locate', 'grade', 'report']
+
+
+class StudentItem:
+    """One student moving through the pipeline, with a timestamp per finished stage."""
+    __slots__ = ('idx', 'question_keys', 'row', 'doc', 'remaining', 'error', 'timings')
+
+    def __init__(self, idx, question_keys, row):
+        self.idx = idx
+        self.question_keys = question_keys
+        self.row = row
+        self.doc = None        # GradingDocument holding just this student
+        self.remaining = 0     # responses still waiting for a grade
+        self.error = None
+        self.timings = {'start': time.perf_counter()}
+
+    @property
+    def name(self):
+        return self.row['Student']
+
+
+class GradingPipeline:
+    def __init__(self, locator, grader, question_prompts, split_workers=2, locate_workers=8, grade_workers=4,
+                 queue_size=16, batch_size=10, batch_wait=1.0, max_retries=2, tokens_per_minute=None):
+        """
+        Runs split -> locate -> grade -> report per student, so early students are being
+        graded while later ones are still being split.
+
+        Stages are connected by bounded queues: when a stage falls behind, the ones
+        before it block instead of piling up the whole class in memory.
+
+        Args:
+            locator: CitationFileLocator for the locate stage
+            grader: CitationGrader for the grade stage (its pregrader is used if set)
+            question_prompts: Dict mapping question keys to prompt text
+            split_workers: Students being split at the same time
+            locate_workers: Students having citations located at the same time
+            grade_workers: Grading batches in flight at the same time
+            queue_size: Max students waiting between two stages
+            batch_size: Responses citing the same file that are graded in one call
+            batch_wait: Seconds a partial batch may wait for more responses before it's sent
+            max_retries: Extra attempts for a failed LLM call
+            tokens_per_minute: Grading token budget (None = no limit)
+        """
+        self.locator = locator
+        self.grader = grader
+        self.question_prompts = question_prompts
+        self.workers = {'split': split_workers, 'locate': locate_workers, 'grade': grade_workers}
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.max_retries = max_retries
+        self.limiter = TokenRateLimiter(tokens_per_minute)
+
+        self.stats_lock = threading.Lock()
+        self.busy = {stage: 0.0 for stage in STAGES}
+        self.max_depth = {}
+        self.grade_lock = threading.Condition()
+        self.grading_in_flight = 0
+        self.grade_calls = 0
+
+    def _put(self, q, name, item):
+        """Put blocks while the next stage's queue is full (backpressure)."""
+        q.put(item)
+        with self.stats_lock:
+            self.max_depth[name] = max(self.max_depth.get(name, 0), q.qsize())
+
+    def _add_busy(self, stage, seconds):
+        with self.stats_lock:
+            self.busy[stage] += seconds
+
+    # Stage work, one student at a time
+
+    def _split(self, item):
+        student = split_row_locally(item.row, item.question_keys)
+        if student is None:
+            split, attempts, problems = split_chunk([item.row], item.question_keys, self.max_retries,
+                                                    self.grader.client)
+            if split is None:
+                raise ValueError(f"could not split answers: {problems[:3]}")
+            student = split[0]
+        item.doc = GradingDocument({"Students": [student]})
+
+    def _locate(self, item):
+        for record in item.doc:
+            citation_file = None
+            if record.text.strip():
+                citation_file = self.locator.identify_citation_file(record.text)
+            record.citation = citation_file if citation_file else "NOT_FOUND"
+
+    def _run_stage(self, stage, inbox, outbox, work):
+        """Start the worker threads of a one-student-at-a-time stage."""
+        workers_left = [self.workers[stage]]
+        lock = threading.Lock()
+
+        def loop():
+            while True:
+                item = inbox.get()
+                if item is _DONE:
+                    inbox.put(_DONE)  # let the other workers of this stage see it too
+                    with lock:
+                        workers_left[0] -= 1
+                        last = workers_left[0] == 0
+                    if last:
+                        outbox.put(_DONE)
+                    return
+                start = time.perf_counter()
+                if item.error is None:
+                    try:
+                        work(item)
+                    except Exception as e:
+                        item.error = f"{stage}: {e}"
+                self._add_busy(stage, time.perf_counter() - start)
+                item.timings[stage] = time.perf_counter()
+                self._put(outbox, stage, item)
+
+        threads = [threading.Thread(target=loop, name=f"{stage}-{i}", daemon=True)
+                   for i in range(self.workers[stage])]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    # Grade stage: responses from different students that cite the same file share a call
+
+    def _finish_grading(self, item, outbox):
+        item.timings['grade'] = time.perf_counter()
+        self._put(outbox, 'grade', item)
+
+    def _submit_batch(self, executor, citation_file, batch, outbox, attempt=0, delay=0):
+        try:
+            content = self.grader.load_citation_file(citation_file)
+            future = executor.submit(self.grader._grade_job, citation_file, batch, content, self.limiter, delay)
+        except Exception as e:
+            self._fail_batch(batch, f"grade: {e}", outbox)
+            return
+        with self.grade_lock:
+            self.grading_in_flight += 1
+        future.add_done_callback(
+            lambda f: self._on_graded(executor, citation_file, batch, attempt, f, outbox))
+
+    def _on_graded(self, executor, citation_file, batch, attempt, future, outbox):
+        # A done-callback: whatever happens, release the batch, or _grade_stage waits forever
+        try:
+            self._record_grades(executor, citation_file, batch, attempt, future, outbox)
+        except Exception as e:
+            self._fail_batch(batch, f"grade: {e}", outbox)
+        finally:
+            with self.grade_lock:
+                self.grading_in_flight -= 1
+                self.grade_lock.notify_all()
+
+    def _record_grades(self, executor, citation_file, batch, attempt, future, outbox):
+        try:
+            grades = future.result()
+        except Exception as e:
+            grades = [f"ERROR|Grading failed: {e}"] * len(batch)
+        with self.stats_lock:
+            self.grade_calls += 1
+
+        if self.grader._batch_failed(batch, grades) and attempt < self.max_retries:
+            self._submit_batch(executor, citation_file, batch, outbox, attempt + 1, 2 ** attempt)
+            grades = [None] * len(batch)
+            batch = []
+        else:
+            # Ask again for just the grades missing from the reply
+            missing = [resp for resp, grade in zip(batch, grades) if grade is None]
+            if missing:
+                next_attempt = attempt + 1 if len(missing) == len(batch) else attempt
+                if next_attempt <= self.max_retries:
+                    self._submit_batch(executor, citation_file, missing, outbox, next_attempt)
+                else:
+                    grades = [grade or "ERROR|Could not parse grade" for grade in grades]
+
+        finished = []
+        with self.grade_lock:
+            for resp, grade in zip(batch, grades):
+                if grade is None:
+                    continue
+                item = resp['item']
+                item.doc.set_grade(resp['key'], grade)
+                item.remaining -= 1
+                if item.remaining == 0:
+                    finished.append(item)
+        for item in finished:
+            self._finish_grading(item, outbox)
+
+    def _fail_batch(self, batch, error, outbox):
+        """Mark the students in a batch whose grading broke as failed, finishing each one once."""
+        failed = []
+        with self.grade_lock:
+            for item in {id(resp['item']): resp['item'] for resp in batch}.values():
+                # remaining is already 0 for a student that was finished
+                if item.remaining > 0:
+                    item.error = error
+                    item.remaining = 0
+                    failed.append(item)
+        for item in failed:
+            self._finish_grading(item, outbox)
+
+    def _grade_stage(self, inbox, outbox):
+        """Collect responses per cited file and send a batch when it's full or has waited batch_wait."""
+        buffers = {}  # citation_file -> [response dicts]
+        oldest = {}   # citation_file -> when its first buffered response arrived
+        upstream_done = False
+
+        with ThreadPoolExecutor(max_workers=self.workers['grade']) as executor:
+            while not upstream_done or buffers:
+                try:
+                    item = inbox.get(timeout=self.batch_wait / 4)
+                except queue.Empty:
+                    item = None
+
+                if item is _DONE:
+                    upstream_done = True
+                elif item is not None:
+                    start = time.perf_counter()
+                    try:
+                        self._queue_for_grading(item, buffers, oldest, outbox)
+                    except Exception as e:
+                        # Nothing of this student's was buffered yet; fail just them
+                        item.error = f"grade: {e}"
+                        item.remaining = 0
+                        self._finish_grading(item, outbox)
+                    self._add_busy('grade', time.perf_counter() - start)
+
+                now = time.perf_counter()
+                for citation_file in list(buffers):
+                    pending = buffers[citation_file]
+                    while len(pending) >= self.batch_size:
+                        self._submit_batch(executor, citation_file, pending[:self.batch_size], outbox)
+                        del pending[:self.batch_size]
+                    if pending and (upstream_done or now - oldest[citation_file] >= self.batch_wait):
+                        self._submit_batch(executor, citation_file, pending, outbox)
+                        pending = []
+                    if not pending:
+                        del buffers[citation_file]
+                        oldest.pop(citation_file, None)
+
+            # Retries are submitted from callbacks, so wait until nothing is left in flight
+            with self.grade_lock:
+                while self.grading_in_flight:
+                    self.grade_lock.wait()
+        outbox.put(_DONE)
+
+    def _queue_for_grading(self, item, buffers, oldest, outbox):
+        if item.error is not None:
+            self._finish_grading(item, outbox)
+            return
+
+        grouped = self.grader.group_responses_by_citation(item.doc, self.question_prompts)
+        pregrader = self.grader.pregrader
+        if pregrader is not None:
+            self.grader._apply_ai_usage_deductions(item.doc)
+
+        to_grade = []
+        for citation_file, responses in grouped.items():
+            for resp in responses:
+                grade = pregrader.grade(resp['response']) if pregrader is not None else None
+                if grade is not None:
+                    item.doc.set_grade(resp['key'], grade)
+                else:
+                    resp['item'] = item
+                    to_grade.append((citation_file, resp))
+
+        item.remaining = len(to_grade)
+        if not to_grade:
+            self._finish_grading(item, outbox)
+            return
+        now = time.perf_counter()
+        for citation_file, resp in to_grade:
+            buffers.setdefault(citation_file, []).append(resp)
+            oldest.setdefault(citation_file, now)
+
+    # Report stage
+
+    def _report_stage(self, inbox, results, failed, report_file):
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                return
+            start = time.perf_counter()
+            if item.error is not None:
+                failed.append((item.name, item.error))
+            else:
+                results[item.idx] = item
+                if report_file is not None:
+                    lines = GradePrinter(document=item.doc)._student_lines(0, item.name)
+                    report_file.write('\n'.join(lines) + '\n\n')
+                    report_file.flush()
+            item.timings['report'] = time.perf_counter()
+            self._add_busy('report', item.timings['report'] - start)
+
+    def run(self, csv_path, output_json_path, report_path=None):
+        """
+        Split, locate, grade and report every student in the answers CSV.
+
+        Args:
+            csv_path: The exported answers CSV (Student, Question 1, ...)
+            output_json_path: Where to save the graded JSON (same shape as the grader's output)
+            report_path: Optional text file the per-student grade report is appended to as
+                students finish
+
+        Returns:
+            Dict: The graded data
+        """
+        start = time.perf_counter()
+        queues = {stage: queue.Queue(maxsize=self.queue_size) for stage in STAGES}
+        results = {}
+        failed = []
+
+        def read():
+            # Always end the stream, or the stages after it wait for students forever
+            try:
+                for idx, (question_keys, row) in enumerate(read_student_rows(csv_path)):
+                    self._put(queues['split'], 'read', StudentItem(idx, question_keys, row))
+            except Exception as e:
+                failed.append((csv_path, f"read: {e}"))
+            finally:
+                queues['split'].put(_DONE)
+
+        report_file = open(report_path, 'w', encoding='utf-8') if report_path else None
+        try:
+            threads = [threading.Thread(target=read, name="read", daemon=True)]
+            threads += self._run_stage('split', queues['split'], queues['locate'], self._split)
+            threads += self._run_stage('locate', queues['locate'], queues['grade'], self._locate)
+            threads.append(threading.Thread(target=self._grade_stage, name="grade",
+                                            args=(queues['grade'], queues['report']), daemon=True))
+            threads.append(threading.Thread(target=self._report_stage, name="report",
+                                            args=(queues['report'], results, failed, report_file), daemon=True))
+            for thread in threads[-2:]:
+                thread.start()
+            threads[0].start()
+            for thread in threads:
+                thread.join()
+        finally:
+            if report_file is not None:
+                report_file.close()
+
+        items = [results[idx] for idx in sorted(results)]
+        doc = GradingDocument({"Students": [item.doc.data['Students'][0] for item in items]})
+        doc.save(output_json_path)
+
+        self._print_report(items, failed, time.perf_counter() - start, output_json_path, report_path)
+        return doc.data
+
+    def _print_report(self, items, failed, elapsed, output_json_path, report_path):
+        print(f"\n{'='*60}")
+        print("Pipeline complete!")
+        print(f"Students: {len(items)} graded, {len(failed)} failed, {elapsed:.1f}s "
+              f"({len(items) / elapsed if elapsed else 0:.2f} students/s)")
+
+        latencies = sorted(item.timings['report'] - item.timings['start'] for item in items)
+        if latencies:
+            p95 = percentile(latencies, 0.95)
+            print(f"End-to-end latency per student: median {statistics.median(latencies):.1f}s, "
+                  f"p95 {p95:.1f}s, first student done after {min(latencies):.1f}s")
+
+        # busy: total time spent working; avg: queue wait + work per student; max queue: inbox high-water mark
+        print(f"{'stage':<8}{'workers':>8}{'busy s':>10}{'avg s':>10}{'max queue':>11}")
+        previous = {'split': 'read', 'locate': 'split', 'grade': 'locate', 'report': 'grade'}
+        for stage in STAGES:
+            durations = [item.timings[stage] - item.timings.get(previous[stage], item.timings['start'])
+                         for item in items if stage in item.timings]
+            mean = statistics.mean(durations) if durations else 0
+            print(f"{stage:<8}{self.workers.get(stage, 1):>8}{self.busy[stage]:>10.1f}{mean:>10.2f}"
+                  f"{self.max_depth.get(previous[stage], 0):>11}")
+
+        print(f"Grading calls: {self.grade_calls}")
+        print(self.locator.resolver.report())
+        if self.grader.pregrader is not None:
+            print(self.grader.pregrader.report())
+        print(self.grader.usage_report())
+        print(self.locator.client.report())
+        print(self.grader.client.report())
+        for name, error in failed:
+            print(f"  FAILED {name}: {error}")
+        print(f"Output saved to: {output_json_path}")
+        if report_path:
+            print(f"Report saved to: {report_path}")
+        print(f"{'='*60}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Split, locate, grade and report a class in one streaming pass.")
+    parser.add_argument("input", nargs="?", default="initial_sample.csv", help="Answers CSV")
+    parser.add_argument("output", nargs="?", default="responses_graded.json", help="Graded JSON")
+    parser.add_argument("--report", default="grades_report.txt", help="Per-student grade report")
+    parser.add_argument("--split-workers", type=int, default=2)
+    parser.add_argument("--locate-workers", type=int, default=8)
+    parser.add_argument("--grade-workers", type=int, default=4)
+    parser.add_argument("--queue-size", type=int, default=16, help="Max students waiting between stages")
+    parser.add_argument("--batch-size", type=int, default=10, help="Responses per grading call")
+    parser.add_argument("--batch-wait", type=float, default=1.0,
+                        help="Seconds a partial grading batch waits for more responses")
+    parser.add_argument("--tokens-per-minute", type=int, default=200000)
+    args = parser.parse_args()
+
+    # One memory-mapped corpus shared by both stages
+    corpus = CorpusStore("Books")
+    pipeline = GradingPipeline(
+        locator=CitationFileLocator(books_directory="Books", api_key=key, corpus=corpus),
+        grader=CitationGrader(books_directory="Books", api_key=key, pregrader=PreGrader(), corpus=corpus),
+        question_prompts=QUESTION_PROMPTS,
+        split_workers=args.split_workers,
+        locate_workers=args.locate_workers,
+        grade_workers=args.grade_workers,
+        queue_size=args.queue_size,
+        batch_size=args.batch_size,
+        batch_wait=args.batch_wait,
+        tokens_per_minute=args.tokens_per_minute,
+    )
+    pipeline.run(args.input, args.output, report_path=args.report)
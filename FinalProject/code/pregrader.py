@@ -0,0 +1,106 @@
+import re
+import threading
+
+# Abbreviations common in student citations that end in a period but don't end a sentence
+ABBREVIATIONS = {'ch', 'chap', 'p', 'pp', 'pg', 'e.g', 'i.e', 'vs', 'al', 'etc', 'dr', 'mr', 'ms', 'mrs', 'no', 'vol', 'fig'}
+
+MARKER_PATTERN = re.compile(r"^\s*#?\d+\s*[:.)]\s*(?:(?:risk|mitigation)\s*:\s*)?", re.IGNORECASE)
+CITATION_PATTERN = re.compile(r"\b(?:citation|source|reference)s?\s*:", re.IGNORECASE)
+SENTENCE_END_PATTERN = re.compile(r"([.!?]+)[\"')\]]*\s+(?=[\"'(\[]?[A-Z0-9])")
+
+AI_TOOL_PATTERN = re.compile(r"\b(?:ai|chat\s*gpt|gpt[-\s]?\d*\w*|grok|claude|gemini|copilot|bard|llms?|perplexity)\b",
+                             re.IGNORECASE)
+NO_AI_PATTERN = re.compile(r"\b(?:did\s*not|didn'?t|do\s*not|don'?t|no|never|not|without|zero|none)\b[^.]{0,30}"
+                           r"\b(?:use|used|using|ai|assistance|help)\b"
+                           r"|\b(?:ai|used)\b[^.]{0,20}?[:\-]\s*(?:none|no|zero|n/?a)\b"
+                           r"|^\s*(?:none|n/?a|no)\s*\.?\s*$", re.IGNORECASE)
+USED_AI_PATTERN = re.compile(r"\b(?:i|we)\s+(?:used|use|asked|prompted|had)\b", re.IGNORECASE)
+# A quoted prompt, or "prompt:" followed by text
+EXACT_PROMPT_PATTERN = re.compile(r"[\"“”'‘][^\"“”]{15,}[\"“”'’]|\bprompt(?:ed)?\s*(?:was|of|:)", re.IGNORECASE)
+HOW_USED_PATTERN = re.compile(r"\b(?:to|for)\s+(?:help\s+)?(?:brainstorm|generate|check|proofread|find|identify|organi[sz]e|"
+                              r"summari[sz]e|rephrase|reword|outline|research|come up|refine|fix|edit|explain)\w*"
+                              r"|\b(?:asked|prompted|prompt)\b", re.IGNORECASE)
+
+
+def answer_body(text):
+    """The answer itself, without the '#N: Risk:' marker and the citation."""
+    body = MARKER_PATTERN.sub('', text or '', count=1)
+    return CITATION_PATTERN.split(body, maxsplit=1)[0].strip()
+
+
+def split_sentences(text):
+    """Split prose into sentences, treating 'Ch. 6' and 'e.g. X' style abbreviations as mid-sentence."""
+    sentences = []
+    start = 0
+    for match in SENTENCE_END_PATTERN.finditer(text):
+        words = text[start:match.start()].split()
+        last_word = words[-1].lower().rstrip('.') if words else ''
+        if match.group(1) == '.' and (last_word in ABBREVIATIONS or len(last_word) == 1):
+            continue
+        sentences.append(text[start:match.end()].strip())
+        start = match.end()
+    if text[start:].strip():
+        sentences.append(text[start:].strip())
+    return sentences
+
+
+def ai_usage_deduction(statement):
+    """
+    The question-level AI usage deduction, or None when the statement needs a human (or LLM) read.
+
+    Returns:
+        Tuple[int, str] of (points, justification)
+    """
+    statement = (statement or '').strip()
+    if not statement:
+        return -2, "-2: did not state whether AI was used"
+    if NO_AI_PATTERN.search(statement):
+        # "No AI used" is a complete statement; "I used X but not for ..." is ambiguous
+        return (0, "0: stated no AI was used") if not USED_AI_PATTERN.search(statement) else None
+    if not AI_TOOL_PATTERN.search(statement) or not USED_AI_PATTERN.search(statement):
+        # No tool, or no "I used/asked/...": too loose to deduct for
+        return None
+    if EXACT_PROMPT_PATTERN.search(statement):
+        return 0, "0: AI use explained with exact prompt"
+    if HOW_USED_PATTERN.search(statement):
+        return -1, "-1: AI use explained without exact prompt"
+    return -2, "-2: stated AI use without explaining how"
+
+
+class PreGrader:
+    def __init__(self, grade_short_answers=True):
+        """
+        Applies the purely mechanical rubric rules locally so those responses skip the LLM.
+
+        Args:
+            grade_short_answers: Give 1-2 sentence answers 4 points locally. The LLM would
+                also check their citation, so turn this off to keep that check.
+        """
+        self.grade_short_answers = grade_short_answers
+        self.stats = {'empty': 0, 'short': 0, 'llm': 0}
+        self.lock = threading.Lock()
+
+    def grade(self, response_text):
+        """
+        Grade a response if a mechanical rule decides it.
+
+        Returns:
+            'points|justification' (same format as the LLM grader), or None if it needs the LLM
+        """
+        body = answer_body(response_text)
+        if not body:
+            tier, grade = 'empty', "0|0: answer missing"
+        elif self.grade_short_answers and len(split_sentences(body)) <= 2:
+            tier, grade = 'short', "4|4: only 1-2 sentences"
+        else:
+            tier, grade = 'llm', None
+        with self.lock:
+            self.stats[tier] += 1
+        return grade
+
+    def report(self):
+        local = self.stats['empty'] + self.stats['short']
+        total = local + self.stats['llm']
+        share = local / total if total else 0
+        return (f"Pre-graded locally: {local}/{total} ({share:.0%}): {self.stats['empty']} empty, "
+                f"{self.stats['short']} 1-2 sentences; {self.stats['llm']} sent to the LLM")
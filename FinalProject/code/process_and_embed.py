@@ -1,54 +1,74 @@
 import os
+import json
+import numpy as np
 import pandas as pd
-from sentence_transformers import SentenceTransformer
-import torch
 from datetime import datetime
 import re
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'shared'))
+from corpus_store import CorpusStore
+from encoders import DEFAULT_BACKEND
 
-def load_books(books_dir="Books"):
+MODEL_NAME = 'all-MiniLM-L6-v2'
+META_COLUMNS = ['book', 'chapter', 'filename', 'chunk_id', 'text', 'path']
+
+
+def store_paths(output_dir="embeddings"):
+    """
+    Where the embedding store lives: a float32 .npy matrix, one metadata row per
+    chunk, and the manifest of files they were made from. These are the same files
+    PassageIndex memory-maps, so the grader always sees the latest ingestion.
+    """
+    base = os.path.join(output_dir, "course_readings")
+    return f"{base}.npy", f"{base}_meta.csv", f"{base}_manifest.json"
+
+
+def book_chapters(corpus):
+    """
+    The corpus entries laid out as Books/<book>/<chapter>.txt.
+
+    Returns:
+        Dict of 'Book-Folder/file.txt' -> corpus entry (with 'sha256' of the file)
+    """
+    chapters = {}
+    for entry in corpus.files:
+        parts = entry['path'].split(os.sep)
+        if len(parts) == 2:
+            chapters['/'.join(parts)] = entry
+    return chapters
+
+
+def chapter_rows(path, content):
+    """One row per chunk of a chapter, in reading order."""
+    book_folder, filename = path.split('/')
+    # Clean up book name (e.g., "Mythical-Man-Month" -> "Mythical Man-Month")
+    book_name = book_folder.replace("-", " ")
+    # e.g., "chapter-5-about-management.txt" -> "Chapter 5 About Management"
+    chapter_info = extract_chapter_info(filename)
+    return [{
+        'book': book_name,
+        'chapter': chapter_info,
+        'filename': filename,
+        'chunk_id': i,
+        'text': chunk.strip(),
+        'path': path,
+    } for i, chunk in enumerate(chunk_text(content))]
+
+
+def load_books(books_dir="Books", corpus=None):
     """
     Load all book files from the directory structure.
     Expected structure: Books/Book-Name/chapter-*.txt
     Returns a DataFrame with text chunks, source book, and chapter info.
     """
+    corpus = corpus if corpus is not None else CorpusStore(books_dir)
     data = []
-    
-    for book_folder in os.listdir(books_dir):
-        book_path = os.path.join(books_dir, book_folder)
-        if not os.path.isdir(book_path):
-            continue
-        
-        # Clean up book name (e.g., "Mythical-Man-Month" -> "Mythical Man-Month")
-        book_name = book_folder.replace("-", " ")
-        
-        for file in os.listdir(book_path):
-            if file.endswith(".txt"):
-                file_path = os.path.join(book_path, file)
-                
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                    
-                    # Extract chapter/section info from filename
-                    # e.g., "chapter-5-about-management.txt" -> "Chapter 5: About Management"
-                    chapter_info = extract_chapter_info(file)
-                    
-                    # Split content into meaningful chunks (by paragraphs)
-                    chunks = chunk_text(content)
-                    
-                    for i, chunk in enumerate(chunks):
-                        data.append({
-                            'book': book_name,
-                            'chapter': chapter_info,
-                            'filename': file,
-                            'chunk_id': i,
-                            'text': chunk.strip()
-                        })
-                
-                except Exception as e:
-                    print(f"Error processing {file_path}: {e}")
-    
-    return pd.DataFrame(data)
+    for path in book_chapters(corpus):
+        try:
+            data.extend(chapter_rows(path, corpus.text(path)))
+        except Exception as e:
+            print(f"Error processing {os.path.join(books_dir, path)}: {e}")
+    return pd.DataFrame(data, columns=META_COLUMNS)
 
 def extract_chapter_info(filename):
     """Extract chapter information from filename."""
@@ -90,52 +110,163 @@ def chunk_text(text, min_chunk_size=100):
     
     return chunks
 
-def generate_embeddings(output_dir="embeddings"):
+def load_store(output_dir="embeddings", model_name=MODEL_NAME, backend=None):
     """
-    Generate and save embeddings for all book texts.
+    Load the embedding store and its manifest.
+
+    Returns:
+        (meta DataFrame, embeddings, manifest dict); empty if there is no usable store
+        (none yet, made with another model or encoder backend, or its files don't match each other)
     """
-    try:
-        os.makedirs(output_dir, exist_ok=True)
-        
-        print("Loading books from directory...")
-        df = load_books("Books")
-        
-        if df.empty:
-            print("No books found. Check your Books directory structure.")
-            return
-        
-        print(f"Loaded {len(df)} text chunks from {df['book'].nunique()} books")
-        print(f"Books: {', '.join(df['book'].unique())}")
-        
-        # Initialize the sentence transformer model
-        print("\nInitializing embedding model...")
-        model = SentenceTransformer('all-MiniLM-L6-v2')
-        
-        # Move model to GPU if available
-        if torch.cuda.is_available():
-            model = model.to('cuda')
-            print("Using GPU for encoding")
-        else:
-            print("Using CPU for encoding")
-        
-        # Generate embeddings
-        print("\nGenerating embeddings...")
-        texts = df['text'].tolist()
-        embeddings = model.encode(
-            texts,
+    backend = backend or DEFAULT_BACKEND
+    npy_path, meta_path, manifest_path = store_paths(output_dir)
+    empty = (pd.DataFrame(columns=META_COLUMNS), None, {})
+    if not all(os.path.exists(p) for p in (npy_path, meta_path, manifest_path)):
+        return empty
+
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    meta = pd.read_csv(meta_path, keep_default_na=False)
+    # Read it all rather than memory-mapping, so the file can be replaced on Windows
+    embeddings = np.load(npy_path)
+    # Stores from before the backend was recorded were all made with torch
+    if (manifest.get('model') != model_name or manifest.get('backend', 'torch') != backend
+            or 'path' not in meta.columns or len(meta) != len(embeddings)):
+        print("Embedding store doesn't match its manifest, model or backend; rebuilding it")
+        return empty
+    return meta, embeddings, manifest
+
+
+def save_store(meta, embeddings, manifest, output_dir="embeddings"):
+    """Replace the store's files; the manifest goes last, so a crash only means redoing those files."""
+    npy_path, meta_path, manifest_path = store_paths(output_dir)
+    with open(f"{npy_path}.tmp", 'wb') as f:
+        np.save(f, embeddings)
+    meta.to_csv(f"{meta_path}.tmp", index=False)
+    with open(f"{manifest_path}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(f"{meta_path}.tmp", meta_path)
+    os.replace(f"{npy_path}.tmp", npy_path)
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+
+
+def load_model(model_name=MODEL_NAME, backend=None):
+    """
+    The sentence encoder (imported only when something needs embedding): torch on the GPU if
+    there is one, or the ONNX / int8 ONNX CPU backend when backend or $EMBEDDING_BACKEND says so.
+    """
+    from encoders import load_encoder
+
+    backend = backend or DEFAULT_BACKEND
+    print(f"\nInitializing embedding model ({backend})...")
+    return load_encoder(model_name, backend=backend)
+
+
+def update_embeddings(books_dir="Books", output_dir="embeddings", model_name=MODEL_NAME, corpus=None,
+                      rebuild=False, backend=None):
+    """
+    Bring the embedding store up to date with the Books directory.
+
+    The chapters come from the packed corpus, which only re-reads files whose size or
+    mtime changed (on a thread pool) and keeps each one's content hash. Only chapters
+    that are new or whose hash differs from the manifest are re-chunked and
+    re-embedded. Their old rows are dropped, as are the rows of deleted files, and
+    every other row keeps its embedding.
+
+    Args:
+        books_dir: Books/<book>/<chapter>.txt
+        output_dir: Where the store lives
+        model_name: Sentence transformer; changing it re-embeds everything
+        corpus: CorpusStore of books_dir (opened here if not given)
+        rebuild: Ignore the existing store and embed everything
+        backend: Encoder backend (see encoders.py); changing it re-embeds everything too
+
+    Returns:
+        Dict of counts: added, changed, removed, unchanged files and chunks embedded
+    """
+    backend = backend or DEFAULT_BACKEND
+    os.makedirs(output_dir, exist_ok=True)
+    if rebuild:
+        meta, embeddings, manifest = pd.DataFrame(columns=META_COLUMNS), None, {}
+    else:
+        meta, embeddings, manifest = load_store(output_dir, model_name, backend)
+    known = manifest.get('files', {})
+
+    print("Scanning books directory...")
+    corpus = corpus if corpus is not None else CorpusStore(books_dir)
+    files = book_chapters(corpus)
+
+    entries, new_rows = {}, []
+    stats = {'added': 0, 'changed': 0, 'removed': len(set(known) - set(files)), 'unchanged': 0}
+    for path, info in files.items():
+        if path in known and known[path]['sha256'] == info['sha256']:
+            entries[path] = known[path]
+            stats['unchanged'] += 1
+            continue
+        try:
+            rows = chapter_rows(path, corpus.text(path))
+        except Exception as e:
+            print(f"Error processing {os.path.join(books_dir, path)}: {e}")
+            # Keep whatever the store had
+            if path in known:
+                entries[path] = known[path]
+            continue
+        entries[path] = {'sha256': info['sha256'], 'chunks': len(rows)}
+        stats['changed' if path in known else 'added'] += 1
+        new_rows.extend(rows)
+
+    # Keep the rows of every file that is still there and wasn't re-chunked
+    rechunked = {row['path'] for row in new_rows}
+    keep = (meta['path'].isin(entries) & ~meta['path'].isin(rechunked)).to_numpy()
+    meta = meta[keep]
+    kept_embeddings = embeddings[keep] if embeddings is not None else None
+
+    print(f"{stats['added']} added, {stats['changed']} changed, {stats['removed']} removed, "
+          f"{stats['unchanged']} unchanged chapter files")
+    stats['embedded'] = len(new_rows)
+    if not new_rows and embeddings is None:
+        return stats
+    if not new_rows and stats['removed'] == 0 and embeddings is not None:
+        print("Embedding store is up to date")
+        return stats
+
+    if new_rows:
+        print(f"\nGenerating embeddings for {len(new_rows)} chunks...")
+        model = load_model(model_name, backend)
+        new_embeddings = model.encode(
+            [row['text'] for row in new_rows],
             batch_size=32,
             show_progress_bar=True,
             convert_to_numpy=True,
             normalize_embeddings=True
-        )
+        ).astype(np.float32)
+        parts = [kept_embeddings, new_embeddings] if kept_embeddings is not None else [new_embeddings]
+        embeddings = np.vstack(parts)
+        meta = pd.concat([meta, pd.DataFrame(new_rows, columns=meta.columns)], ignore_index=True)
+    else:
+        embeddings = kept_embeddings
+        meta = meta.reset_index(drop=True)
+
+    save_store(meta, embeddings, {'model': model_name, 'backend': backend, 'files': entries}, output_dir)
+    return stats
+
+
+def generate_embeddings(output_dir="embeddings", books_dir="Books", rebuild=False):
+    """
+    Generate and save embeddings for all book texts, re-embedding only what changed.
+    """
+    try:
+        stats = update_embeddings(books_dir, output_dir, rebuild=rebuild)
         
-        df['embedding'] = [emb.tolist() for emb in embeddings]
+        meta_path = store_paths(output_dir)[1]
+        if not os.path.exists(meta_path):
+            print("No books found. Check your Books directory structure.")
+            return
         
-        # Save to CSV
-        output_file = os.path.join(output_dir, "course_readings.csv")
-        df.to_csv(output_file, index=False)
-        print(f"\nEmbeddings saved to '{output_file}'")
-        print(f"Total chunks: {len(df)}")
+        meta = pd.read_csv(meta_path, keep_default_na=False)
+        print(f"\nEmbeddings saved to '{output_dir}' ({stats['embedded']} chunks embedded this run)")
+        print(f"Total chunks: {len(meta)} from {meta['book'].nunique()} books")
+        print(f"Books: {', '.join(meta['book'].unique())}")
         
     except Exception as e:
         print(f"An error occurred: {e}")
@@ -145,6 +276,7 @@ if __name__ == "__main__":
     print("=" * 60)
     print(f"Start time: {datetime.now().strftime('%H:%M:%S')}")
     
+    # generate_embeddings(rebuild=True) re-embeds the whole library
     generate_embeddings()
     
     print(f"End time: {datetime.now().strftime('%H:%M:%S')}")
\ No newline at end of file
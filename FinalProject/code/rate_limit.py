@@ -0,0 +1,41 @@
+import threading
+import time
+from collections import deque
+
+
+class TokenRateLimiter:
+    def __init__(self, tokens_per_minute):
+        """
+        Sliding-window tokens-per-minute budget shared by worker threads.
+
+        Args:
+            tokens_per_minute: Max tokens to spend in any 60 second window (None = unlimited)
+        """
+        self.tokens_per_minute = tokens_per_minute
+        self.window = deque()  # (timestamp, tokens)
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens):
+        """Block until `tokens` fit in the budget, then reserve them."""
+        if not self.tokens_per_minute:
+            return
+        # A single request larger than the budget would otherwise wait forever
+        tokens = min(tokens, self.tokens_per_minute)
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                while self.window and now - self.window[0][0] >= 60:
+                    self.used -= self.window.popleft()[1]
+                if self.used + tokens <= self.tokens_per_minute:
+                    self.window.append((now, tokens))
+                    self.used += tokens
+                    return
+                wait = 60 - (now - self.window[0][0])
+            time.sleep(wait)
+
+
+def estimate_tokens(text):
+    """Rough token count (about 4 characters per token for English)."""
+    return len(text) // 4 + 1
@@ -1,45 +1,168 @@
 # -*- coding: utf-8 -*-
 
+import argparse
+import csv
 import json
-from openai import OpenAI
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from secrets import OPENAPI_API_KEY as key
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'shared'))
+from llm_client import LLMClient
+from pregrader import AI_TOOL_PATTERN, CITATION_PATTERN
 
 OPENAI_API_KEY = key
-client = OpenAI(api_key=OPENAI_API_KEY)
+client = LLMClient(api_key=OPENAI_API_KEY)
 
-def get_clean_json():
-    prompt = """
-        You are splitting student answers for a midterm. 
-        The current format is in csv but I need you to output it in json. The current format is: Student,Question 1,Question 2,Question 3,Question 4,Question 5 
+EXPECTED_PARTS = 5
+AI_USAGE_HEADING_PATTERN = re.compile(r"\bAI\s+usage\s*[:\-]", re.IGNORECASE)
+
+SPLIT_PROMPT = """
+        You are splitting student answers for a midterm.
+        The answers are given as a JSON list with one object per student: {{"Student": name, {question_list}}}.
         You need to convert it into json with this format:
 
-        {
+        {{
         "Students": [
-            {
+            {{
             "Student": "name",
-            "Question 1": {
+            "Question 1": {{
                 "Risk/mitigation 1": "...",
                 "Risk/mitigation 2": "...",
                 "Risk/mitigation 3": "...",
                 "Risk/mitigation 4": "...",
                 "Risk/mitigation 5": "...",
                 "AI usage": ""
-            }
-        }
+            }}
+        }}
         ...
         ]
-        }
+        }}
 
+        Keep the students in the same order, one entry per student.
         If a student does not mention AI for any of the questions, leave it as "".
         Do not change ANY content from the student.
 
         Final answer: only valid JSON
 
         Student responses:
-        "sample","#1: Risk: Toolchain inconsistencies in hybrid setups leading to deployment failures. With team members using varying DevOps tools like Kubernetes vs. Docker Compose, integration errors could arise during containerization, delaying the ERP refactor and amplifying downtime risks. Citation: DeMarco & Lister, Peopleware, Ch. 5 (discusses how mismatched environments erode productivity and foster "flow" interruptions) #2: Mitigation: Standardize tooling through team training sessions. Form a subgroup to enforce unified tools and conduct workshops, ensuring compatibility in CI/CD pipelines to streamline migrations and patches. Citation: Lecture on Team Dynamics (Knutson podcast #4), emphasizing sociological alignment in ambiguous tech stacks #3: Risk: Security vulnerabilities from third-party libraries post-exploit. The urgent patch could introduce regressions in AI analytics if not thoroughly tested, potentially exposing supply chain data in a high-stakes enterprise system. Citation: Brooks, The Mythical Man-Month, Ch. 6 (highlights the challenges of system integration and unforeseen bugs in complex additions like patches) #4: Mitigation: Implement incremental rollouts with monitoring. Deploy changes in stages, using feedback loops to catch issues early from the cyber incident, balancing speed with robustness. Citation: Brooks, The Mythical Man-Month, Ch. 7 (advocates for incremental planning and safeguards against complexities in large-scale projects) #5: Risk: Requirements creep from business units without assessments. Adding custom dashboards mid-refactor could inflate scope, straining resources already diverted by the security incident and executive pressures. Citation: DeMarco & Lister, Peopleware, Ch. 3 (warns about managerial pressures that lead to unchecked interruptions and scope expansion) AI usage: I used Grok with the prompt “Give me a list of risks that cloud-native refactors could have involving security incidents.” I then built off this list and combined with the preliminary ideas to ensure I covered everything we talked about in class."
+        {students}
         """
 
-    response = client.chat.completions.create(
+
+def _parse_record(text, num_columns):
+    """One CSV record, or None if it isn't complete yet (a quoted field continues on the next line)."""
+    rows = list(csv.reader([text]))
+    if len(rows) == 1 and len(rows[0]) == num_columns:
+        return rows[0]
+    # Exported answers contain unescaped quotes (foster "flow" interruptions), which throws
+    # the csv module's column count off; fall back to splitting on the "," between fields
+    stripped = text.strip()
+    if stripped.startswith('"') and stripped.endswith('"'):
+        fields = stripped[1:-1].split('","')
+        if len(fields) == num_columns:
+            return fields
+    return None
+
+
+def read_student_rows(csv_path):
+    """
+    Stream student rows from the answers CSV one at a time.
+
+    Yields:
+        (question_keys, {"Student": name, "Question 1": answer, ...}) per student
+    """
+    with open(csv_path, 'r', encoding='utf-8', newline='') as f:
+        header = next(csv.reader([f.readline()]))
+        question_keys = header[1:]
+        pending, start_line = '', 2
+        for line_num, line in enumerate(f, 2):
+            if not pending and not line.strip():
+                start_line = line_num + 1
+                continue
+            pending += line
+            fields = _parse_record(pending, len(header))
+            if fields is None:
+                continue
+            yield question_keys, dict(zip(['Student'] + question_keys, fields))
+            pending, start_line = '', line_num + 1
+        if pending.strip():
+            raise ValueError(f"Could not parse the CSV record starting at line {start_line} of {csv_path}")
+
+
+def split_answer_locally(answer, expected_parts=EXPECTED_PARTS):
+    """
+    Split one answer on its '#N:' markers and 'AI usage:' heading, the way the model would.
+
+    Returns:
+        {"Risk/mitigation 1": ..., ..., "AI usage": ...}, or None when the answer doesn't
+        clearly follow that structure and should go to the model instead
+    """
+    answer = (answer or '').strip()
+    if not answer:
+        question = {f"Risk/mitigation {n}": "" for n in range(1, expected_parts + 1)}
+        question["AI usage"] = ""
+        return question
+
+    # Each marker must appear, in order, after the previous one ('podcast #4)' isn't a marker)
+    starts = []
+    position = 0
+    for n in range(1, expected_parts + 1):
+        match = re.compile(rf"(?:^|\s)(#{n}\s*:)").search(answer, position)
+        if match is None:
+            return None
+        starts.append(match.start(1))
+        position = match.end(1)
+    if answer[:starts[0]].strip() or re.search(rf"(?:^|\s)#{expected_parts + 1}\s*:", answer[position:]):
+        return None
+
+    # The AI usage heading, if any, comes after the last part
+    headings = list(AI_USAGE_HEADING_PATTERN.finditer(answer, starts[-1]))
+    ai_usage = ""
+    end = len(answer)
+    if headings:
+        end = headings[-1].start()
+        ai_usage = answer[headings[-1].end():].strip()
+    else:
+        # No heading: an AI statement after the last citation would be missed
+        last_citation = list(CITATION_PATTERN.finditer(answer, starts[-1]))
+        if last_citation and AI_TOOL_PATTERN.search(answer, last_citation[-1].end()):
+            return None
+
+    bounds = starts + [end]
+    question = {}
+    for n in range(expected_parts):
+        part = answer[bounds[n]:bounds[n + 1]].strip()
+        if len(part) <= len(f"#{n + 1}:"):
+            return None
+        question[f"Risk/mitigation {n + 1}"] = part
+    question["AI usage"] = ai_usage
+    return question
+
+
+def split_row_locally(row, question_keys):
+    """The student's JSON entry if every question splits locally and validates, else None."""
+    student = {"Student": row['Student']}
+    for question_key in question_keys:
+        question = split_answer_locally(row.get(question_key))
+        if question is None:
+            return None
+        student[question_key] = question
+    if validate_chunk({"Students": [student]}, [row], question_keys):
+        return None
+    return student
+
+
+def get_clean_json(students, question_keys, llm_client=None):
+    """Ask the model to split one chunk of students. Returns the raw JSON text."""
+    question_list = ", ".join(f'"{q}": answer' for q in question_keys)
+    prompt = SPLIT_PROMPT.format(question_list=question_list,
+                                 students=json.dumps(students, ensure_ascii=False, indent=1))
+
+    response = (llm_client or client).chat.completions.create(
+        call_site='get_clean_json',
         model="gpt-5-mini",
         messages=[
             {"role": "system", "content": "You return ONLY valid JSON. No markdown, no commentary."},
@@ -54,16 +177,173 @@ def get_clean_json():
 
     return raw
 
-json_text = get_clean_json()
 
-try:
-    data = json.loads(json_text)
-except json.JSONDecodeError as e:
-    print("JSON was invalid. Here's the raw output so you can inspect it:")
-    print(json_text)
-    raise e
+def _comparable(text):
+    """Whitespace and quote style don't count as changing a student's content."""
+    return " ".join(re.sub(r"[\"“”]", "", text or "").split())
+
+
+def validate_chunk(data, students, question_keys):
+    """
+    Check a chunk's JSON against the expected Students/Question schema.
+
+    Args:
+        data: The parsed model output
+        students: The chunk's input rows, in order
+        question_keys: Question columns from the CSV header
+
+    Returns:
+        List[str] of problems (empty if the chunk is valid)
+    """
+    if not isinstance(data, dict) or not isinstance(data.get('Students'), list):
+        return ['top level must be {"Students": [...]}']
+    if len(data['Students']) != len(students):
+        return [f"expected {len(students)} students, got {len(data['Students'])}"]
+
+    problems = []
+    for row, student in zip(students, data['Students']):
+        name = row['Student']
+        if not isinstance(student, dict) or student.get('Student') != name:
+            problems.append(f"expected student {name!r} at this position")
+            continue
+        for question_key in question_keys:
+            question = student.get(question_key)
+            if not isinstance(question, dict):
+                problems.append(f"{name}: {question_key} missing or not an object")
+                continue
+            if 'Risk/mitigation 1' not in question or 'AI usage' not in question:
+                problems.append(f"{name}: {question_key} needs 'Risk/mitigation N' and 'AI usage' fields")
+            original = _comparable(row.get(question_key))
+            for field_name, value in question.items():
+                if not isinstance(value, str):
+                    problems.append(f"{name}: {question_key} {field_name} is not a string")
+                elif _comparable(value) not in original:
+                    problems.append(f"{name}: {question_key} {field_name} changed the student's text")
+    return problems
+
+
+def split_chunk(students, question_keys, max_retries=2, llm_client=None):
+    """
+    Split one chunk of students, retrying until its JSON is valid.
+
+    Returns:
+        (student dicts or None if every attempt failed, attempts used, last problems)
+    """
+    problems = []
+    for attempt in range(1, max_retries + 2):
+        try:
+            data = json.loads(get_clean_json(students, question_keys, llm_client))
+            problems = validate_chunk(data, students, question_keys)
+        except json.JSONDecodeError as e:
+            problems = [f"invalid JSON: {e}"]
+        except Exception as e:
+            problems = [f"request failed: {e}"]
+        if not problems:
+            return data['Students'], attempt, []
+    return None, max_retries + 1, problems
+
+
+def split_csv(csv_path, output_path, chunk_size=5, max_workers=8, max_retries=2, llm_client=None):
+    """
+    Convert the answers CSV to the grading JSON, a few students per API call.
+
+    Rows are streamed from the CSV and split locally on their '#N:' / 'AI usage:' markers.
+    Rows that don't clearly follow that structure are batched into chunks of chunk_size
+    students for the model; up to max_workers chunks are split at once, and the results
+    are merged back in CSV order.
+
+    Args:
+        csv_path: The exported answers CSV (Student, Question 1, ...)
+        output_path: Where to write {"Students": [...]}
+        chunk_size: Students per API call
+        max_workers: Max chunks being split at the same time
+        max_retries: Extra attempts for a chunk whose JSON doesn't validate
+        llm_client: LLMClient to split with (defaults to the module's client)
+
+    Returns:
+        (data, failed student names)
+    """
+    start = time.perf_counter()
+    results = {}  # row index -> student dict
+    failed = []
+    retries = 0
+    num_students = 0
+    split_local = 0
+
+    def collect(done):
+        nonlocal retries
+        for future in done:
+            chunk_idx, row_indices, students = pending.pop(future)
+            split, attempts, problems = future.result()
+            retries += attempts - 1
+            if split is None:
+                names = [row['Student'] for row in students]
+                failed.extend(names)
+                print(f"  Chunk {chunk_idx + 1} failed after {attempts} attempts ({', '.join(names)}): {problems[:3]}")
+            else:
+                results.update(zip(row_indices, split))
+                print(f"  Chunk {chunk_idx + 1} done ({len(split)} students, {attempts} attempt(s))")
+
+    pending = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        chunk, row_indices, chunk_idx = [], [], 0
+
+        def submit():
+            future = executor.submit(split_chunk, chunk, question_keys, max_retries, llm_client)
+            pending[future] = (chunk_idx, row_indices, chunk)
+
+        for row_idx, (question_keys, row) in enumerate(read_student_rows(csv_path)):
+            num_students += 1
+            student = split_row_locally(row, question_keys)
+            if student is not None:
+                results[row_idx] = student
+                split_local += 1
+                continue
+            chunk.append(row)
+            row_indices.append(row_idx)
+            if len(chunk) < chunk_size:
+                continue
+            submit()
+            chunk, row_indices, chunk_idx = [], [], chunk_idx + 1
+            # Keep reading only while there's room, so a huge CSV never sits in memory at once
+            while len(pending) >= max_workers * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+        if chunk:
+            submit()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            collect(done)
+
+    data = {"Students": [results[idx] for idx in sorted(results)]}
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=4)
+    os.replace(tmp_path, output_path)
+
+    elapsed = time.perf_counter() - start
+    print(f"\n{'='*60}")
+    print(f"Split {num_students - len(failed)}/{num_students} students in {elapsed:.1f}s "
+          f"({num_students / elapsed if elapsed else 0:.1f} students/s, {retries} chunk retries)")
+    print(f"Split locally: {split_local}, sent to the model: {num_students - split_local}")
+    if failed:
+        print(f"Failed (not in output): {', '.join(failed)}")
+    print(f"Saved {output_path}")
+    print((llm_client or client).report())
+    print(f"{'='*60}")
+    return data, failed
+
 
-with open("example.json", "w") as f:
-    json.dump(data, f, indent=4)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Split the answers CSV into per-part grading JSON.")
+    parser.add_argument("input", nargs="?", default="initial_sample.csv", help="Answers CSV")
+    parser.add_argument("output", nargs="?", default="example.json", help="Output JSON")
+    parser.add_argument("--chunk-size", type=int, default=5, help="Students per API call")
+    parser.add_argument("--workers", type=int, default=8, help="Max concurrent API calls")
+    parser.add_argument("--retries", type=int, default=2, help="Extra attempts for a chunk that fails validation")
+    args = parser.parse_args()
 
-print("Saved example.json")
+    _, failed = split_csv(args.input, args.output, chunk_size=args.chunk_size,
+                          max_workers=args.workers, max_retries=args.retries)
+    if failed:
+        raise SystemExit(1)
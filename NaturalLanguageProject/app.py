@@ -1,7 +1,12 @@
 import sqlite3
 import os
-from openai import OpenAI
+import re
+import sys
+from collections import deque
 from secrets import OPENAPI_API_KEY as key
+from fast_path import TemplateMatcher
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shared'))
+from llm_client import LLMClient
 
 # Load environment variables from .env
 
@@ -10,8 +15,8 @@ OPENAI_API_KEY = key
 # Quick check
 print("API Key loaded:", OPENAI_API_KEY is not None)
 
-#initialize GPT client
-client = OpenAI(api_key=OPENAI_API_KEY)
+#initialize GPT client (times and prices every call)
+client = LLMClient(api_key=OPENAI_API_KEY)
 
 # Connect to SQLite database
 conn = sqlite3.connect("university.db")
@@ -19,6 +24,178 @@ cursor = conn.cursor()
 
 print("Connected to database!")
 
+#words that show up in too many columns to say anything about the question
+GENERIC_WORDS = {'id', 'name', 'type', 'count', 'to', 'of'}
+
+#question words that point at a table without naming it
+TABLE_SYNONYMS = {
+    'who': 'Person',
+    'people': 'Person',
+    'someone': 'Person',
+    'work': 'Person',
+    'works': 'Person',
+    'member': 'Person',
+    'office': 'Room',
+}
+
+def split_identifier(identifier):
+    """Split a camelCase/PascalCase identifier into lowercase words."""
+    return [w.lower() for w in re.findall(r'[A-Z]?[a-z]+|[A-Z]+(?![a-z])|\d+', identifier)]
+
+def normalize_word(word):
+    """Crude singular form so 'labs' matches 'lab'."""
+    word = word.lower()
+    if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+        return word[:-1]
+    return word
+
+#load the schema straight from the database so it never drifts from setup_database.sql
+def load_schema(cursor):
+    """
+    Introspect every table from sqlite_master and PRAGMA table_info/foreign_key_list.
+
+    Returns:
+        Dict[table_name] -> {'columns': [...], 'foreign_keys': [...], 'keywords': set, 'is_link_table': bool}
+    """
+    schema_info = {}
+    cursor.execute("SELECT name, sql FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")
+    for table_name, create_sql in cursor.fetchall():
+        # CHECK(col IN ('a','b')) constraints are only visible in the CREATE statement
+        checks = {}
+        for col, values in re.findall(r"CHECK\s*\(\s*(\w+)\s+IN\s*\(([^)]*)\)\s*\)", create_sql or '', re.IGNORECASE):
+            checks[col] = values.strip()
+
+        foreign_keys = []
+        # PRAGMA lists foreign keys last-declared first
+        for row in reversed(cursor.execute(f"PRAGMA foreign_key_list('{table_name}')").fetchall()):
+            foreign_keys.append({'column': row[3], 'table': row[2], 'ref_column': row[4]})
+        fk_columns = {fk['column'] for fk in foreign_keys}
+
+        columns = []
+        for _, col_name, col_type, notnull, _, pk in cursor.execute(f"PRAGMA table_info('{table_name}')").fetchall():
+            columns.append({
+                'name': col_name,
+                'type': col_type,
+                'notnull': bool(notnull),
+                'pk': pk,
+                'check': checks.get(col_name),
+                'is_fk': col_name in fk_columns,
+            })
+
+        # Words a question might use to refer to this table
+        keywords = set(split_identifier(table_name))
+        for column in columns:
+            if column['is_fk']:
+                continue
+            keywords.update(split_identifier(column['name']))
+            if column['check']:
+                for value in re.findall(r"'([^']*)'", column['check']):
+                    keywords.update(split_identifier(value))
+        keywords = {normalize_word(w) for w in keywords} - GENERIC_WORDS
+
+        schema_info[table_name] = {
+            'columns': columns,
+            'foreign_keys': foreign_keys,
+            'keywords': keywords,
+            # junction tables (e.g. PersonToLab) are only reached through joins
+            'is_link_table': all(c['is_fk'] for c in columns),
+        }
+
+    return schema_info
+
+def _fk_neighbors(schema_info):
+    """Undirected adjacency between tables linked by a foreign key."""
+    neighbors = {table: set() for table in schema_info}
+    for table, info in schema_info.items():
+        for fk in info['foreign_keys']:
+            if fk['table'] in neighbors:
+                neighbors[table].add(fk['table'])
+                neighbors[fk['table']].add(table)
+    return neighbors
+
+def _join_path(schema_info, neighbors, sources, target):
+    """
+    Shortest chain of tables from any table in sources to target (BFS).
+    Link tables are tried first so many-to-many joins go through them.
+    """
+    queue = deque([(s, [s]) for s in sources])
+    seen = set(sources)
+    while queue:
+        table, path = queue.popleft()
+        if table == target:
+            return path
+        for nxt in sorted(neighbors[table], key=lambda t: (not schema_info[t]['is_link_table'], t)):
+            if nxt not in seen:
+                seen.add(nxt)
+                queue.append((nxt, path + [nxt]))
+    return [target]
+
+def select_relevant_tables(question, schema_info):
+    """
+    Pick the tables a question mentions, plus the tables needed to join them.
+
+    Returns:
+        Tuple[matched_tables, join_tables] where join_tables only supply keys
+    """
+    words = {normalize_word(w) for w in re.findall(r"[A-Za-z]+", question)}
+
+    matched = []
+    for table, info in schema_info.items():
+        if info['is_link_table']:
+            continue
+        if words & info['keywords'] or any(TABLE_SYNONYMS.get(w) == table for w in words):
+            matched.append(table)
+
+    if not matched:
+        # Nothing recognizable, so let GPT see everything
+        return list(schema_info), []
+
+    # Foreign key closure: connect every matched table to the ones before it
+    neighbors = _fk_neighbors(schema_info)
+    selected = [matched[0]]
+    for table in matched[1:]:
+        for step in _join_path(schema_info, neighbors, selected, table):
+            if step not in selected:
+                selected.append(step)
+
+    join_tables = [t for t in selected if t not in matched]
+    return matched, join_tables
+
+def format_schema(schema_info, matched_tables, join_tables=()):
+    """Render the selected tables as compact CREATE-style text for the prompt."""
+    included = set(matched_tables) | set(join_tables)
+    blocks = []
+    for table, info in schema_info.items():
+        if table not in included:
+            continue
+        fk_targets = {fk['column']: fk['table'] for fk in info['foreign_keys']}
+        lines = []
+        for column in info['columns']:
+            # Join-only tables just need the keys that reach other included tables
+            if table in join_tables and not (column['pk'] or fk_targets.get(column['name']) in included):
+                continue
+            line = f"    {column['name']} {column['type']}"
+            if column['pk'] and sum(1 for c in info['columns'] if c['pk']) == 1:
+                line += " PRIMARY KEY"
+            if column['notnull']:
+                line += " NOT NULL"
+            if column['check']:
+                line += f" CHECK({column['name']} IN ({column['check']}))"
+            lines.append(line)
+        for fk in info['foreign_keys']:
+            if fk['table'] in included:
+                lines.append(f"    FOREIGN KEY({fk['column']}) REFERENCES {fk['table']}({fk['ref_column']})")
+        pk_columns = [c['name'] for c in sorted(info['columns'], key=lambda c: c['pk']) if c['pk']]
+        if len(pk_columns) > 1:
+            lines.append(f"    PRIMARY KEY({', '.join(pk_columns)})")
+        blocks.append(f"{table} (\n" + ",\n".join(lines) + "\n)")
+    return "\n\n".join(blocks)
+
+def build_schema_prompt(question, schema_info):
+    """Schema text containing only what this question needs."""
+    matched, join_tables = select_relevant_tables(question, schema_info)
+    return format_schema(schema_info, matched, join_tables)
+
 #get SQL from GPT
 def get_sql_from_gpt(question, schema):
     prompt = f"""
@@ -40,6 +217,7 @@ def get_sql_from_gpt(question, schema):
         Final answer: ONLY the SQL query.
         """
     response = client.chat.completions.create(
+        call_site="get_sql_from_gpt",
         model="gpt-4o-mini",  # cheaper + fast, perfect for this
         messages=[
             {"role": "system", "content": "You are a SQL expert."},
@@ -71,6 +249,7 @@ def get_natural_language_answer(question, results):
 		Provide a short, natural-language answer.
 		"""
     response = client.chat.completions.create(
+        call_site="get_natural_language_answer",
         model="gpt-4o-mini",
         messages=[
             {"role": "system", "content": "You are a friendly bakery assistant."},
@@ -82,68 +261,40 @@ def get_natural_language_answer(question, results):
 
 
 #main function 
-# Step 1: Define your schema
-schema = """
-Department (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    name TEXT NOT NULL
-)
-
-Lab (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    name TEXT NOT NULL,
-    departmentID INTEGER,
-    FOREIGN KEY(departmentID) REFERENCES Department(id)
-)
-
-Person (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    firstName TEXT NOT NULL,
-    lastName TEXT NOT NULL,
-    departmentID INTEGER,
-    areaOfResearch TEXT,
-    personType TEXT CHECK(personType IN ('professor','undergraduateStudent','graduateStudent','faculty')),
-    FOREIGN KEY(departmentID) REFERENCES Department(id)
-)
-
-Building (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    name TEXT NOT NULL,
-    constructionCompleted Date NOT NULL,
-    floorCount INTEGER
-)
-
-Room (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    buildingID INTEGER,
-    labID INTEGER,
-    roomNumber TEXT,
-    FOREIGN KEY(buildingID) REFERENCES Building(id),
-    FOREIGN KEY(labID) REFERENCES Lab(id)
-)
-
-PersonToLab (
-    personID INTEGER,
-    labID INTEGER,
-    FOREIGN KEY(personID) REFERENCES Person(id),
-    FOREIGN KEY(labID) REFERENCES Lab(id),
-    PRIMARY KEY(personID, labID)
-)
-"""
-
-# Step 2: Ask a question
-question = input("Ask a question about the university's professors or research lab: ")
-
-# Step 3: Get SQL from GPT
-sql_query = get_sql_from_gpt(question, schema)
-print("Generated SQL Query:\n", sql_query)
-
-# Step 4: Run SQL
-results = run_sql_query(sql_query)
-print("Query Results:\n", results)
-
-# Step 5: Get natural language answer
-answer = get_natural_language_answer(question, results)
-print("\nAnswer:\n", answer)
-
-conn.close()
\ No newline at end of file
+def main():
+    # Step 1: Load the schema and the fast-path name lists from the database (cached for the whole session)
+    schema_info = load_schema(cursor)
+    fast_path = TemplateMatcher(conn)
+
+    # Step 2: Ask a question
+    question = input("Ask a question about the university's professors or research lab: ")
+
+    # Common question shapes are answered locally with prepared SQL, no API call needed
+    match = fast_path.answer(question)
+    if match:
+        print(f"Matched template '{match['intent']}' in {match['elapsed_ms']:.1f} ms")
+        print("SQL Query:\n", match['sql'], match['params'])
+        print("Query Results:\n", match['results'])
+        print("\nAnswer:\n", match['answer'])
+    else:
+        # Step 3: Get SQL from GPT, only sending the tables this question needs
+        schema = build_schema_prompt(question, schema_info)
+        sql_query = get_sql_from_gpt(question, schema)
+        print("Generated SQL Query:\n", sql_query)
+
+        # Step 4: Run SQL
+        results = run_sql_query(sql_query)
+        print("Query Results:\n", results)
+
+        # Step 5: Get natural language answer
+        answer = get_natural_language_answer(question, results)
+        print("\nAnswer:\n", answer)
+
+    print(fast_path.report())
+    print(client.report())
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
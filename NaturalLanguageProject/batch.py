@@ -0,0 +1,174 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from app import (conn, cursor, client, load_schema, build_schema_prompt, get_sql_from_gpt,
+                 run_sql_query, get_natural_language_answer)
+from fast_path import TemplateMatcher
+
+
+def read_questions(input_path):
+    """
+    Read questions from a JSONL file. Each line is {"id": ..., "question": ...};
+    the line number is used when there is no id.
+    """
+    questions = []
+    with open(input_path, 'r', encoding='utf-8') as f:
+        for line_num, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            questions.append({'id': str(record.get('id', line_num)), 'question': record['question']})
+    return questions
+
+
+def read_answers(output_path):
+    """
+    The last record written for each id. A failed question is retried by the next run and
+    appended again, so earlier records for the same id are superseded.
+
+    Returns:
+        Dict mapping id -> record
+    """
+    answers = {}
+    if not os.path.exists(output_path):
+        return answers
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                answers[str(record['id'])] = record
+            except (json.JSONDecodeError, KeyError):
+                # A half-written last line from a crash; that question gets redone
+                continue
+    return answers
+
+
+def read_finished_ids(output_path):
+    """Ids already answered in a previous (possibly interrupted) run; failed ones are retried."""
+    return {id_ for id_, record in read_answers(output_path).items() if 'error' not in record}
+
+
+def normalize_sql(sql_query):
+    """Collapse whitespace and the trailing semicolon so equivalent SQL dedupes."""
+    return " ".join(sql_query.split()).rstrip(';').strip()
+
+
+def to_json_results(results):
+    """sqlite rows are tuples; error results are plain strings."""
+    if isinstance(results, str):
+        return results
+    return [list(row) for row in results]
+
+
+def run_batch(input_path, output_path, max_workers=8):
+    """
+    Answer every question in input_path and append one JSONL record per answer to output_path.
+
+    SQL generation and answer wording run concurrently (at most max_workers API calls in
+    flight). Generated SQL is deduplicated so each distinct query runs once. Questions
+    already answered in output_path are skipped, so an interrupted run can simply be restarted;
+    ones that failed are tried again and appended, so read the output with read_answers().
+    """
+    start = time.perf_counter()
+    questions = read_questions(input_path)
+    finished = read_finished_ids(output_path)
+    pending = [q for q in questions if q['id'] not in finished]
+    print(f"{len(questions)} questions, {len(finished)} already answered, {len(pending)} to go")
+
+    schema_info = load_schema(cursor)
+    fast_path = TemplateMatcher(conn)
+    sql_cache = {}  # normalized SQL -> results
+    sql_runs = 0
+    written = 0
+    failed = 0
+
+    with open(output_path, 'a', encoding='utf-8') as out, ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+        def write_record(record):
+            nonlocal written
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            written += 1
+            if written % 25 == 0:
+                rate = written / (time.perf_counter() - start)
+                print(f"  {written}/{len(pending)} answered ({rate:.1f} questions/s)")
+
+        def timed(func, *args):
+            call_start = time.perf_counter()
+            return func(*args), (time.perf_counter() - call_start) * 1000
+
+        in_flight = {}  # future -> (stage, record)
+
+        # Stage 1: fast path locally, everything else goes to GPT for SQL
+        for q in pending:
+            record = {'id': q['id'], 'question': q['question'], 'timings_ms': {}}
+            match = fast_path.answer(q['question'])
+            if match:
+                record.update(source='fast_path', sql=match['sql'], params=list(match['params']),
+                              results=to_json_results(match['results']), answer=match['answer'])
+                record['timings_ms']['fast_path'] = match['elapsed_ms']
+                write_record(record)
+                continue
+            record['source'] = 'gpt'
+            schema = build_schema_prompt(q['question'], schema_info)
+            in_flight[executor.submit(timed, get_sql_from_gpt, q['question'], schema)] = ('sql', record)
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, record = in_flight.pop(future)
+                try:
+                    value, elapsed_ms = future.result()
+                except Exception as e:
+                    record['error'] = f"{stage} stage failed: {e}"
+                    failed += 1
+                    write_record(record)
+                    continue
+
+                if stage == 'sql':
+                    # Stage 2: run each distinct SQL query once, on this thread (sqlite connection)
+                    record['sql'] = value
+                    record['timings_ms']['generate_sql'] = elapsed_ms
+                    key = normalize_sql(value)
+                    run_start = time.perf_counter()
+                    record['sql_cached'] = key in sql_cache
+                    if key not in sql_cache:
+                        sql_cache[key] = run_sql_query(value)
+                        sql_runs += 1
+                    results = sql_cache[key]
+                    record['timings_ms']['run_sql'] = (time.perf_counter() - run_start) * 1000
+                    record['results'] = to_json_results(results)
+
+                    # Stage 3: word the answer
+                    in_flight[executor.submit(timed, get_natural_language_answer, record['question'], results)] = ('answer', record)
+                else:
+                    record['answer'] = value
+                    record['timings_ms']['answer'] = elapsed_ms
+                    write_record(record)
+
+    elapsed = time.perf_counter() - start
+    print(f"\n{'='*60}")
+    print(f"Batch complete in {elapsed:.1f}s")
+    print(f"Questions answered this run: {written - failed}")
+    if failed:
+        print(f"Questions failed (retried on the next run): {failed}")
+    print(fast_path.report())
+    print(f"Distinct SQL queries run: {sql_runs}")
+    print(client.report())
+    print(f"Output saved to: {output_path}")
+    print(f"{'='*60}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions about the university database.")
+    parser.add_argument("input", help="JSONL file with one {\"id\", \"question\"} object per line")
+    parser.add_argument("output", help="JSONL file to append answers to (answered ids are skipped, failed ones retried)")
+    parser.add_argument("--workers", type=int, default=8, help="Max concurrent OpenAI calls")
+    args = parser.parse_args()
+
+    run_batch(args.input, args.output, max_workers=args.workers)
+    conn.close()
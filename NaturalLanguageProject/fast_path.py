@@ -0,0 +1,201 @@
+import re
+import time
+from difflib import get_close_matches
+
+# Titles to ignore in front of a name (matches the hint given to GPT in app.py)
+TITLES = r"(?:professor|prof\.?|dr\.?|doctor)\s+"
+
+# personType values (and the plural used in answers) for the words people actually type
+PERSON_TYPES = {
+    'graduate student': (('graduateStudent',), 'graduate students'),
+    'grad student': (('graduateStudent',), 'graduate students'),
+    'undergraduate student': (('undergraduateStudent',), 'undergraduate students'),
+    'undergrad student': (('undergraduateStudent',), 'undergraduate students'),
+    'undergrad': (('undergraduateStudent',), 'undergraduate students'),
+    'student': (('graduateStudent', 'undergraduateStudent'), 'students'),
+    'professor': (('professor',), 'professors'),
+    'faculty': (('faculty',), 'faculty members'),
+}
+
+# Parameterized SQL for each question shape. The text never changes, so
+# sqlite3 reuses the prepared statement from its statement cache.
+LABS_FOR_PERSON_SQL = """
+    SELECT Lab.name
+    FROM Lab
+    JOIN PersonToLab ON PersonToLab.labID = Lab.id
+    WHERE PersonToLab.personID = ?
+    ORDER BY Lab.name
+"""
+
+PEOPLE_IN_BUILDING_SQL = """
+    SELECT DISTINCT Person.firstName, Person.lastName
+    FROM Person
+    JOIN PersonToLab ON PersonToLab.personID = Person.id
+    JOIN Room ON Room.labID = PersonToLab.labID
+    WHERE Room.buildingID = ?
+    ORDER BY Person.lastName, Person.firstName
+"""
+
+COUNT_PEOPLE_IN_DEPARTMENT_SQL = """
+    SELECT COUNT(*)
+    FROM Person
+    WHERE departmentID = ? AND personType IN ({placeholders})
+"""
+
+
+class TemplateMatcher:
+    def __init__(self, conn, cutoff=0.75):
+        """
+        Answer common question shapes locally, without calling GPT.
+
+        Args:
+            conn: Open sqlite3 connection to university.db
+            cutoff: Minimum difflib similarity for a fuzzy entity match
+        """
+        self.conn = conn
+        self.cutoff = cutoff
+        self.hits = 0
+        self.misses = 0
+        self.people = self._load_aliases(
+            "SELECT id, firstName, lastName FROM Person",
+            lambda row: [f"{row[1]} {row[2]}".strip(), row[2], row[1]]
+        )
+        self.buildings = self._load_aliases(
+            "SELECT id, name FROM Building",
+            lambda row: self._name_aliases(row[1], suffix='building')
+        )
+        self.departments = self._load_aliases(
+            "SELECT id, name FROM Department",
+            lambda row: self._name_aliases(row[1], suffix='department')
+        )
+
+        # (intent, compiled pattern, handler) tried in order
+        self.templates = [
+            ('labs_for_person',
+             re.compile(rf"^(?:which|what) labs? (?:is|does) (?:{TITLES})?(?P<person>.+?) (?:in|work in|belong to|a member of)$"),
+             self._labs_for_person),
+            ('people_in_building',
+             re.compile(r"^who (?:works|work|is|are) in (?:the )?(?P<prefix>building )?(?P<building>.+?)"
+                        r"(?P<suffix> building)?$"),
+             self._people_in_building),
+            ('count_in_department',
+             re.compile(r"^how many (?P<type>[a-z ]+?)s? (?:are )?(?:there )?in (?:the )?(?:department (?:of )?)?"
+                        r"(?P<department>.+?)(?: department)?$"),
+             self._count_in_department),
+        ]
+
+    def _load_aliases(self, sql, make_aliases):
+        """Cache lowercase alias -> id for one table. Ambiguous aliases are dropped."""
+        aliases = {}
+        ambiguous = set()
+        for row in self.conn.execute(sql).fetchall():
+            for alias in make_aliases(row):
+                alias = alias.strip().lower()
+                if not alias:
+                    continue
+                if alias in aliases and aliases[alias] != row[0]:
+                    ambiguous.add(alias)
+                aliases[alias] = row[0]
+        for alias in ambiguous:
+            del aliases[alias]
+        return aliases
+
+    def _name_aliases(self, name, suffix):
+        """'Talmage Building (TMCB)' -> ['Talmage Building (TMCB)', 'Talmage Building', 'TMCB', 'Talmage']"""
+        aliases = [name]
+        base = re.sub(r"\s*\(.*?\)", "", name).strip()
+        aliases.append(base)
+        aliases.extend(re.findall(r"\((.*?)\)", name))
+        stripped = re.sub(rf"\s+{suffix}$", "", base, flags=re.IGNORECASE)
+        aliases.append(stripped)
+        return aliases
+
+    def _resolve(self, text, aliases):
+        """Fuzzy-match free text against a cached alias table. Returns the row id or None."""
+        text = re.sub(r"\s+", " ", text.strip().lower())
+        if text in aliases:
+            return aliases[text]
+        match = get_close_matches(text, list(aliases), n=1, cutoff=self.cutoff)
+        return aliases[match[0]] if match else None
+
+    def _labs_for_person(self, groups):
+        person_id = self._resolve(groups['person'], self.people)
+        if person_id is None:
+            return None
+        rows = self.conn.execute(LABS_FOR_PERSON_SQL, (person_id,)).fetchall()
+        name = self._person_name(person_id)
+        if not rows:
+            return LABS_FOR_PERSON_SQL, (person_id,), rows, f"{name} is not in any lab."
+        labs = ", ".join(r[0] for r in rows)
+        return LABS_FOR_PERSON_SQL, (person_id,), rows, f"{name} is in: {labs}."
+
+    def _people_in_building(self, groups):
+        building_id = self._resolve(groups['building'], self.buildings)
+        if building_id is None:
+            return None
+        # A bare name like "Engineering" could just as well be a department; let GPT decide
+        said_building = groups['prefix'] or groups['suffix']
+        if not said_building and self._resolve(groups['building'], self.departments) is not None:
+            return None
+        rows = self.conn.execute(PEOPLE_IN_BUILDING_SQL, (building_id,)).fetchall()
+        building = self.conn.execute("SELECT name FROM Building WHERE id = ?", (building_id,)).fetchone()[0]
+        if not rows:
+            return PEOPLE_IN_BUILDING_SQL, (building_id,), rows, f"Nobody has a lab in {building}."
+        people = ", ".join(f"{first} {last}".strip() for first, last in rows)
+        return PEOPLE_IN_BUILDING_SQL, (building_id,), rows, f"People with labs in {building}: {people}."
+
+    def _count_in_department(self, groups):
+        person_type = PERSON_TYPES.get(groups['type'].strip())
+        department_id = self._resolve(groups['department'], self.departments)
+        if person_type is None or department_id is None:
+            return None
+        person_types, label = person_type
+        sql = COUNT_PEOPLE_IN_DEPARTMENT_SQL.format(placeholders=", ".join("?" * len(person_types)))
+        params = (department_id, *person_types)
+        rows = self.conn.execute(sql, params).fetchall()
+        department = self.conn.execute("SELECT name FROM Department WHERE id = ?", (department_id,)).fetchone()[0]
+        return sql, params, rows, f"There are {rows[0][0]} {label} in {department}."
+
+    def _person_name(self, person_id):
+        first, last = self.conn.execute("SELECT firstName, lastName FROM Person WHERE id = ?", (person_id,)).fetchone()
+        return f"{first} {last}".strip()
+
+    def answer(self, question):
+        """
+        Try to answer a question from the templates.
+
+        Returns:
+            Dict with intent, sql, params, results, answer and elapsed_ms, or None on a miss
+        """
+        start = time.perf_counter()
+        normalized = re.sub(r"\s+", " ", question.strip().lower()).rstrip("?.! ")
+
+        for intent, pattern, handler in self.templates:
+            match = pattern.match(normalized)
+            if not match:
+                continue
+            handled = handler(match.groupdict())
+            if handled is None:
+                continue
+            sql, params, results, answer = handled
+            self.hits += 1
+            return {
+                'intent': intent,
+                'sql': sql.strip(),
+                'params': params,
+                'results': results,
+                'answer': answer,
+                'elapsed_ms': (time.perf_counter() - start) * 1000,
+            }
+
+        self.misses += 1
+        return None
+
+    def hit_rate(self):
+        """Fraction of questions answered without GPT."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def report(self):
+        total = self.hits + self.misses
+        return f"Fast path: {self.hits}/{total} questions answered locally ({self.hit_rate():.0%} hit rate)"
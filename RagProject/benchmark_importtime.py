@@ -0,0 +1,121 @@
+import argparse
+import os
+import subprocess
+import sys
+
+# Import cost of every RagProject module, measured with `python -X importtime` in a fresh
+# interpreter, checked against a budget. Exits 1 when a module is over budget or pulls in
+# one of the heavy packages at import, so it can gate a CI step:
+#
+#   python benchmark_importtime.py --budget-ms 300 --repeat 5
+
+PROJECT = os.path.dirname(os.path.abspath(__file__))
+
+MODULES = ['rag_config', 'scraper', 'semantic_search_and_RAG', 'openai_embeddings', 'free_embeddings',
+           'clusters']
+
+# Only ever imported on first use
+HEAVY = ['torch', 'sentence_transformers', 'onnxruntime', 'tokenizers', 'openai', 'httpx', 'tiktoken', 'sklearn',
+         'bs4', 'requests']
+
+# Per-module budgets (ms) that differ from --budget-ms
+BUDGETS = {
+    'clusters': 600,  # pandas
+}
+
+
+def parse_importtime(stderr):
+    """
+    Parse `-X importtime` output.
+
+    Returns:
+        List of (module, self_us, cumulative_us, depth) in the order they finished importing
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def measure(module, cwd=PROJECT):
+    """
+    Import one module in a fresh interpreter.
+
+    Returns:
+        Dict with the module's cumulative import ms, the heavy packages it loaded,
+        and its five most expensive direct and indirect imports
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+                            cwd=cwd, capture_output=True, text=True)
+    if result.returncode != 0:
+        error = result.stderr.strip().splitlines()
+        return {'module': module, 'error': error[-1] if error else f"exit {result.returncode}"}
+
+    rows = parse_importtime(result.stderr)
+    total_us = next((cumulative for name, _, cumulative, depth in rows if name == module and depth <= 1), 0)
+    loaded = {name.split('.')[0] for name, _, _, _ in rows}
+    slowest = sorted((row for row in rows if row[0] != module), key=lambda row: -row[1])[:5]
+    return {
+        'module': module,
+        'ms': total_us / 1000,
+        'heavy': sorted(package for package in HEAVY if package in loaded),
+        'slowest': [(name, self_us / 1000) for name, self_us, _, _ in slowest],
+    }
+
+
+def run(modules=MODULES, budget_ms=300.0, repeat=3):
+    """
+    Measure each module `repeat` times (best run counts, so a cold disk cache
+    doesn't fail the check) and compare with its budget.
+
+    Returns:
+        (results, failures): one dict per module, and messages for each broken budget
+    """
+    results = []
+    failures = []
+    for module in modules:
+        runs = [measure(module) for _ in range(repeat)]
+        errors = [r for r in runs if 'error' in r]
+        if errors:
+            results.append(errors[0])
+            failures.append(f"{module}: import failed ({errors[0]['error']})")
+            continue
+        best = min(runs, key=lambda r: r['ms'])
+        best['budget_ms'] = BUDGETS.get(module, budget_ms)
+        results.append(best)
+        if best['ms'] > best['budget_ms']:
+            failures.append(f"{module}: {best['ms']:.0f} ms > {best['budget_ms']:.0f} ms budget")
+        if best['heavy']:
+            failures.append(f"{module}: imports {', '.join(best['heavy'])} at import time")
+    return results, failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check RagProject import times against a budget.")
+    parser.add_argument("modules", nargs='*', default=MODULES, help="Modules to check (default: all)")
+    parser.add_argument("--budget-ms", type=float, default=300.0, help="Budget per module, in ms")
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh interpreters per module; the best counts")
+    parser.add_argument("--verbose", action="store_true", help="Show each module's slowest imports")
+    args = parser.parse_args()
+
+    results, failures = run(args.modules, args.budget_ms, args.repeat)
+
+    print(f"{'='*60}")
+    print(f"{'module':<28}{'ms':>8}{'budget':>8}  heavy imports")
+    for r in results:
+        if 'error' in r:
+            print(f"{r['module']:<28}  failed ({r['error']})")
+            continue
+        print(f"{r['module']:<28}{r['ms']:>8.1f}{r['budget_ms']:>8.0f}  {', '.join(r['heavy']) or '-'}")
+        if args.verbose:
+            for name, ms in r['slowest']:
+                print(f"    {name:<36}{ms:>8.1f} ms self")
+    print(f"{'='*60}")
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)
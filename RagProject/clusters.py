@@ -1,10 +1,8 @@
 import pandas as pd
 import numpy as np
-from sklearn.cluster import KMeans
 import ast
 import logging
 from datetime import datetime
-from sklearn.metrics.pairwise import cosine_similarity
 import os
 
 # Configure logging
@@ -22,6 +20,9 @@ def cluster_paragraph_embeddings(csv_file, k, prefix):
     Returns:
     - DataFrame containing cluster embeddings and metadata
     """
+    # sklearn takes longer to import than anything else here
+    from sklearn.cluster import KMeans
+    from sklearn.metrics.pairwise import cosine_similarity
     try:
         # Load the paragraph embeddings CSV
         open_file = os.path.join(prefix, csv_file)
@@ -1,12 +1,16 @@
-import pandas as pd
-from sentence_transformers import SentenceTransformer
-import torch
 from datetime import datetime
 import os
 import shutil
-
-def generate_embeddings(csv_file, column_name, output_dir="output_embeddings"):
-    """Generates and adds sentence embeddings to a CSV file with optimized performance."""
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shared'))
+
+def generate_embeddings(csv_file, column_name, output_dir="output_embeddings", backend=None):
+    """
+    Generates and adds sentence embeddings to a CSV file with optimized performance.
+    backend: 'torch', 'onnx' or 'onnx-int8' (default: $EMBEDDING_BACKEND, else 'torch')
+    """
+    import pandas as pd
+    from encoders import load_encoder, DEFAULT_BACKEND
     try:
         # Create output directory if it doesn't exist
         os.makedirs(output_dir, exist_ok=True)
@@ -14,15 +18,9 @@ def generate_embeddings(csv_file, column_name, output_dir="output_embeddings"):
         # Load the CSV file into a pandas DataFrame
         df = pd.read_csv(csv_file)
 
-        # Initialize the sentence transformer model
-        model = SentenceTransformer('all-MiniLM-L6-v2')
-
-        # Move model to GPU if available
-        if torch.cuda.is_available():
-            model = model.to('cuda')
-            print("Using GPU for encoding")
-        else:
-            print("Using CPU for encoding")
+        # Initialize the sentence encoder (torch uses the GPU if there is one)
+        model = load_encoder('all-MiniLM-L6-v2', backend=backend)
+        print(f"Using the {backend or DEFAULT_BACKEND} backend for encoding")
 
         texts = df['text'].tolist()
         embeddings = model.encode(
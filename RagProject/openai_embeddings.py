@@ -1,15 +1,6 @@
-from openai import OpenAI
-import pandas as pd
-import tiktoken
 from datetime import datetime
-import json
 import os
-
-with open("config.json") as config:
-    openaiKey = json.load(config)["openaiKey"]
-
-OpenAI.api_key = openaiKey
-client = OpenAI(api_key=OpenAI.api_key)
+from rag_config import get_client
 
 def get_embedding(texts, output_dir, model="text-embedding-3-small", max_tokens=300000):
     """
@@ -25,8 +16,10 @@ def get_embedding(texts, output_dir, model="text-embedding-3-small", max_tokens=
     """
     # Create output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
+    client = get_client()
 
     # Initialize tokenizer
+    import tiktoken
     encoder = tiktoken.encoding_for_model(model)
     
     # Clean texts and calculate token counts
@@ -40,7 +33,7 @@ def get_embedding(texts, output_dir, model="text-embedding-3-small", max_tokens=
     for i, (text, token_count) in enumerate(zip(texts, token_counts)):
         if current_token_count + token_count > max_tokens or len(current_batch) >= 100:
             # Process current batch
-            response = client.embeddings.create(input=current_batch, model=model)
+            response = client.embeddings.create(call_site='get_embedding', input=current_batch, model=model)
             batch_embeddings = [item.embedding for item in response.data]
             embeddings.extend(batch_embeddings)
             # Reset batch
@@ -52,13 +45,14 @@ def get_embedding(texts, output_dir, model="text-embedding-3-small", max_tokens=
     
     # Process final batch
     if current_batch:
-        response = client.embeddings.create(input=current_batch, model=model)
+        response = client.embeddings.create(call_site='get_embedding', input=current_batch, model=model)
         batch_embeddings = [item.embedding for item in response.data]
         embeddings.extend(batch_embeddings)
     
     return embeddings
 
 if __name__ == "__main__":
+    import pandas as pd
     output_dir = "openai"
 
     # Process talks.csv
@@ -72,6 +66,7 @@ if __name__ == "__main__":
     df['embedding'] = get_embedding(df['text'].tolist(), output_dir, model='text-embedding-3-small')
     output_paragraphs = os.path.join(output_dir, 'openai_paragraphs.csv')
     df.to_csv(output_paragraphs, index=False)
+    print(get_client().report())
 
     file_to_delete = "SCRAPED_TALKS.csv"
     if os.path.exists(file_to_delete):
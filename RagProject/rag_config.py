@@ -0,0 +1,45 @@
+import json
+import os
+import sys
+import threading
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shared'))
+
+# config.json and the OpenAI client, loaded on first use rather than at import, so the scripts'
+# helpers (split_talks, cosine_similarity, ...) can be imported without a config file or the
+# seconds it takes to import openai.
+
+CONFIG_PATH = os.environ.get('RAG_CONFIG', 'config.json')
+
+_config = None
+client = None
+_lock = threading.Lock()
+
+
+def load_config():
+    """
+    Read config.json (or $RAG_CONFIG) once.
+
+    Returns:
+        Dict of settings (openaiKey, years, ...)
+    """
+    global _config
+    with _lock:
+        if _config is None:
+            with open(CONFIG_PATH) as config:
+                _config = json.load(config)
+    return _config
+
+
+def get_client():
+    """
+    The shared LLMClient, built from config.json's openaiKey the first time it's needed.
+    Assign rag_config.client beforehand to use a different one (e.g. pointed at the stub server).
+    """
+    global client
+    if client is None:
+        api_key = load_config()["openaiKey"]
+        with _lock:
+            if client is None:
+                from llm_client import LLMClient
+                client = LLMClient(api_key=api_key)
+    return client
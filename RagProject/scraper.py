@@ -1,18 +1,13 @@
-import requests
-from bs4 import BeautifulSoup
-import pandas as pd
 import re
 import time
 import logging
 from urllib.parse import urlparse
 from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
-import json
+from rag_config import load_config
 
-with open("config.json") as config:
-    years = json.load(config)["years"]
+# requests, bs4 and pandas are imported by the functions that use them, so split_talks
+# can be reused without them
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -20,6 +15,9 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 
 def setup_session():
     """Create a requests session with retries and connection pooling."""
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
     session = requests.Session()
     retries = Retry(total=3, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504])
     session.mount('https://', HTTPAdapter(max_retries=retries))
@@ -37,6 +35,8 @@ def get_conference_urls(start_year, end_year):
 
 def get_talk_urls(conference_url, year, month, session):
     """Fetch talk URLs from a conference page, excluding session videos."""
+    import requests
+    from bs4 import BeautifulSoup
     try:
         response = session.get(conference_url, timeout=10)
         response.raise_for_status()
@@ -90,6 +90,8 @@ def get_talk_urls(conference_url, year, month, session):
 
 def scrape_talk(args):
     """Scrape metadata and transcript for a single talk."""
+    import requests
+    from bs4 import BeautifulSoup
     talk_url, year, talk_number, session = args
     start_time = time.time()
     try:
@@ -158,6 +160,8 @@ def split_talks(talk):
     return paragraph_data
 
 if __name__ == "__main__":
+    import pandas as pd
+    years = load_config()["years"]
     print("Start Time:", datetime.now().strftime("%H:%M:%S"))
 
     talks_data = []
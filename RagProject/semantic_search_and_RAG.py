@@ -1,32 +1,27 @@
-import pandas as pd
 import numpy as np
-from sentence_transformers import SentenceTransformer
-import torch
-from openai import OpenAI
-import json
 import ast
+from rag_config import get_client
 
-# Load config
-with open("config.json") as config:
-    openai_key = json.load(config)["openaiKey"]
-
-client = OpenAI(api_key=openai_key)
+# pandas, the sentence encoder and openai are imported where they're first used,
+# so importing this module stays cheap
 
 class ConferenceTalkSearcher:
-    def __init__(self, embedding_type="free"):
+    def __init__(self, embedding_type="free", backend=None):
         """
         Initialize the searcher with either 'free' or 'openai' embeddings.
         embedding_type: 'free' or 'openai'
+        backend: encoder for 'free' queries: 'torch', 'onnx' or 'onnx-int8'
+                 (default: $EMBEDDING_BACKEND, else 'torch')
         """
         self.embedding_type = embedding_type
         
         if embedding_type == "free":
-            self.model = SentenceTransformer('all-MiniLM-L6-v2')
-            if torch.cuda.is_available():
-                self.model = self.model.to('cuda')
+            from encoders import load_encoder
+            self.model = load_encoder('all-MiniLM-L6-v2', backend=backend)
         
     def load_embeddings(self, csv_file):
         """Load embeddings from CSV file."""
+        import pandas as pd
         df = pd.read_csv(csv_file)
         # Convert string embeddings to numpy arrays
         df['embedding'] = df['embedding'].apply(lambda x: np.array(ast.literal_eval(x)))
@@ -38,7 +33,8 @@ class ConferenceTalkSearcher:
             return self.model.encode(query, convert_to_numpy=True, normalize_embeddings=True)
         else:
             # Use OpenAI API for query embedding
-            response = client.embeddings.create(
+            response = get_client().embeddings.create(
+                call_site="query_to_embedding",
                 input=query,
                 model="text-embedding-3-small"
             )
@@ -104,7 +100,8 @@ Question: {query}
 
 Please answer this question using only the talks provided above."""
         
-        response = client.chat.completions.create(
+        response = get_client().chat.completions.create(
+            call_site="generate_answer",
             model="gpt-3.5-turbo",
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -189,3 +186,4 @@ if __name__ == "__main__":
     # Uncomment one to run:
     run_tests()  # Run all comparisons
     # run_rag_demo()  # Generate answers
+    print(get_client().report())
@@ -0,0 +1,168 @@
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from encoders import BACKENDS, load_encoder
+from percentiles import percentile
+
+# Parity and speed of each encoder backend against sentence_transformers on torch:
+#
+#   parity       cosine between each text's embedding and the torch one, and how often a
+#                query's nearest neighbour is the same text as under torch
+#   load         fresh interpreter to first embedding (imports + model load), i.e. cold start
+#   query        one text per encode() call, as the searcher and passage index make them
+#   throughput   all texts in batches, as process_and_embed.py and free_embeddings.py do
+#
+# Exits 1 when a backend's worst cosine falls below its PARITY floor.
+#
+#   python shared/benchmark_encoders.py --books FinalProject/code/Books --backends torch,onnx,onnx-int8
+
+SHARED = os.path.dirname(os.path.abspath(__file__))
+
+# Lowest acceptable cosine to the torch embedding of the same text
+PARITY = {'onnx': 0.999, 'onnx-int8': 0.98}
+
+WORDS = ("faith prayer testimony schedule risk surgical team conceptual integrity manpower communication "
+         "estimate milestone architect documentation service family temple repentance covenant").split()
+
+
+def sample_texts(num_texts, seed=0, books=None):
+    """
+    Texts to encode: paragraphs from a Books folder if given, else random sentences.
+    """
+    rng = random.Random(seed)
+    if books:
+        paragraphs = []
+        for root, _, files in os.walk(books):
+            for name in sorted(files):
+                if name.endswith('.txt'):
+                    with open(os.path.join(root, name), 'r', encoding='utf-8', errors='replace') as f:
+                        paragraphs.extend(p.strip() for p in f.read().split('\n\n') if len(p.strip()) > 40)
+        if paragraphs:
+            return [rng.choice(paragraphs) for _ in range(num_texts)]
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 120))) for _ in range(num_texts)]
+
+
+def parity(reference, embeddings, num_queries=50):
+    """
+    Compare embeddings of the same texts from two backends (both normalized).
+
+    Returns:
+        Dict: min_cos, mean_cos, and nn_agreement (share of the first num_queries texts
+        whose nearest other text is the same under both)
+    """
+    cos = np.sum(reference * embeddings, axis=1)
+    queries = min(num_queries, len(reference))
+
+    def nearest(matrix):
+        scores = matrix[:queries] @ matrix.T
+        scores[np.arange(queries), np.arange(queries)] = -np.inf
+        return scores.argmax(axis=1)
+
+    return {
+        'min_cos': float(cos.min()),
+        'mean_cos': float(cos.mean()),
+        'nn_agreement': float(np.mean(nearest(reference) == nearest(embeddings))),
+    }
+
+
+def load_seconds(model_name, backend, cache_dir=None):
+    """Seconds from a fresh interpreter to the first embedding."""
+    code = ("import time; start = time.perf_counter(); from encoders import load_encoder; "
+            f"load_encoder({model_name!r}, backend={backend!r}, cache_dir={cache_dir!r}, use_daemon=False)"
+            ".encode(['warm up']); "
+            "print(time.perf_counter() - start)")
+    result = subprocess.run([sys.executable, '-c', code], cwd=SHARED, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def benchmark(backend, texts, model_name='all-MiniLM-L6-v2', queries=100, batch_size=32, cache_dir=None,
+              num_threads=None):
+    """
+    Time one backend.
+
+    Returns:
+        (result dict, embeddings of texts)
+    """
+    # Export (for ONNX) before anything is timed; always in this process, never the daemon
+    encoder = load_encoder(model_name, backend=backend, cache_dir=cache_dir, num_threads=num_threads,
+                           use_daemon=False)
+    encoder.encode(texts[:batch_size], batch_size=batch_size)
+
+    latencies = []
+    for text in texts[:queries]:
+        start = time.perf_counter()
+        encoder.encode(text, normalize_embeddings=True)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+
+    start = time.perf_counter()
+    embeddings = encoder.encode(texts, batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=True)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'backend': backend,
+        'load_s': round(load_seconds(model_name, backend, cache_dir), 2),
+        'query_p50_ms': round(latencies[len(latencies) // 2], 2),
+        'query_p95_ms': round(percentile(latencies, 0.95), 2),
+        'texts_per_s': round(len(texts) / elapsed, 1),
+    }, np.asarray(embeddings, dtype=np.float32)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parity and speed of the sentence encoder backends.")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help=f"Comma-separated: {', '.join(BACKENDS)}")
+    parser.add_argument("--model", default='all-MiniLM-L6-v2')
+    parser.add_argument("--books", default=None, help="Books folder to sample paragraphs from")
+    parser.add_argument("--texts", type=int, default=2000, help="Texts for throughput and parity")
+    parser.add_argument("--queries", type=int, default=100, help="Single-text encode() calls timed")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=None, help="onnxruntime intra-op threads")
+    parser.add_argument("--cache-dir", default=None, help="Where ONNX exports are kept")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default=None, help="Also write the results here, for comparing runs")
+    args = parser.parse_args()
+
+    texts = sample_texts(args.texts, args.seed, args.books)
+    backends = [b.strip() for b in args.backends.split(',')]
+    if 'torch' not in backends:
+        # Parity is measured against torch
+        backends.insert(0, 'torch')
+
+    results, embeddings = [], {}
+    for backend in backends:
+        print(f"Benchmarking {backend}...")
+        result, embeddings[backend] = benchmark(backend, texts, args.model, args.queries, args.batch_size,
+                                                args.cache_dir, args.threads)
+        if backend != 'torch':
+            result.update(parity(embeddings['torch'], embeddings[backend]))
+        results.append(result)
+
+    failures = [f"{r['backend']}: min cosine {r['min_cos']:.5f} < {PARITY[r['backend']]}"
+                for r in results if r['backend'] in PARITY and r['min_cos'] < PARITY[r['backend']]]
+
+    print(f"\n{'='*60}")
+    print(f"{args.model}, {len(texts)} texts, batch {args.batch_size}")
+    print(f"{'backend':<12}{'load s':>8}{'p50 ms':>8}{'p95 ms':>8}{'texts/s':>9}"
+          f"{'min cos':>9}{'mean cos':>10}{'nn agree':>10}")
+    for r in results:
+        agreement = (f"{r['min_cos']:>9.5f}{r['mean_cos']:>10.5f}{r['nn_agreement']:>10.1%}"
+                     if 'min_cos' in r else f"{'(reference)':>28}")
+        print(f"{r['backend']:<12}{r['load_s']:>8.2f}{r['query_p50_ms']:>8.2f}{r['query_p95_ms']:>8.2f}"
+              f"{r['texts_per_s']:>9.1f}{agreement}")
+    print(f"{'='*60}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,240 @@
+import argparse
+import contextlib
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from llm_client import LLMClient
+from percentiles import percentile
+from stub_server import start_in_thread, LATENCY_DISTRIBUTIONS
+
+# Throughput of every LLM-driven path against the local stub server: no API key, no network,
+# and the same numbers every run for a given --seed. Each suite builds its real client code,
+# points it at the stub (optionally replaying recorded --fixtures), and runs --ops operations
+# on --workers threads.
+#
+#   python shared/benchmark_suite.py --suites grader,locator --latency-dist lognormal --fail-rate 0.05
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FINAL_PROJECT = os.path.join(ROOT, 'FinalProject', 'code')
+NL_PROJECT = os.path.join(ROOT, 'NaturalLanguageProject')
+RAG_PROJECT = os.path.join(ROOT, 'RagProject')
+
+WORDS = ("team schedule risk surgical mythical month conceptual integrity manpower communication "
+         "testing estimate milestone architect documentation").split()
+
+
+@contextlib.contextmanager
+def project(path, cwd=None):
+    """Import a project's scripts: its folder on sys.path, and cwd as the working directory
+    while they load (they open their config and databases relative to it). Afterwards sys.path
+    is restored and the project's modules are dropped from sys.modules, so the next project's
+    same-named scripts (secrets, config, ...) are imported from its own folder."""
+    old_cwd = os.getcwd()
+    old_path = list(sys.path)
+    old_modules = set(sys.modules)
+    project_dir = os.path.join(os.path.abspath(path), '')
+    sys.path.insert(0, path)
+    os.chdir(cwd or path)
+    try:
+        yield
+    finally:
+        os.chdir(old_cwd)
+        sys.path[:] = old_path
+        for name in set(sys.modules) - old_modules:
+            module_file = getattr(sys.modules[name], '__file__', None) or ''
+            if os.path.abspath(module_file).startswith(project_dir):
+                del sys.modules[name]
+
+
+def sentence(rng, n):
+    return " ".join(rng.choice(WORDS) for _ in range(n))
+
+
+def make_books(directory, rng, num_chapters=6):
+    """A small Books folder for the locator and grader."""
+    for n in range(1, num_chapters + 1):
+        book = os.path.join(directory, 'Books', 'Mythical-Man-Month')
+        os.makedirs(book, exist_ok=True)
+        with open(os.path.join(book, f"chapter-{n}.txt"), 'w', encoding='utf-8') as f:
+            f.write("\n\n".join(sentence(rng, 120) for _ in range(8)))
+    return os.path.join(directory, 'Books')
+
+
+def grader_suite(client, ops, rng, workdir):
+    with project(FINAL_PROJECT, workdir):
+        from actualgrader import CitationGrader
+        from corpus_store import CorpusStore
+        books = make_books(workdir, rng)
+        grader = CitationGrader(books, api_key="stub", corpus=CorpusStore(books))
+    grader.client = client
+    paths = [f"Mythical-Man-Month/chapter-{n}.txt" for n in range(1, 7)]
+
+    def grade_one(i):
+        path = rng.choice(paths)
+        batch = [{'student': f"Student {i}-{j}", 'question_num': '1', 'question_prompt': "Identify five risks.",
+                  'risk_num': str(j), 'response': sentence(rng, 80), 'ai_usage': "I used ChatGPT to brainstorm."}
+                 for j in range(1, 11)]
+        return lambda: grader.grade_batch(path, batch, grader.load_citation_file(path))
+    return [grade_one(i) for i in range(ops)], "batches of 10 graded"
+
+
+def locator_suite(client, ops, rng, workdir):
+    with project(FINAL_PROJECT, workdir):
+        from cg2 import CitationFileLocator
+        from corpus_store import CorpusStore
+        books = make_books(workdir, rng)
+        locator = CitationFileLocator(books, api_key="stub", corpus=CorpusStore(books))
+    locator.client = client
+    # Citations the local resolver can't place, so every one goes to the model
+    texts = [f"{sentence(rng, 60)} (Some Unknown Work, p. {rng.randint(1, 300)})" for _ in range(ops)]
+    return [lambda text=text: locator.identify_citation_file(text) for text in texts], "citations located"
+
+
+def splitter_suite(client, ops, rng, workdir):
+    with project(FINAL_PROJECT, workdir):
+        from splitanswers import split_chunk
+    keys = ["Question 1", "Question 2"]
+
+    def chunk(i):
+        # No '#N:' markers, so these need the model
+        students = [dict({'Student': f"Student {i}-{j}"}, **{k: sentence(rng, 150) for k in keys}) for j in range(5)]
+        return lambda: split_chunk(students, keys, max_retries=0, llm_client=client)
+    return [chunk(i) for i in range(ops)], "chunks of 5 split"
+
+
+def sql_suite(client, ops, rng, workdir):
+    with project(NL_PROJECT):
+        import app
+    app.client = client
+    schema = app.build_schema_prompt("Which professors teach in the computer science department?",
+                                     app.load_schema(app.cursor))
+    questions = [f"Which professors teach {rng.choice(WORDS)} courses?" for _ in range(ops)]
+
+    def answer(question):
+        def run():
+            app.get_sql_from_gpt(question, schema)
+            return app.get_natural_language_answer(question, [("stub",)])
+        return run
+    return [answer(q) for q in questions], "questions answered (SQL + wording)"
+
+
+def rag_suite(client, ops, rng, workdir):
+    with project(RAG_PROJECT, workdir):
+        import rag_config
+        import semantic_search_and_RAG as rag
+    rag_config.client = client
+    searcher = rag.ConferenceTalkSearcher(embedding_type="openai")
+    talks = [({'title': f"Talk {n}", 'speaker': f"Speaker {n}", 'text': sentence(rng, 200)}, 0.5) for n in range(3)]
+
+    def ask(question):
+        def run():
+            searcher.query_to_embedding(question)
+            return searcher.generate_answer(question, talks)
+        return run
+    return [ask(f"How can I {sentence(rng, 6)}?") for _ in range(ops)], "questions answered (embed + generate)"
+
+
+def embeddings_suite(client, ops, rng, workdir):
+    with project(RAG_PROJECT, workdir):
+        import rag_config
+        import openai_embeddings
+        import tiktoken  # noqa: F401 -- imported lazily by get_embedding; skip the suite up front if it's missing
+    rag_config.client = client
+    output_dir = os.path.join(workdir, 'openai')
+    batches = [[sentence(rng, 100) for _ in range(20)] for _ in range(ops)]
+    return [lambda texts=texts: openai_embeddings.get_embedding(texts, output_dir) for texts in batches], \
+        "batches of 20 texts embedded"
+
+
+SUITES = {
+    'grader': grader_suite,
+    'locator': locator_suite,
+    'splitter': splitter_suite,
+    'sql': sql_suite,
+    'rag': rag_suite,
+    'embeddings': embeddings_suite,
+}
+
+
+def run_suite(name, ops=40, workers=8, seed=0, **stub_kwargs):
+    """
+    Run one suite against a fresh stub server.
+
+    Returns:
+        Dict with the suite's throughput and call statistics, or {'skipped': reason}
+        when the project can't be imported here (missing secrets.py, packages, ...)
+    """
+    rng = random.Random(seed)
+    server, base_url = start_in_thread(port=0, seed=seed, **stub_kwargs)
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            client = LLMClient(api_key="stub", base_url=base_url, backoff=0.05)
+            try:
+                work, unit = SUITES[name](client, ops, rng, workdir)
+            except Exception as e:
+                return {'suite': name, 'skipped': f"{type(e).__name__}: {e}"}
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(lambda job: job(), work))
+            elapsed = time.perf_counter() - start
+    finally:
+        server.shutdown()
+
+    rows = client.summary()
+    latencies = sorted(r['latency_ms'] for r in client.records)
+    return {
+        'suite': name,
+        'unit': unit,
+        'ops': len(work),
+        'seconds': round(elapsed, 3),
+        'ops_per_s': round(len(work) / elapsed, 2) if elapsed else None,
+        'calls': sum(r['calls'] for r in rows),
+        'retries': sum(r['retries'] for r in rows),
+        'errors': sum(r['errors'] for r in rows),
+        'p50_ms': round(latencies[len(latencies) // 2], 1) if latencies else None,
+        'p95_ms': round(percentile(latencies, 0.95), 1) if latencies else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline throughput benchmarks for every LLM-driven pipeline.")
+    parser.add_argument("--suites", default=",".join(SUITES), help=f"Comma-separated: {', '.join(SUITES)}")
+    parser.add_argument("--ops", type=int, default=40, help="Operations per suite")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent operations")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the data, latencies and failures")
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--latency-dist", choices=LATENCY_DISTRIBUTIONS, default='normal')
+    parser.add_argument("--ms-per-output-token", type=float, default=0.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of calls answered with 429")
+    parser.add_argument("--fixtures", default=None, help="Recorded replies to replay (replay.RecordingClient)")
+    parser.add_argument("--json", default=None, help="Also write the results here, for comparing runs")
+    args = parser.parse_args()
+
+    results = []
+    for name in args.suites.split(','):
+        results.append(run_suite(name.strip(), ops=args.ops, workers=args.workers, seed=args.seed,
+                                 latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                                 latency_dist=args.latency_dist, ms_per_output_token=args.ms_per_output_token,
+                                 fail_rate=args.fail_rate, fixtures=args.fixtures))
+
+    print(f"\n{'='*60}")
+    print(f"Stub: {args.latency_dist} {args.latency_ms:.0f}±{args.jitter_ms:.0f} ms, "
+          f"{args.fail_rate:.0%} 429s, {args.workers} workers, seed {args.seed}")
+    print(f"{'suite':<12}{'ops':>6}{'ops/s':>8}{'calls':>7}{'retry':>7}{'err':>5}{'p50 ms':>8}{'p95 ms':>8}  unit")
+    for r in results:
+        if 'skipped' in r:
+            print(f"{r['suite']:<12}  skipped ({r['skipped']})")
+            continue
+        print(f"{r['suite']:<12}{r['ops']:>6}{r['ops_per_s']:>8.2f}{r['calls']:>7}{r['retries']:>7}{r['errors']:>5}"
+              f"{r['p50_ms']:>8.0f}{r['p95_ms']:>8.0f}  {r['unit']}")
+    print(f"{'='*60}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
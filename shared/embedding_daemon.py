@@ -0,0 +1,308 @@
+import argparse
+import http.client
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+
+# One process that holds the sentence encoder for every script on the machine. The searcher,
+# the passage index and the embedding scripts call it through DaemonEncoder (load_encoder()
+# picks it up on its own), so the model is loaded, and its memory paid for, once.
+#
+#   python shared/embedding_daemon.py --backend onnx
+#
+# Concurrent requests are batched together: the first one waits up to --max-wait-ms for others
+# to arrive, then they are all encoded in one call. Replies are the raw float32 matrix, not
+# JSON floats.
+#
+#   POST /encode?normalize=1   body: JSON list of texts
+#                              reply: float32 bytes, row-major, X-Shape: "<rows>,<dimension>"
+#   GET  /health               model, backend, dimension and batching stats (JSON)
+
+DEFAULT_URL = "http://127.0.0.1:8766"
+
+# Texts per request from one client, so a big embedding job doesn't hold up other clients' queries
+CLIENT_CHUNK = 256
+
+
+class Batcher:
+    def __init__(self, encoder, max_batch=256, max_wait_ms=2.0, batch_size=32):
+        """
+        Encodes queued requests together on one worker thread.
+
+        Args:
+            encoder: Anything with SentenceTransformer-style encode()
+            max_batch: Stop collecting requests once this many texts are waiting
+            max_wait_ms: How long the first request waits for others to join it
+            batch_size: Texts per forward pass inside encode()
+        """
+        self.encoder = encoder
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.batch_size = batch_size
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'texts': 0, 'batches': 0, 'encode_s': 0.0, 'largest_batch': 0}
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, texts, normalize=True):
+        """Encode texts with the next batch. Returns a float32 (len(texts), dimension) array."""
+        future = Future()
+        self.queue.put((list(texts), normalize, future))
+        return future.result()
+
+    def _collect(self):
+        pending = [self.queue.get()]
+        count = len(pending[0][0])
+        deadline = time.perf_counter() + self.max_wait
+        while count < self.max_batch:
+            try:
+                # Whatever is already queued, then anything arriving before the deadline
+                item = self.queue.get(timeout=max(0.0, deadline - time.perf_counter()))
+            except queue.Empty:
+                break
+            pending.append(item)
+            count += len(item[0])
+        return pending
+
+    def _run(self):
+        while True:
+            pending = self._collect()
+            texts = [text for item in pending for text in item[0]]
+            start = time.perf_counter()
+            try:
+                # Normalized per request below, which is what normalize_embeddings=True does
+                embeddings = np.asarray(self.encoder.encode(texts, batch_size=self.batch_size, convert_to_numpy=True,
+                                                            normalize_embeddings=False), dtype=np.float32)
+            except Exception as e:
+                for _, _, future in pending:
+                    future.set_exception(e)
+                continue
+            with self.lock:
+                self.stats['requests'] += len(pending)
+                self.stats['texts'] += len(texts)
+                self.stats['batches'] += 1
+                self.stats['encode_s'] += time.perf_counter() - start
+                self.stats['largest_batch'] = max(self.stats['largest_batch'], len(texts))
+
+            offset = 0
+            for request_texts, normalize, future in pending:
+                rows = embeddings[offset:offset + len(request_texts)]
+                offset += len(request_texts)
+                if normalize:
+                    rows = rows / np.clip(np.linalg.norm(rows, axis=1, keepdims=True), 1e-12, None)
+                future.set_result(rows)
+
+
+class DaemonHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so a client's repeated queries reuse one connection
+    protocol_version = "HTTP/1.1"
+    batcher = None  # set by make_server
+    info = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path.rstrip('/') == "/health":
+            with self.batcher.lock:
+                stats = dict(self.batcher.stats)
+            self._send_json(200, dict(self.info, **stats))
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path.rstrip('/') != "/encode":
+            self._send_json(404, {'error': 'not found'})
+            return
+        try:
+            texts = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+                raise ValueError("expected a JSON list of strings")
+        except ValueError as e:
+            self._send_json(400, {'error': str(e)})
+            return
+        normalize = parse_qs(url.query).get('normalize', ['0'])[0] == '1'
+        try:
+            embeddings = self.batcher.submit(texts, normalize) if texts else \
+                np.empty((0, self.info['dimension']), dtype=np.float32)
+        except Exception as e:
+            self._send_json(500, {'error': f"{type(e).__name__}: {e}"})
+            return
+
+        payload = np.ascontiguousarray(embeddings, dtype='<f4').tobytes()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("X-Shape", f"{embeddings.shape[0]},{embeddings.shape[1]}")
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def make_server(model_name='all-MiniLM-L6-v2', backend=None, host="127.0.0.1", port=8766, max_batch=256,
+                max_wait_ms=2.0, batch_size=32, encoder=None):
+    """Load the encoder and build (but don't start) the daemon. Use port=0 to pick a free port."""
+    from encoders import load_encoder, DEFAULT_BACKEND
+
+    backend = backend or DEFAULT_BACKEND
+    if encoder is None:
+        encoder = load_encoder(model_name, backend=backend, use_daemon=False)
+    dimension = encoder.get_sentence_embedding_dimension()
+    handler = type("BoundDaemonHandler", (DaemonHandler,), {
+        'batcher': Batcher(encoder, max_batch, max_wait_ms, batch_size),
+        'info': {'model': model_name, 'backend': backend, 'dimension': dimension, 'pid': os.getpid()},
+    })
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def start_in_thread(**kwargs):
+    """Start a daemon on a background thread. Returns (server, url)."""
+    server = make_server(**kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    return server, f"http://{host}:{port}"
+
+
+class DaemonEncoder:
+    def __init__(self, url=DEFAULT_URL, info=None, fallback=None, timeout=300.0):
+        """
+        SentenceTransformer-style encode() served by the embedding daemon.
+
+        If the daemon stops answering, encoding carries on in this process with
+        fallback() (called once, to load the encoder).
+
+        Args:
+            url: The daemon's base URL
+            info: Its /health reply
+            fallback: Returns an in-process encoder for the same model and backend
+            timeout: Seconds to wait for one request (a large batch on a busy daemon can take a while)
+        """
+        parsed = urlparse(url)
+        self.host, self.port = parsed.hostname, parsed.port
+        self.info = info or {}
+        self.timeout = timeout
+        self._fallback = fallback
+        self._local_encoder = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def get_sentence_embedding_dimension(self):
+        return self.info.get('dimension')
+
+    def _connection(self):
+        if getattr(self._local, 'connection', None) is None:
+            self._local.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return self._local.connection
+
+    def _request(self, texts, normalize):
+        body = json.dumps(texts).encode('utf-8')
+        connection = self._connection()
+        try:
+            connection.request("POST", f"/encode?normalize={int(normalize)}", body,
+                               {"Content-Type": "application/json"})
+            response = connection.getresponse()
+            payload = response.read()
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            self._local.connection = None
+            raise
+        if response.status != 200:
+            raise RuntimeError(f"Embedding daemon returned {response.status}: {payload[:200]!r}")
+        rows, dimension = (int(n) for n in response.getheader('X-Shape').split(','))
+        return np.frombuffer(payload, dtype='<f4').reshape(rows, dimension)
+
+    def _local_encode(self, texts, batch_size, normalize):
+        with self._lock:
+            if self._local_encoder is None:
+                print(f"Embedding daemon at {self.host}:{self.port} stopped answering; encoding in this process")
+                self._local_encoder = self._fallback()
+        return np.asarray(self._local_encoder.encode(texts, batch_size=batch_size, convert_to_numpy=True,
+                                                     normalize_embeddings=normalize), dtype=np.float32)
+
+    def encode(self, sentences, batch_size=32, show_progress_bar=False, convert_to_numpy=True,
+               normalize_embeddings=False):
+        """
+        Embed one text or a list of them, like SentenceTransformer.encode.
+
+        Returns:
+            float32 array of shape (dimension,) for a string, (len(sentences), dimension) for a list
+        """
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if self._local_encoder is not None:
+            embeddings = self._local_encode(texts, batch_size, normalize_embeddings)
+        else:
+            parts = []
+            for start in range(0, len(texts), CLIENT_CHUNK):
+                chunk = texts[start:start + CLIENT_CHUNK]
+                try:
+                    parts.append(self._request(chunk, normalize_embeddings))
+                except (OSError, http.client.HTTPException):
+                    if self._fallback is None:
+                        raise
+                    parts.append(self._local_encode(chunk, batch_size, normalize_embeddings))
+                if show_progress_bar:
+                    print(f"Encoded {min(start + CLIENT_CHUNK, len(texts))}/{len(texts)}", end='\r')
+            embeddings = np.vstack(parts) if parts else np.empty((0, self.info.get('dimension', 0)), dtype=np.float32)
+        return embeddings[0] if single else embeddings
+
+
+def connect(model_name='all-MiniLM-L6-v2', backend='torch', url=None, fallback=None, timeout=0.5):
+    """
+    A DaemonEncoder, if a daemon is running at url with this model and backend.
+
+    Returns:
+        DaemonEncoder, or None (no daemon, or one serving a different model or backend)
+    """
+    url = url or DEFAULT_URL
+    parsed = urlparse(url)
+    connection = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=timeout)
+    try:
+        connection.request("GET", "/health")
+        response = connection.getresponse()
+        info = json.loads(response.read()) if response.status == 200 else None
+    except (OSError, http.client.HTTPException, ValueError):
+        return None
+    finally:
+        connection.close()
+    if not info or info.get('model') != model_name or info.get('backend') != backend:
+        return None
+    return DaemonEncoder(url, info, fallback)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared sentence-encoder daemon with dynamic batching.")
+    parser.add_argument("--model", default='all-MiniLM-L6-v2')
+    parser.add_argument("--backend", default=None, help="torch, onnx or onnx-int8 (default: $EMBEDDING_BACKEND)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--max-batch", type=int, default=256, help="Texts per batched encode() call")
+    parser.add_argument("--max-wait-ms", type=float, default=2.0,
+                        help="How long a request waits for others to batch with")
+    parser.add_argument("--batch-size", type=int, default=32, help="Texts per forward pass")
+    args = parser.parse_args()
+
+    server = make_server(args.model, args.backend, args.host, args.port, args.max_batch, args.max_wait_ms,
+                         args.batch_size)
+    info = server.RequestHandlerClass.info
+    print(f"Embedding daemon for {info['model']} ({info['backend']}, {info['dimension']} dims) "
+          f"on http://{args.host}:{args.port} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,207 @@
+import inspect
+import json
+import os
+
+import numpy as np
+
+# Sentence encoders behind one load_encoder() call, picked by name or $EMBEDDING_BACKEND:
+#
+#   torch      sentence_transformers on PyTorch (GPU if there is one)
+#   onnx       the same model exported to ONNX and run with onnxruntime on the CPU
+#   onnx-int8  that export with its weights dynamically quantized to int8
+#
+# Every backend has SentenceTransformer's encode(texts, batch_size=..., convert_to_numpy=True,
+# normalize_embeddings=True), so call sites swap without other changes. The ONNX backends only
+# need onnxruntime and tokenizers at run time: torch and sentence_transformers are used once, to
+# export the model into ONNX_CACHE.
+#
+# When an embedding daemon (embedding_daemon.py) is serving the same model and backend at
+# $EMBEDDING_DAEMON (default http://127.0.0.1:8766; 'off' to never use one), load_encoder()
+# returns a client for it instead of loading another copy of the model.
+
+BACKENDS = ('torch', 'onnx', 'onnx-int8')
+DEFAULT_BACKEND = os.environ.get('EMBEDDING_BACKEND', 'torch')
+DAEMON_URL = os.environ.get('EMBEDDING_DAEMON', '')
+ONNX_CACHE = os.environ.get('ONNX_MODEL_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'onnx-encoders'))
+
+# BERT's forward() order, which torch.onnx.export passes the inputs in
+MODEL_INPUTS = ('input_ids', 'attention_mask', 'token_type_ids')
+
+
+def load_encoder(model_name='all-MiniLM-L6-v2', backend=None, cache_dir=None, num_threads=None, use_daemon=True):
+    """
+    Load a sentence encoder, or connect to the embedding daemon if it's serving this one.
+
+    Args:
+        model_name: sentence_transformers model
+        backend: 'torch', 'onnx' or 'onnx-int8' (default: $EMBEDDING_BACKEND, else 'torch')
+        cache_dir: Where ONNX exports are kept (default: $ONNX_MODEL_DIR or ~/.cache/onnx-encoders)
+        num_threads: onnxruntime intra-op threads (default: one per core)
+        use_daemon: Try the embedding daemon first (falls back to this process if it isn't running)
+
+    Returns:
+        An object with SentenceTransformer-style encode()
+    """
+    backend = backend or DEFAULT_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {', '.join(BACKENDS)}")
+    if use_daemon and DAEMON_URL != 'off':
+        from embedding_daemon import connect
+        encoder = connect(model_name, backend, DAEMON_URL or None,
+                          fallback=lambda: load_encoder(model_name, backend, cache_dir, num_threads, use_daemon=False))
+        if encoder is not None:
+            return encoder
+    if backend == 'torch':
+        import torch
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name, device='cuda' if torch.cuda.is_available() else 'cpu')
+    return OnnxEncoder(model_name, quantize=backend == 'onnx-int8', cache_dir=cache_dir, num_threads=num_threads)
+
+
+def export_dir(model_name, cache_dir=None):
+    return os.path.join(cache_dir or ONNX_CACHE, model_name.replace('/', '__'))
+
+
+def export_onnx(model_name, out_dir, quantize=False):
+    """
+    Export a sentence_transformers model to ONNX: the transformer as model.onnx, an int8
+    copy as model_int8.onnx (if quantize), its tokenizer.json, and encoder.json holding the
+    pooling and sequence length the encoder must reproduce. encoder.json is written last, so
+    an interrupted export is redone.
+
+    Returns:
+        Dict read back from encoder.json
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(out_dir, exist_ok=True)
+    model_path = os.path.join(out_dir, 'model.onnx')
+    int8_path = os.path.join(out_dir, 'model_int8.onnx')
+
+    st = SentenceTransformer(model_name, device='cpu')
+    transformer, pooling = st[0], st[1]
+    pooling_mode = pooling.get_pooling_mode_str()
+    if pooling_mode not in ('mean', 'cls'):
+        raise ValueError(f"{model_name} uses {pooling_mode} pooling; only mean and cls are exported")
+
+    print(f"Exporting {model_name} to {model_path}...")
+    tokenizer = transformer.tokenizer
+    sample = tokenizer(["An example sentence to trace the model with."], return_tensors='pt')
+    input_names = [name for name in MODEL_INPUTS if name in sample]
+    axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names + ['last_hidden_state']}
+    options = {}
+    if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+        # The TorchScript exporter, whose dynamic_axes every onnxruntime release understands
+        options['dynamo'] = False
+    with torch.no_grad():
+        torch.onnx.export(transformer.auto_model.eval(), tuple(sample[name] for name in input_names), model_path,
+                          input_names=input_names, output_names=['last_hidden_state'], dynamic_axes=axes,
+                          opset_version=14, do_constant_folding=True, **options)
+    tokenizer.save_pretrained(out_dir)
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        print(f"Quantizing to {int8_path}...")
+        quantize_dynamic(model_path, int8_path, weight_type=QuantType.QInt8)
+
+    config = {
+        'model_name': model_name,
+        'pooling': pooling_mode,
+        'max_seq_length': st.max_seq_length,
+        'dimension': st.get_sentence_embedding_dimension(),
+        'pad_token': tokenizer.pad_token,
+        'pad_id': tokenizer.pad_token_id,
+        'int8': os.path.exists(int8_path),
+    }
+    with open(os.path.join(out_dir, 'encoder.json.tmp'), 'w') as f:
+        json.dump(config, f, indent=1)
+    os.replace(os.path.join(out_dir, 'encoder.json.tmp'), os.path.join(out_dir, 'encoder.json'))
+    return config
+
+
+class OnnxEncoder:
+    def __init__(self, model_name='all-MiniLM-L6-v2', quantize=False, cache_dir=None, num_threads=None):
+        """
+        A sentence_transformers model run through onnxruntime on the CPU, exported on
+        first use. Pools and normalizes like the original, so its embeddings can go in
+        the same store as the torch backend's (int8 ones are close, not identical).
+
+        Args:
+            model_name: sentence_transformers model
+            quantize: Use the int8 dynamically quantized weights
+            cache_dir: Where exports are kept
+            num_threads: onnxruntime intra-op threads (default: one per core)
+        """
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.model_name = model_name
+        self.quantize = quantize
+        directory = export_dir(model_name, cache_dir)
+        config_path = os.path.join(directory, 'encoder.json')
+        config = None
+        if os.path.exists(config_path):
+            with open(config_path) as f:
+                config = json.load(f)
+        if config is None or (quantize and not config['int8']):
+            config = export_onnx(model_name, directory, quantize=quantize)
+        self.pooling = config['pooling']
+        self.dimension = config['dimension']
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(directory, 'tokenizer.json'))
+        self.tokenizer.enable_truncation(max_length=config['max_seq_length'])
+        self.tokenizer.enable_padding(pad_id=config['pad_id'], pad_token=config['pad_token'])
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        model_file = 'model_int8.onnx' if quantize else 'model.onnx'
+        self.session = ort.InferenceSession(os.path.join(directory, model_file), options,
+                                            providers=['CPUExecutionProvider'])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+    def _embed_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {
+            'input_ids': np.array([e.ids for e in encodings], dtype=np.int64),
+            'attention_mask': mask,
+            'token_type_ids': np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        hidden = self.session.run(['last_hidden_state'], {name: feeds[name] for name in self.input_names})[0]
+        if self.pooling == 'cls':
+            return hidden[:, 0]
+        weights = mask[:, :, None].astype(np.float32)
+        return (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+
+    def encode(self, sentences, batch_size=32, show_progress_bar=False, convert_to_numpy=True,
+               normalize_embeddings=False):
+        """
+        Embed one text or a list of them, like SentenceTransformer.encode.
+
+        Args:
+            sentences: A string or list of strings
+            batch_size: Texts per onnxruntime call
+            show_progress_bar: Accepted for compatibility; no bar is shown
+            convert_to_numpy: Accepted for compatibility; the result is always a numpy array
+            normalize_embeddings: Scale each embedding to unit length
+
+        Returns:
+            float32 array of shape (dimension,) for a string, (len(sentences), dimension) for a list
+        """
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        embeddings = np.empty((len(texts), self.dimension), dtype=np.float32)
+        # Longest first, as sentence_transformers does, so each batch pads to similar lengths
+        order = np.argsort([-len(text) for text in texts], kind='stable')
+        for start in range(0, len(texts), batch_size):
+            rows = order[start:start + batch_size]
+            embeddings[rows] = self._embed_batch([texts[i] for i in rows])
+        if normalize_embeddings:
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings[0] if single else embeddings
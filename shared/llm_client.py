@@ -0,0 +1,237 @@
+import json
+import os
+import random
+import statistics
+import threading
+import time
+
+from openai import OpenAI, DefaultHttpxClient, APIConnectionError, APITimeoutError, RateLimitError, InternalServerError
+
+from percentiles import percentile
+
+try:
+    # Private to the SDK, but its type is the Limits class of whichever httpx build the SDK ships on
+    from openai._constants import DEFAULT_CONNECTION_LIMITS
+except ImportError:
+    DEFAULT_CONNECTION_LIMITS = None
+
+# Drop-in for OpenAI(...) that times every call and accounts for its tokens, retries and cost.
+# The call sites keep using client.chat.completions.create(...) / client.embeddings.create(...)
+# and may pass call_site="..." to name themselves in the logs and summary.
+
+# USD per 1M tokens: (input, cached input, output). Override with LLMClient(prices=...).
+PRICES = {
+    'gpt-4o-mini': (0.15, 0.075, 0.60),
+    'gpt-4o': (2.50, 1.25, 10.00),
+    'gpt-5-mini': (0.25, 0.025, 2.00),
+    'gpt-3.5-turbo': (0.50, 0.50, 1.50),
+    'text-embedding-3-small': (0.02, 0.02, 0.0),
+    'text-embedding-3-large': (0.13, 0.13, 0.0),
+}
+
+RETRYABLE_ERRORS = (APIConnectionError, APITimeoutError, RateLimitError, InternalServerError)
+
+
+def call_cost(model, prompt_tokens, cached_tokens, completion_tokens, prices=PRICES):
+    """Cost of one call in USD, or None for a model without a price."""
+    price = prices.get(model)
+    if price is None:
+        # Dated snapshots ('gpt-4o-mini-2024-07-18') bill like their base model
+        price = next((p for name, p in prices.items() if model and model.startswith(f"{name}-")), None)
+    if price is None:
+        return None
+    input_price, cached_price, output_price = price
+    return ((prompt_tokens - cached_tokens) * input_price + cached_tokens * cached_price
+            + completion_tokens * output_price) / 1_000_000
+
+
+def _usage_counts(usage):
+    """(prompt, cached, completion) tokens from a chat or embeddings usage object."""
+    if usage is None:
+        return 0, 0, 0
+    details = getattr(usage, 'prompt_tokens_details', None)
+    return (getattr(usage, 'prompt_tokens', 0) or 0,
+            getattr(details, 'cached_tokens', 0) or 0,
+            getattr(usage, 'completion_tokens', 0) or 0)
+
+
+class _Completions:
+    def __init__(self, llm):
+        self._llm = llm
+
+    def create(self, call_site=None, **kwargs):
+        if kwargs.get('stream'):
+            return self._llm._stream('chat', call_site, kwargs)
+        return self._llm._call('chat', call_site, self._llm.client.chat.completions.create, kwargs)
+
+
+class _Chat:
+    def __init__(self, llm):
+        self.completions = _Completions(llm)
+
+
+class _Embeddings:
+    def __init__(self, llm):
+        self._llm = llm
+
+    def create(self, call_site=None, **kwargs):
+        return self._llm._call('embeddings', call_site, self._llm.client.embeddings.create, kwargs)
+
+
+class LLMClient:
+    def __init__(self, api_key=None, base_url=None, max_retries=2, backoff=1.0, timeout=60.0,
+                 max_connections=32, log_path=None, prices=None, client=None):
+        """
+        OpenAI client that records latency, tokens (incl. cached), retries and cost per call.
+
+        Args:
+            api_key: OpenAI API key (if None, uses OPENAI_API_KEY env var)
+            base_url: Alternate OpenAI-compatible endpoint, e.g. the local stub server
+            max_retries: Extra attempts after a rate limit, timeout, connection or 5xx error
+            backoff: Base seconds for exponential backoff between attempts (with jitter)
+            timeout: Seconds before a request times out
+            max_connections: Size of the pooled, keep-alive HTTP connection pool
+            log_path: JSONL file every call is appended to (default: $LLM_CALL_LOG, if set)
+            prices: Per-model (input, cached input, output) USD per 1M tokens
+            client: An already built OpenAI-compatible client to wrap instead (e.g. a replay client)
+        """
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.prices = prices or PRICES
+        self.log_path = log_path or os.environ.get('LLM_CALL_LOG')
+        if client is None:
+            if DEFAULT_CONNECTION_LIMITS is not None:
+                limits = type(DEFAULT_CONNECTION_LIMITS)(max_connections=max_connections,
+                                                         max_keepalive_connections=max_connections)
+                http_client = DefaultHttpxClient(limits=limits, timeout=timeout)
+            else:
+                # An SDK without it: keep its default pool size
+                http_client = DefaultHttpxClient(timeout=timeout)
+            # Retries happen here so they can be counted
+            client = OpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
+        self.client = client
+        self.chat = _Chat(self)
+        self.embeddings = _Embeddings(self)
+        self.records = []
+        self.lock = threading.Lock()
+
+    def _create(self, kind, call_site, create, kwargs, start):
+        """Make the request, retrying transient errors. Returns (response, retries); failures are recorded."""
+        retries = 0
+        while True:
+            try:
+                return create(**kwargs), retries
+            except RETRYABLE_ERRORS as e:
+                if retries == self.max_retries:
+                    self._record(kind, call_site, kwargs.get('model'), start, None, retries, error=e)
+                    raise
+                time.sleep(self.backoff * (2 ** retries) + random.uniform(0, self.backoff))
+                retries += 1
+            except Exception as e:
+                self._record(kind, call_site, kwargs.get('model'), start, None, retries, error=e)
+                raise
+
+    def _call(self, kind, call_site, create, kwargs):
+        start = time.perf_counter()
+        response, retries = self._create(kind, call_site, create, kwargs, start)
+        self._record(kind, call_site, getattr(response, 'model', None) or kwargs.get('model'), start,
+                     getattr(response, 'usage', None), retries)
+        return response
+
+    def _stream(self, kind, call_site, kwargs):
+        """Pass the chunks through, recording time to first chunk and the usage from the last one."""
+        kwargs.setdefault('stream_options', {'include_usage': True})
+        start = time.perf_counter()
+        stream, retries = self._create(kind, call_site, self.client.chat.completions.create, kwargs, start)
+
+        def chunks():
+            first = None
+            usage = None
+            model = kwargs.get('model')
+            try:
+                for chunk in stream:
+                    if first is None:
+                        first = time.perf_counter()
+                    usage = getattr(chunk, 'usage', None) or usage
+                    model = getattr(chunk, 'model', None) or model
+                    yield chunk
+            finally:
+                ttft_ms = (first - start) * 1000 if first is not None else None
+                self._record(kind, call_site, model, start, usage, retries, ttft_ms=ttft_ms)
+        return chunks()
+
+    def _record(self, kind, call_site, model, start, usage, retries, error=None, ttft_ms=None):
+        prompt_tokens, cached_tokens, completion_tokens = _usage_counts(usage)
+        record = {
+            'ts': round(time.time(), 3),
+            'call_site': call_site or kind,
+            'kind': kind,
+            'model': model,
+            'latency_ms': round((time.perf_counter() - start) * 1000, 1),
+            'prompt_tokens': prompt_tokens,
+            'cached_tokens': cached_tokens,
+            'completion_tokens': completion_tokens,
+            'retries': retries,
+            'cost_usd': None if error else call_cost(model, prompt_tokens, cached_tokens, completion_tokens,
+                                                     self.prices),
+            'error': f"{type(error).__name__}: {error}" if error else None,
+        }
+        if ttft_ms is not None:
+            record['ttft_ms'] = round(ttft_ms, 1)
+        with self.lock:
+            self.records.append(record)
+            if self.log_path:
+                with open(self.log_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record) + "\n")
+
+    def summary(self):
+        """
+        Totals per (call site, model).
+
+        Returns:
+            List of dicts: call_site, model, calls, errors, retries, wall_s, p50_ms, p95_ms,
+            prompt_tokens, cached_tokens, completion_tokens, cost_usd
+        """
+        with self.lock:
+            records = list(self.records)
+        groups = {}
+        for record in records:
+            groups.setdefault((record['call_site'], record['model']), []).append(record)
+
+        rows = []
+        for (call_site, model), group in groups.items():
+            latencies = sorted(r['latency_ms'] for r in group)
+            costs = [r['cost_usd'] for r in group if r['cost_usd'] is not None]
+            rows.append({
+                'call_site': call_site,
+                'model': model,
+                'calls': len(group),
+                'errors': sum(1 for r in group if r['error']),
+                'retries': sum(r['retries'] for r in group),
+                'wall_s': sum(latencies) / 1000,
+                'p50_ms': statistics.median(latencies),
+                'p95_ms': percentile(latencies, 0.95),
+                'prompt_tokens': sum(r['prompt_tokens'] for r in group),
+                'cached_tokens': sum(r['cached_tokens'] for r in group),
+                'completion_tokens': sum(r['completion_tokens'] for r in group),
+                'cost_usd': sum(costs) if costs else None,
+            })
+        return sorted(rows, key=lambda row: -row['wall_s'])
+
+    def report(self):
+        """The summary as a table, most time-consuming call site first."""
+        rows = self.summary()
+        if not rows:
+            return "No LLM calls"
+        lines = [f"{'call site':<28}{'model':<24}{'calls':>6}{'err':>5}{'retry':>6}{'time s':>8}"
+                 f"{'p50 ms':>8}{'p95 ms':>8}{'prompt':>9}{'cached':>8}{'output':>8}{'cost $':>9}"]
+        for row in rows:
+            cost = f"{row['cost_usd']:.4f}" if row['cost_usd'] is not None else "?"
+            lines.append(f"{row['call_site'][:27]:<28}{(row['model'] or '?')[:23]:<24}{row['calls']:>6}"
+                         f"{row['errors']:>5}{row['retries']:>6}{row['wall_s']:>8.1f}{row['p50_ms']:>8.0f}"
+                         f"{row['p95_ms']:>8.0f}{row['prompt_tokens']:>9}{row['cached_tokens']:>8}"
+                         f"{row['completion_tokens']:>8}{cost:>9}")
+        total = sum(row['cost_usd'] or 0 for row in rows)
+        lines.append(f"Total: {sum(row['calls'] for row in rows)} calls, "
+                     f"{sum(row['wall_s'] for row in rows):.1f}s in calls, ${total:.4f}")
+        return "\n".join(lines)
@@ -0,0 +1,14 @@
+import math
+
+
+def percentile(sorted_values, fraction):
+    """
+    Nearest-rank percentile of an already sorted list: the smallest value with at least
+    fraction of the values at or below it (percentile(xs, 0.95) is the p95).
+
+    Returns:
+        The value, or None for an empty list
+    """
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))]
@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+# Record real OpenAI request/response pairs into a JSONL fixture file, then replay them
+# offline through the stub server (stub_server.py --fixtures calls.jsonl).
+#
+#   from llm_client import LLMClient
+#   from replay import RecordingClient
+#   client = LLMClient(client=RecordingClient(OpenAI(api_key=key), "fixtures/grader.jsonl"))
+#
+# A request is identified by everything that shapes the reply (model, messages or input,
+# sampling settings, response format), so a replayed run gets the reply the recorded run got.
+
+# Request fields that don't change the reply
+IGNORED_FIELDS = {'stream', 'stream_options', 'encoding_format', 'user', 'timeout', 'extra_headers', 'extra_query',
+                  'extra_body'}
+
+
+def request_key(kind, request):
+    """
+    Stable id for a request.
+
+    Args:
+        kind: 'chat' or 'embeddings'
+        request: The request body (or create() kwargs)
+
+    Returns:
+        str: Hex digest
+    """
+    body = {k: v for k, v in request.items() if k not in IGNORED_FIELDS}
+    canonical = json.dumps([kind, body], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:24]
+
+
+def load_fixtures(fixture_path):
+    """
+    Read a fixture file.
+
+    Returns:
+        Dict of request key -> list of recorded entries ({'kind', 'request', 'response', 'latency_ms'}),
+        in recording order (a request made several times replays its replies in turn)
+    """
+    fixtures = {}
+    with open(fixture_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # Torn last line from an interrupted recording
+                continue
+            fixtures.setdefault(entry['key'], []).append(entry)
+    return fixtures
+
+
+class FixtureSet:
+    def __init__(self, fixture_path):
+        """
+        Recorded replies looked up by request. A request recorded n times replays
+        its n replies in order, then keeps returning the last one.
+        """
+        self.fixture_path = fixture_path
+        self.fixtures = load_fixtures(fixture_path)
+        self.served = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return sum(len(entries) for entries in self.fixtures.values())
+
+    def lookup(self, kind, request):
+        """The recorded entry for this request, or None."""
+        key = request_key(kind, request)
+        entries = self.fixtures.get(key)
+        if not entries:
+            return None
+        with self.lock:
+            n = self.served.get(key, 0)
+            self.served[key] = n + 1
+        return entries[min(n, len(entries) - 1)]
+
+
+class _RecordingCompletions:
+    def __init__(self, recorder):
+        self._recorder = recorder
+
+    def create(self, **kwargs):
+        return self._recorder._record('chat', self._recorder.client.chat.completions.create, kwargs)
+
+
+class _RecordingChat:
+    def __init__(self, recorder):
+        self.completions = _RecordingCompletions(recorder)
+
+
+class _RecordingEmbeddings:
+    def __init__(self, recorder):
+        self._recorder = recorder
+
+    def create(self, **kwargs):
+        return self._recorder._record('embeddings', self._recorder.client.embeddings.create, kwargs)
+
+
+class RecordingClient:
+    def __init__(self, client, fixture_path):
+        """
+        Wraps a real OpenAI client and appends every request/response pair to a JSONL fixture file.
+
+        Streaming requests are recorded as a plain completion (the stub server streams it back
+        when replaying), so recording always makes a non-streaming call.
+
+        Args:
+            client: An OpenAI client
+            fixture_path: JSONL file to append to (created if missing)
+        """
+        self.client = client
+        self.fixture_path = fixture_path
+        self.chat = _RecordingChat(self)
+        self.embeddings = _RecordingEmbeddings(self)
+        self.lock = threading.Lock()
+        directory = os.path.dirname(fixture_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _record(self, kind, create, kwargs):
+        streamed = kwargs.get('stream')
+        request = {k: v for k, v in kwargs.items() if k not in ('stream', 'stream_options')}
+        start = time.perf_counter()
+        response = create(**request)
+        latency_ms = (time.perf_counter() - start) * 1000
+        entry = {
+            'key': request_key(kind, request),
+            'kind': kind,
+            'request': request,
+            'response': response.model_dump(mode='json'),
+            'latency_ms': round(latency_ms, 1),
+        }
+        with self.lock:
+            with open(self.fixture_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+        if streamed:
+            return _as_stream(response)
+        return response
+
+
+def _as_stream(completion):
+    """Yield a recorded completion as chunks, for callers that asked to stream."""
+    from openai.types.chat import ChatCompletionChunk
+    for chunk in completion_chunks(completion.model_dump(mode='json')):
+        yield ChatCompletionChunk.model_validate(chunk)
+
+
+def completion_chunks(completion, chunk_chars=16, include_usage=True):
+    """
+    Split a chat completion dict into the chunk dicts a streaming response would send.
+
+    Args:
+        completion: A chat.completion body
+        chunk_chars: Characters of content per chunk
+        include_usage: End with a usage-only chunk (stream_options={'include_usage': True})
+
+    Returns:
+        List of chat.completion.chunk dicts
+    """
+    base = {'id': completion.get('id'), 'object': 'chat.completion.chunk',
+            'created': completion.get('created'), 'model': completion.get('model')}
+    chunks = []
+    for choice in completion.get('choices', []):
+        content = (choice.get('message') or {}).get('content') or ''
+        index = choice.get('index', 0)
+        chunks.append(dict(base, choices=[{'index': index, 'delta': {'role': 'assistant', 'content': ''},
+                                           'finish_reason': None}]))
+        for start in range(0, len(content), chunk_chars):
+            chunks.append(dict(base, choices=[{'index': index, 'delta': {'content': content[start:start + chunk_chars]},
+                                               'finish_reason': None}]))
+        chunks.append(dict(base, choices=[{'index': index, 'delta': {},
+                                           'finish_reason': choice.get('finish_reason') or 'stop'}]))
+    if include_usage and completion.get('usage'):
+        chunks.append(dict(base, choices=[], usage=completion['usage']))
+    return chunks
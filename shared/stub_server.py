@@ -0,0 +1,317 @@
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from replay import FixtureSet, completion_chunks
+
+# A tiny OpenAI-compatible chat and embeddings server for exercising the LLM pipelines offline.
+# Point a client at it with OpenAI(api_key="stub", base_url="http://127.0.0.1:8765/v1").
+# With --fixtures it replays replies recorded by replay.RecordingClient instead of making them up.
+
+
+def default_reply(messages, response_format=None):
+    """
+    Pick a plausible reply for the prompts used in this repo so callers
+    exercise their real parsing code.
+    """
+    prompt = messages[-1]['content'] if messages else ""
+
+    # Citation locator: answer with the first file in the numbered list
+    if "Available files:" in prompt:
+        match = re.search(r"^\s*\d+\.\s+(\S.*)$", prompt.split("Available files:", 1)[1], re.MULTILINE)
+        return match.group(1).strip() if match else "NOT_FOUND"
+
+    # Answer splitter: put each answer in its first part, which is valid and keeps the text unchanged
+    if "You are splitting student answers" in prompt and "Student responses:" in prompt:
+        try:
+            students = json.loads(prompt.split("Student responses:", 1)[1])
+        except json.JSONDecodeError:
+            students = []
+        return json.dumps({'Students': [
+            dict({'Student': row.get('Student')},
+                 **{key: {'Risk/mitigation 1': answer or "", 'AI usage': ""}
+                    for key, answer in row.items() if key != 'Student'})
+            for row in students
+        ]})
+
+    # Grader: one line per RESPONSE #n
+    responses = re.findall(r"RESPONSE #(\d+):", prompt.split("Return your grades", 1)[0])
+    if responses and response_format:
+        return json.dumps({'grades': [
+            {'id': int(n), 'points': 5, 'justification': "Full points, stub grade"} for n in responses
+        ]})
+    if responses:
+        return "\n".join(f"RESPONSE #{n}: 5|Full points, stub grade" for n in responses)
+
+    return "SELECT 1"
+
+
+# Prompt caching works like OpenAI's: prompts of 1024+ tokens are cached in
+# 128-token steps, and a later prompt with the same prefix reuses them.
+CHARS_PER_TOKEN = 4
+CACHE_MIN_TOKENS = 1024
+CACHE_STEP_TOKENS = 128
+
+
+def stub_embedding(text, dimensions=1536):
+    """A unit vector that only depends on the text, so the same input always embeds the same."""
+    rng = random.Random(hashlib.sha256(str(text).encode('utf-8')).digest())
+    vector = [rng.gauss(0, 1) for _ in range(dimensions)]
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+LATENCY_DISTRIBUTIONS = ('normal', 'lognormal', 'exponential', 'fixed', 'recorded')
+
+
+class StubState:
+    def __init__(self, latency_ms=200.0, jitter_ms=50.0, fail_rate=0.0, reply=None, prefill_ms_per_1k=0.0,
+                 latency_dist='normal', ms_per_output_token=0.0, fixtures=None, strict=False, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.fail_rate = fail_rate
+        self.reply = reply
+        # Extra latency per 1k prompt tokens that were not served from the prefix cache
+        self.prefill_ms_per_1k = prefill_ms_per_1k
+        # normal: mean latency_ms, sd jitter_ms; lognormal: median latency_ms, sigma jitter_ms/latency_ms
+        # (a long right tail); exponential: mean latency_ms; recorded: the fixture's own latency
+        if latency_dist not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"latency_dist must be one of {', '.join(LATENCY_DISTRIBUTIONS)}")
+        self.latency_dist = latency_dist
+        # Generation time; streamed replies trickle out at this rate
+        self.ms_per_output_token = ms_per_output_token
+        self.fixtures = FixtureSet(fixtures) if fixtures else None
+        # With fixtures, answer requests that weren't recorded with a 404 instead of a made-up reply
+        self.strict = strict
+        self.random = random.Random(seed)
+        self.prefix_cache = set()
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.failures = 0
+        self.replayed = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def sample_latency_ms(self, recorded_ms=None):
+        with self.lock:
+            if self.latency_dist == 'recorded' and recorded_ms is not None:
+                return recorded_ms
+            if self.latency_dist == 'fixed':
+                return self.latency_ms
+            if self.latency_dist == 'exponential':
+                return self.random.expovariate(1 / self.latency_ms) if self.latency_ms > 0 else 0.0
+            if self.latency_dist == 'lognormal' and self.latency_ms > 0:
+                return self.random.lognormvariate(math.log(self.latency_ms), self.jitter_ms / self.latency_ms)
+            return max(0.0, self.random.gauss(self.latency_ms, self.jitter_ms))
+
+    def should_fail(self):
+        with self.lock:
+            return self.random.random() < self.fail_rate
+
+    def cached_tokens(self, prompt_text):
+        """Look up the longest cached prefix of this prompt, then cache its own prefixes."""
+        step = CACHE_STEP_TOKENS * CHARS_PER_TOKEN
+        start = CACHE_MIN_TOKENS * CHARS_PER_TOKEN
+        boundaries = range(start, len(prompt_text) + 1, step)
+        prefixes = [hash(prompt_text[:end]) for end in boundaries]
+        with self.lock:
+            cached_chars = 0
+            for end, prefix in zip(boundaries, prefixes):
+                if prefix not in self.prefix_cache:
+                    break
+                cached_chars = end
+            if len(self.prefix_cache) > 1_000_000:
+                self.prefix_cache.clear()
+            self.prefix_cache.update(prefixes)
+        return cached_chars // CHARS_PER_TOKEN
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    state = None  # set by make_server
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_stream(self, completion, include_usage, ms_per_chunk):
+        """Send a completion as server-sent events, one content chunk at a time."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        for chunk in completion_chunks(completion, include_usage=include_usage):
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+            if ms_per_chunk and chunk['choices'] and chunk['choices'][0]['delta'].get('content'):
+                time.sleep(ms_per_chunk / 1000)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+    def do_GET(self):
+        if self.path.rstrip('/') == "/stats":
+            with self.state.lock:
+                self._send_json(200, {
+                    'requests': self.state.requests,
+                    'failures': self.state.failures,
+                    'replayed': self.state.replayed,
+                    'max_in_flight': self.state.max_in_flight,
+                })
+        else:
+            self._send_json(404, {'error': {'message': 'not found'}})
+
+    def _chat_reply(self, body, prompt_tokens, cached_tokens):
+        state = self.state
+        messages = body.get('messages', [])
+        content = state.reply if state.reply is not None else default_reply(messages, body.get('response_format'))
+        completion_tokens = len(content) // CHARS_PER_TOKEN
+        return {
+            'id': f"chatcmpl-stub-{state.requests}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model', 'stub'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop',
+            }],
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens,
+                'prompt_tokens_details': {'cached_tokens': cached_tokens},
+            },
+        }
+
+    def _embeddings_reply(self, body):
+        inputs = body.get('input', [])
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        dimensions = body.get('dimensions') or 1536
+        tokens = sum(len(str(text)) // CHARS_PER_TOKEN for text in inputs)
+        return {
+            'object': 'list',
+            'data': [{'object': 'embedding', 'index': i, 'embedding': stub_embedding(text, dimensions)}
+                     for i, text in enumerate(inputs)],
+            'model': body.get('model', 'stub'),
+            'usage': {'prompt_tokens': tokens, 'total_tokens': tokens},
+        }
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        state = self.state
+
+        with state.lock:
+            state.requests += 1
+            state.in_flight += 1
+            state.max_in_flight = max(state.max_in_flight, state.in_flight)
+        try:
+            if self.path.endswith("/chat/completions"):
+                kind = 'chat'
+            elif self.path.endswith("/embeddings"):
+                kind = 'embeddings'
+            else:
+                self._send_json(404, {'error': {'message': f'{self.path} is not stubbed'}})
+                return
+
+            recorded = state.fixtures.lookup(kind, body) if state.fixtures is not None else None
+            if state.fixtures is not None and recorded is None and state.strict:
+                self._send_json(404, {'error': {'message': 'No fixture recorded for this request'}})
+                return
+
+            messages = body.get('messages', [])
+            prompt_text = "".join(f"<{m.get('role')}>{m.get('content') or ''}" for m in messages)
+            prompt_tokens = len(prompt_text) // CHARS_PER_TOKEN
+            cached_tokens = state.cached_tokens(prompt_text) if kind == 'chat' else 0
+
+            delay = state.sample_latency_ms(recorded['latency_ms'] if recorded else None)
+            if recorded is None or state.latency_dist != 'recorded':
+                delay += (prompt_tokens - cached_tokens) / 1000 * state.prefill_ms_per_1k
+            stream = kind == 'chat' and body.get('stream')
+            time.sleep(delay / 1000)
+
+            if state.should_fail():
+                with state.lock:
+                    state.failures += 1
+                self._send_json(429, {'error': {'message': 'Rate limit reached (stub)', 'type': 'rate_limit_error'}})
+                return
+
+            if recorded is not None:
+                with state.lock:
+                    state.replayed += 1
+                reply = recorded['response']
+            elif kind == 'chat':
+                reply = self._chat_reply(body, prompt_tokens, cached_tokens)
+            else:
+                reply = self._embeddings_reply(body)
+
+            completion_tokens = (reply.get('usage') or {}).get('completion_tokens') or 0
+            generation_ms = completion_tokens * state.ms_per_output_token
+            if stream:
+                include_usage = bool((body.get('stream_options') or {}).get('include_usage'))
+                chunks = max(1, sum(math.ceil(len((c.get('message') or {}).get('content') or '') / 16)
+                                    for c in reply.get('choices', [])))
+                self._send_stream(reply, include_usage, generation_ms / chunks)
+            else:
+                time.sleep(generation_ms / 1000)
+                self._send_json(200, reply)
+        finally:
+            with state.lock:
+                state.in_flight -= 1
+
+
+def make_server(host="127.0.0.1", port=8765, **state_kwargs):
+    """Build (but don't start) a stub server. Use port=0 to pick a free port."""
+    handler = type("BoundStubHandler", (StubHandler,), {'state': StubState(**state_kwargs)})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def start_in_thread(**kwargs):
+    """Start a stub server on a background thread. Returns (server, base_url)."""
+    server = make_server(**kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address
+    return server, f"http://{host}:{port}/v1"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stub chat and embeddings server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="Mean (median for lognormal) latency")
+    parser.add_argument("--jitter-ms", type=float, default=50.0, help="Spread of the latency")
+    parser.add_argument("--latency-dist", choices=LATENCY_DISTRIBUTIONS, default='normal',
+                        help="Latency distribution ('recorded' replays each fixture's own latency)")
+    parser.add_argument("--ms-per-output-token", type=float, default=0.0,
+                        help="Generation time per completion token (streamed replies trickle out)")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--reply", default=None, help="Fixed reply text instead of the prompt-aware default")
+    parser.add_argument("--prefill-ms-per-1k", type=float, default=0.0,
+                        help="Extra latency per 1k uncached prompt tokens")
+    parser.add_argument("--fixtures", default=None, help="JSONL recorded by replay.RecordingClient to replay")
+    parser.add_argument("--strict", action="store_true", help="404 for requests missing from the fixtures")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for latency and failure sampling")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                         fail_rate=args.fail_rate, reply=args.reply, prefill_ms_per_1k=args.prefill_ms_per_1k,
+                         latency_dist=args.latency_dist, ms_per_output_token=args.ms_per_output_token,
+                         fixtures=args.fixtures, strict=args.strict, seed=args.seed)
+    print(f"Stub OpenAI server on http://{args.host}:{args.port}/v1 (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass